@@ -9,11 +9,20 @@ import tomllib
 import toml
 from pathlib import Path
 
+# peer_ttl muss mindestens so viele Heartbeat-Intervalle umfassen: Heartbeats kommen mit
+# bis zu 10 % Jitter, und ein einzelnes verlorenes ALIVE (UDP) darf keinen Peer entfernen
+PEER_TTL_MIN_BEATS = 3
+
 class Config:
     """
     @file config.py
     @brief Lädt und speichert die TOML-Konfiguration für den Chat-Client.
-    @details Legt Attribute an: `handle`, `port_range`, `whoisport`, `autoreply`, `imagepath`, `handle_colors`.
+    @details Legt Attribute an: `handle`, `port_range`, `whoisport`, `autoreply`, `imagepath`, `handle_colors`,
+             `engine`, `max_connections`, `img_reliable`, `img_bandwidth`, `udp_rcvbuf`,
+             `img_tcp_threshold`, `peer_queue_depth`, `msg_ack`, `msg_coalesce_ms`, `heartbeat_interval`,
+             `peer_ttl`, `discovery_transport`, `multicast_group`, `multicast_ttl`,
+             `multicast_interface`, `discovery_mode`, `gossip_interval`, `gossip_fanout`,
+             `whois_ttl`, `whois_negative_ttl`.
     """
 
     def __init__(self, path: str):
@@ -49,6 +58,28 @@ class Config:
             # Fehlende Felder melden
             raise KeyError(f"Fehlendes Config-Feld: {e}")
 
+        # Discovery-Transport auf whoisport: "broadcast" (255.255.255.255) oder "multicast"
+        self.discovery_transport = data.get('discovery_transport', 'broadcast')
+        if self.discovery_transport not in ('broadcast', 'multicast'):
+            raise ValueError(f"Unbekannter Discovery-Transport: {self.discovery_transport}")
+        # Multicast-Gruppe; eine IPv6-Gruppe (z. B. "ff15::4299") schaltet auf IPv6 um
+        self.multicast_group = data.get('multicast_group', '239.255.42.99')
+        # Maximale Anzahl Router-Hops der Discovery-Pakete (1 = nur lokales Segment)
+        self.multicast_ttl = int(data.get('multicast_ttl', 1))
+        # Schnittstelle: IPv4-Adresse bzw. IPv6-Schnittstellenname/-index (leer = Standard)
+        self.multicast_interface = data.get('multicast_interface', '')
+        # Mitgliedschaft: "flood" (Listen-Abgleich, Heartbeats) oder "gossip" (SWIM-Probes)
+        self.discovery_mode = data.get('discovery_mode', 'flood')
+        if self.discovery_mode not in ('flood', 'gossip'):
+            raise ValueError(f"Unbekannter Discovery-Modus: {self.discovery_mode}")
+        # Dauer einer Gossip-Proberunde in Sekunden
+        self.gossip_interval = float(data.get('gossip_interval', 1.0))
+        # Anzahl der Mitglieder, die ein nicht antwortendes Mitglied indirekt prüfen
+        self.gossip_fanout = int(data.get('gossip_fanout', 3))
+        # Gültigkeit gezielter WHOIS-Ergebnisse in Sekunden (gefunden / nicht gefunden)
+        self.whois_ttl = float(data.get('whois_ttl', 60))
+        self.whois_negative_ttl = float(data.get('whois_negative_ttl', 10))
+
         # Optional: Autoreply-Text laden, Standard leer
         self.autoreply = data.get('autoreply', '')
         # Bildverzeichnis aus Config oder Standard 'images'
@@ -61,6 +92,39 @@ class Config:
         # Beispiel in alice.toml: [colors] Alice="RED"
         self.handle_colors: dict[str, str] = data.get('colors', {})
 
+        # Netzwerkdienst: "threads" (Thread pro Verbindung) oder "selectors" (Event-Loop)
+        self.engine = data.get('engine', 'threads')
+        if self.engine not in ('threads', 'selectors'):
+            raise ValueError(f"Unbekannte Engine: {self.engine}")
+        # Obergrenze gleichzeitiger eingehender TCP-Verbindungen
+        self.max_connections = int(data.get('max_connections', 256))
+        # Bilder per UDP mit ACK/NACK und selektiver Wiederholung übertragen
+        self.img_reliable = bool(data.get('img_reliable', True))
+        # Maximale Senderate für Bilder in Mbit/s (0 = unbegrenzt)
+        self.img_bandwidth = float(data.get('img_bandwidth', 100))
+        # Empfangspuffer (SO_RCVBUF) des UDP-Bildsockets in Bytes (0 = Systemstandard)
+        self.udp_rcvbuf = int(data.get('udp_rcvbuf', 4 * 1024 * 1024))
+        # Bilder ab dieser Größe in Bytes per TCP/sendfile statt UDP senden (0 = nie)
+        self.img_tcp_threshold = int(data.get('img_tcp_threshold', 1024 * 1024))
+        # Maximale Anzahl wartender Sendeaufträge pro Peer
+        self.peer_queue_depth = int(data.get('peer_queue_depth', 100))
+        # Zustellbestätigungen (ACK) für Direktnachrichten anfordern. Standardmäßig aus:
+        # Empfänger vor Einführung der ACKs lesen nur eine Zeile pro Verbindung und
+        # verwerfen die Nachricht hinter einer vorangestellten ID-Zeile.
+        self.msg_ack = bool(data.get('msg_ack', False))
+        # Sammelfenster in ms, in dem Nachrichten an denselben Peer zu einem Frame
+        # zusammengefasst werden (0 = jede Nachricht sofort einzeln senden)
+        self.msg_coalesce_ms = float(data.get('msg_coalesce_ms', 2))
+        # Abstand der ALIVE-Heartbeats der Discovery in Sekunden (0 = keine Heartbeats)
+        self.heartbeat_interval = float(data.get('heartbeat_interval', 10))
+        # Sekunden ohne JOIN/ALIVE, nach denen ein Peer als verschwunden gilt (0 = nie);
+        # mindestens PEER_TTL_MIN_BEATS × heartbeat_interval
+        self.peer_ttl = float(data.get('peer_ttl', 35))
+        min_ttl = PEER_TTL_MIN_BEATS * self.heartbeat_interval
+        if self.peer_ttl and self.peer_ttl < min_ttl:
+            raise ValueError(f"peer_ttl ({self.peer_ttl:g}) muss mindestens "
+                             f"{PEER_TTL_MIN_BEATS} × heartbeat_interval = {min_ttl:g} s sein")
+
     def save(self) -> None:
         """
         @brief Speichert aktuelle Config-Attribute zurück in die TOML-Datei.
@@ -70,8 +134,28 @@ class Config:
             'handle':    self.handle,
             'port':      list(self.port_range),
             'whoisport': self.whoisport,
+            'discovery_transport': self.discovery_transport,
+            'multicast_group': self.multicast_group,
+            'multicast_ttl': self.multicast_ttl,
+            'multicast_interface': self.multicast_interface,
+            'discovery_mode': self.discovery_mode,
+            'gossip_interval': self.gossip_interval,
+            'gossip_fanout': self.gossip_fanout,
+            'whois_ttl': self.whois_ttl,
+            'whois_negative_ttl': self.whois_negative_ttl,
             'autoreply': self.autoreply,
             'imagepath': str(self.imagepath),
+            'engine':    self.engine,
+            'max_connections': self.max_connections,
+            'img_reliable': self.img_reliable,
+            'img_bandwidth': self.img_bandwidth,
+            'udp_rcvbuf': self.udp_rcvbuf,
+            'img_tcp_threshold': self.img_tcp_threshold,
+            'peer_queue_depth': self.peer_queue_depth,
+            'msg_ack': self.msg_ack,
+            'msg_coalesce_ms': self.msg_coalesce_ms,
+            'heartbeat_interval': self.heartbeat_interval,
+            'peer_ttl': self.peer_ttl,
             'colors':    self.handle_colors,
         }
         # Dump als TOML-Text
@@ -20,9 +20,12 @@
 # der Benutzeroberfläche über zwei Pipes:
 # - ⁠ pipe_cmd ⁠: Befehle von der UI (join, leave, who)
 # - ⁠ pipe_evt ⁠: Ereignisse an die UI (aktuelle Nutzerliste)
+# Zusätzlich kann ein RegistryFeed übergeben werden, über den der Netzwerkdienst die
+# Registry direkt erhält, ohne den Umweg über den UI-Prozess.
 #
-# @note Das Modul verwendet UDP-Broadcasts für die Peer-Kommunikation und arbeitet
-# plattformübergreifend.
+# @note Das Modul verwendet standardmäßig UDP-Broadcasts für die Peer-Kommunikation und
+# arbeitet plattformübergreifend. Mit `discovery_transport = "multicast"` wird stattdessen
+# eine IPv4- oder IPv6-Multicast-Gruppe verwendet (siehe _open_discovery_socket()).
 #
 # @see run_discovery_service()
 # @author Ismet Algül, Aysenur Algül, Enes Kurutay, Ugur Can, Nasratullah Ahmadzai
@@ -30,74 +33,994 @@
 
 
 
+import heapq
+import math
+import random
 import socket
+import struct
 import threading
-from typing import Dict, Tuple
+import time
+import zlib
+from typing import Dict, List, Tuple
 
 BROADCAST_ADDR = '255.255.255.255'
 BUFFER_SIZE    = 4096
+# Nutzlast eines KNOWNSEG-Segments in Bytes (unterhalb der Ethernet-MTU, keine IP-Fragmente)
+SEGMENT_SIZE   = 1200
+# Sekunden, nach denen eine unvollständige segmentierte Liste verworfen wird
+SEGMENT_TIMEOUT = 5.0
+# Zufällige Verzögerung (Sekunden) vor einer KNOWNUSERS-Antwort, wie bei mDNS
+REPLY_DELAY    = (0.02, 0.12)
+# Sekunden bis eine unbeantwortete WHOIS-Anfrage als negativ gilt (nach der Hälfte Wiederholung)
+WHOIS_TIMEOUT  = 1.0
+# Maximale Anzahl ungesendeter Feed-Nachrichten pro Abonnent, danach Resync per Snapshot
+FEED_BACKLOG   = 256
 
-def _get_local_ip() -> str:
+
+def _entry_hash(h: str, ip: str, port: int) -> int:
+    return zlib.crc32(f"{h} {ip} {port}".encode())
+
+def _format_digest(count: int, xor: int) -> str:
+    return f"{count:x}-{xor:08x}"
+
+def _digest_of(entries: List[Tuple[str, str, int]]) -> str:
+    """
+    @brief Digest einer empfangenen Eintragsliste, vergleichbar mit Registry.digest().
+    """
+    latest = {h: (ip, port) for h, ip, port in entries}
+    xor = 0
+    for h, (ip, port) in latest.items():
+        xor ^= _entry_hash(h, ip, port)
+    return _format_digest(len(latest), xor)
+
+class Registry:
+    """
+    @brief Versionierte Teilnehmer-Registry mit Änderungsprotokoll.
+    @details Verhält sich nach außen wie ein Dict Handle → (ip, port). Änderungen werden
+             gesammelt und mit flush() als Delta (hinzugefügt/entfernt/geändert) abgeholt;
+             jedes nichtleere Delta erhöht die Generation um eins. Ein Empfänger, der jedes
+             Delta in Reihenfolge anwendet, hat damit denselben Stand wie die Registry;
+             stimmt die Generation nicht, fordert er einen vollständigen Snapshot an.
+             Der Aufwand eines flush() wächst mit der Zahl der Änderungen, nicht mit der
+             Größe der Registry. Alle Methoden sind thread-sicher.
+    """
+
+    def __init__(self):
+        self.gen = 0
+        self._peers: Dict[str, Tuple[str, int]] = {}
+        # Handle → Wert vor der ersten Änderung seit dem letzten flush() (None = nicht vorhanden)
+        self._orig: Dict[str, Tuple[str, int]] = {}
+        # XOR der CRC32 aller Einträge: reihenfolgeunabhängig und in O(1) nachführbar
+        self._xor = 0
+        self._lock = threading.Lock()
+
+    def __setitem__(self, h: str, addr: Tuple[str, int]) -> None:
+        with self._lock:
+            old = self._peers.get(h)
+            if old != addr:
+                self._orig.setdefault(h, old)
+                if old is not None:
+                    self._xor ^= _entry_hash(h, *old)
+                self._xor ^= _entry_hash(h, *addr)
+                self._peers[h] = addr
+
+    def pop(self, h: str, default=None):
+        with self._lock:
+            if h not in self._peers:
+                return default
+            self._orig.setdefault(h, self._peers[h])
+            self._xor ^= _entry_hash(h, *self._peers[h])
+            return self._peers.pop(h)
+
+    def digest(self) -> str:
+        """
+        @brief Kurzer Fingerabdruck des Inhalts (Anzahl und Prüfsumme) für `WHO <digest>`.
+        @details Zwei Registries mit gleichem Inhalt haben denselben Digest, unabhängig von
+                 der Reihenfolge, in der die Einträge entstanden sind.
+        """
+        with self._lock:
+            return _format_digest(len(self._peers), self._xor)
+
+    def get(self, h: str, default=None):
+        with self._lock:
+            return self._peers.get(h, default)
+
+    def items(self):
+        """
+        @brief Momentaufnahme aller Einträge als Liste von (handle, (ip, port)).
+        """
+        with self._lock:
+            return list(self._peers.items())
+
+    def snapshot(self) -> Tuple[Dict[str, Tuple[str, int]], int]:
+        """
+        @brief Vollständiger Stand samt Generation (nur zur Resynchronisation).
+        @details Offene Änderungen gehören noch zu keiner Generation; vorher flush() aufrufen.
+        """
+        with self._lock:
+            return dict(self._peers), self.gen
+
+    def flush(self):
+        """
+        @brief Schließt die seit dem letzten Aufruf gesammelten Änderungen ab.
+        @return (gen, added, removed, changed) oder None, wenn sich effektiv nichts geändert hat.
+                added/changed: Dict Handle → (ip, port); removed: Liste von Handles.
+        """
+        with self._lock:
+            added, removed, changed = {}, [], {}
+            for h, old in self._orig.items():
+                new = self._peers.get(h)
+                if old is None and new is not None:
+                    added[h] = new
+                elif new is None and old is not None:
+                    removed.append(h)
+                elif new != old:
+                    changed[h] = new
+            self._orig = {}
+            if not (added or removed or changed):
+                return None
+            self.gen += 1
+            return self.gen, added, removed, changed
+
+def _parse_entries(text: str) -> List[Tuple[str, str, int]]:
+    """
+    @brief Zerlegt eine KNOWNUSERS-Liste `<handle> <ip> <port>,...`.
+    @details Unvollständige oder defekte Einträge werden übersprungen, statt den
+             Listener-Thread zu beenden.
+    @return Liste von (handle, ip, port).
+    """
+    result = []
+    for entry in text.split(','):
+        parts = entry.split()
+        if len(parts) == 3 and parts[2].isdigit():
+            result.append((parts[0], parts[1], int(parts[2])))
+    return result
+
+def _encode_known(entries: List[str]) -> List[bytes]:
+    """
+    @brief Kodiert die Registry als KNOWNUSERS-Antwort.
+    @details Passt die Liste in ein Datagramm der Größe BUFFER_SIZE, wird wie bisher ein
+             einzelnes `KNOWNUSERS <handle ip port,...>` erzeugt. Sonst wird sie in Segmente
+             `KNOWNSEG <transfer> <seq> <total> <handle ip port,...>` von höchstens
+             SEGMENT_SIZE Bytes aufgeteilt, die der Empfänger wieder zusammensetzt.
+    @param entries Einträge im Format "<handle> <ip> <port>".
+    @return Liste der zu sendenden Datagramme.
+    """
+    single = ('KNOWNUSERS ' + ','.join(entries) + '\n').encode()
+    if len(single) <= BUFFER_SIZE:
+        return [single]
+    chunks, cur, size = [], [], 0
+    for e in entries:
+        n = len(e.encode()) + 1
+        if cur and size + n > SEGMENT_SIZE:
+            chunks.append(cur)
+            cur, size = [], 0
+        cur.append(e)
+        size += n
+    if cur:
+        chunks.append(cur)
+    xfer = f"{random.getrandbits(32):08x}"
+    return [f"KNOWNSEG {xfer} {i} {len(chunks)} {','.join(c)}\n".encode()
+            for i, c in enumerate(chunks)]
+
+class _SegmentBuffer:
+    """
+    @brief Setzt segmentierte KNOWNUSERS-Listen (KNOWNSEG) wieder zusammen.
+    @details Schlüssel ist (Absenderadresse, Transfer-ID); Segmente dürfen in beliebiger
+             Reihenfolge und doppelt ankommen. Unvollständige Listen verfallen nach timeout.
+    """
+
+    def __init__(self, timeout: float = SEGMENT_TIMEOUT, max_pending: int = 64):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._pending: Dict[tuple, list] = {}   # Schlüssel → [total, {seq: text}, Startzeit]
+
+    def feed(self, addr, xfer: str, seq: int, total: int, text: str):
+        """
+        @brief Nimmt ein Segment entgegen.
+        @return Vollständige Eintragsliste, sobald alle total Segmente da sind, sonst None.
+        """
+        now = time.monotonic()
+        for key in [k for k, v in self._pending.items() if now - v[2] > self.timeout]:
+            del self._pending[key]
+        if not 0 <= seq < total:
+            return None
+        key = (addr, xfer)
+        entry = self._pending.get(key)
+        if entry is None:
+            if len(self._pending) >= self.max_pending:
+                return None
+            entry = self._pending[key] = [total, {}, now]
+        entry[1][seq] = text
+        if len(entry[1]) < entry[0]:
+            return None
+        del self._pending[key]
+        return [e for i in range(entry[0]) for e in _parse_entries(entry[1][i])]
+
+class _ExpiryHeap:
+    """
+    @brief Ablaufzeitpunkte der Registry-Einträge als Min-Heap (lazy deletion).
+    @details touch() legt einen neuen Heap-Eintrag an, statt den alten zu suchen; veraltete
+             Einträge werden beim Herausnehmen anhand von _deadline erkannt und übergangen.
+             Abgelaufene Handles zu finden kostet so O(k log n) statt eines Scans der Registry.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._deadline: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, h: str, deadline: float) -> bool:
+        """
+        @brief Setzt den Ablaufzeitpunkt eines Handles.
+        @return True, wenn dies nun der früheste Ablaufzeitpunkt ist (Wartezeit neu berechnen).
+        """
+        with self._lock:
+            self._deadline[h] = deadline
+            heapq.heappush(self._heap, (deadline, h))
+            return self._heap[0] == (deadline, h)
+
+    def discard(self, h: str) -> None:
+        with self._lock:
+            self._deadline.pop(h, None)
+
+    def __contains__(self, h: str) -> bool:
+        with self._lock:
+            return h in self._deadline
+
+    def pop_expired(self, now: float) -> List[str]:
+        """
+        @brief Entnimmt alle Handles, deren Ablaufzeitpunkt erreicht ist.
+        """
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, h = heapq.heappop(self._heap)
+                if self._deadline.get(h) == deadline:
+                    del self._deadline[h]
+                    expired.append(h)
+        return expired
+
+    def next_deadline(self):
+        """
+        @brief Frühester gültiger Ablaufzeitpunkt oder None.
+        """
+        with self._lock:
+            while self._heap and self._deadline.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+def apply_delta(peers: dict, added: dict, removed: list, changed: dict) -> None:
+    """
+    @brief Wendet ein Registry-Delta auf eine lokale Kopie der Teilnehmerliste an.
+    @param peers Lokale Kopie Handle → (ip, port), wird an Ort und Stelle geändert.
+    """
+    for h in removed:
+        peers.pop(h, None)
+    peers.update(added)
+    peers.update(changed)
+
+class _WhoisCache:
+    """
+    @brief Ergebnisse gezielter WHOIS-Anfragen mit Lebensdauer, auch negative.
+    @details Ein negativer Eintrag verhindert, dass Nachrichten an einen unbekannten Handle
+             jedes Mal erneut eine Anfrage ins Netz schicken.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: Dict[str, tuple] = {}    # Handle → (Adresse oder None, Ablaufzeit)
+        self._lock = threading.Lock()
+
+    def get(self, h: str):
+        """
+        @return (True, Adresse oder None) bei gültigem Eintrag, sonst (False, None).
+        """
+        with self._lock:
+            entry = self._entries.get(h)
+            if entry is None:
+                return False, None
+            if entry[1] < time.monotonic():
+                del self._entries[h]
+                return False, None
+            return True, entry[0]
+
+    def put(self, h: str, addr) -> None:
+        """
+        @brief Speichert eine Antwort; addr None ist ein negatives Ergebnis.
+        """
+        ttl = self.ttl if addr is not None else self.negative_ttl
+        with self._lock:
+            if ttl > 0:
+                self._entries[h] = (addr, time.monotonic() + ttl)
+            else:
+                self._entries.pop(h, None)
+
+    def invalidate(self, h: str) -> None:
+        with self._lock:
+            self._entries.pop(h, None)
+
+class _FeedQueue:
+    """
+    @brief Ausgangswarteschlange eines RegistryFeed-Abonnenten mit eigenem Schreib-Thread.
+    @details Ein Abonnent, der nicht mehr liest, blockiert so nur seinen eigenen Thread statt
+             aller Absender. Läuft die Schlange über, wird ihr Inhalt durch einen frischen
+             Snapshot ersetzt; der Abonnent ist danach wieder synchron.
+    """
+
+    def __init__(self, conn, on_error):
+        """
+        @param conn Pipe-Ende des Abonnenten.
+        @param on_error Aufrufbar ohne Argumente, wenn das Senden scheitert.
+        """
+        self.conn = conn
+        self._on_error = on_error
+        self._items: List = []
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def push(self, obj, snapshot=None) -> None:
+        """
+        @brief Reiht obj ein.
+        @param snapshot Aufrufbar, liefert ("users", registry, gen) für den Fall eines Überlaufs.
+        """
+        with self._cond:
+            if len(self._items) >= FEED_BACKLOG and snapshot is not None:
+                self._items = [snapshot()]
+            else:
+                self._items.append(obj)
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._items:
+                    self._cond.wait()
+                items, self._items = self._items, []
+            try:
+                for obj in items:
+                    self.conn.send(obj)
+            except (OSError, EOFError):
+                self._on_error()
+                return
+
+class RegistryFeed:
+    """
+    @brief Direkter Kanal von der Discovery zu weiteren Diensten (z. B. dem Netzwerkdienst).
+    @details Neu angemeldete Verbindungen erhalten zuerst einen Snapshot
+             ("users", registry, gen), danach jedes Delta ("delta", gen, added, removed, changed).
+             Da eine Pipe weder verliert noch umsortiert, bleiben Abonnenten ohne Resync
+             synchron. Gesendet wird pro Abonnent aus einer eigenen Schlange (_FeedQueue),
+             nie unter der Sperre des Feeds; ein Abonnent, der nicht mehr liest, erhält nach
+             FEED_BACKLOG ausstehenden Nachrichten statt der Deltas einen neuen Snapshot.
+             Verbindungen, deren Gegenseite beendet wurde, werden entfernt.
+             Abonnenten können Anfragen zurückschicken (z. B. ("whois", handle) oder
+             UI-Befehle wie ("join", handle, port)); sie gehen an on_request(conn, anfrage),
+             Antworten laufen über reply(). Schließt ein Abonnent die Verbindung, wird
+             on_close(conn) aufgerufen.
+    """
+
+    def __init__(self):
+        self._conns: Dict[object, _FeedQueue] = {}
+        self._last: Dict[str, Tuple[str, int]] = {}
+        self._gen = 0
+        self._lock = threading.Lock()
+        self.on_request = None
+        self.on_close = None
+
+    def _snapshot(self):
+        """
+        @brief Aktueller Stand als ("users", registry, gen); nur unter der Sperre aufrufen.
+        """
+        return ("users", dict(self._last), self._gen)
+
+    def add(self, conn) -> None:
+        """
+        @brief Meldet eine Verbindung (Pipe-Ende) an und schickt ihr den aktuellen Stand.
+        """
+        with self._lock:
+            queue = _FeedQueue(conn, lambda: self._drop(conn))
+            queue.push(self._snapshot())
+            self._conns[conn] = queue
+        threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _drop(self, conn) -> None:
+        """
+        @brief Entfernt einen Abonnenten, dessen Verbindung nicht mehr beschreibbar ist.
+        """
+        with self._lock:
+            self._conns.pop(conn, None)
+
+    def _serve(self, conn) -> None:
+        """
+        @brief Hintergrund-Thread: nimmt Anfragen eines Abonnenten entgegen.
+        @details Endet, wenn die Gegenseite schließt oder die Verbindung nur in
+                 Senderichtung offen ist.
+        """
+        while True:
+            try:
+                req = conn.recv()
+            except (OSError, EOFError):
+                break
+            if isinstance(req, tuple) and self.on_request is not None:
+                self.on_request(conn, req)
+        self._drop(conn)
+        if self.on_close is not None:
+            self.on_close(conn)
+
+    def reply(self, conn, obj) -> None:
+        """
+        @brief Schickt einem einzelnen Abonnenten eine Antwort (über dessen Schlange).
+        """
+        with self._lock:
+            queue = self._conns.get(conn)
+        if queue is not None:
+            queue.push(obj)
+
+    def publish(self, delta) -> None:
+        """
+        @brief Verteilt ein Delta aus Registry.flush() an alle Abonnenten.
+        """
+        gen, added, removed, changed = delta
+        with self._lock:
+            apply_delta(self._last, added, removed, changed)
+            self._gen = gen
+            msg = ("delta", gen, added, removed, changed)
+            for queue in self._conns.values():
+                queue.push(msg, self._snapshot)
+
+class _Gossip:
+    """
+    @brief SWIM-artige Mitgliedschaft: Ausfallerkennung per Probe, Verbreitung per Piggyback.
+    @details Pro Runde (interval) wird ein Mitglied in zufälliger Round-Robin-Reihenfolge per
+             `PING <seq> <handle>` geprüft. Bleibt `ACK <seq> <handle>` aus, werden bis zu
+             fanout andere Mitglieder per `PINGREQ <seq> <handle> <ip>` gebeten, es indirekt
+             zu prüfen. Scheitert auch das, gilt es als verdächtig (SUSPECT); widerspricht es
+             nicht innerhalb der Verdachtsfrist mit höherer Inkarnationsnummer, wird es als
+             DEAD aus der Registry entfernt.
+             Zustandsänderungen reisen als Zeilen `M <alive|suspect|dead> <handle> <ip> <port>
+             <inkarnation>` an PING/ACK/PINGREQ angehängt mit und werden je etwa 3·log2(N) Mal
+             weitergegeben. Die Last pro Knoten und Runde ist damit konstant, eine Änderung
+             erreicht alle Knoten in O(log N) Runden.
+             Mitglieder werden über (ip, whois_port) angesprochen, also über den
+             Discovery-Socket ihres Hosts.
+    """
+
+    def __init__(self, sock, port: int, registry: Registry, notify,
+                 interval: float = 1.0, fanout: int = 3):
+        """
+        @param sock Gebundener Discovery-Socket.
+        @param port whoisport der anderen Knoten.
+        @param registry Registry, in die Beitritte und Ausfälle geschrieben werden.
+        @param notify Aufrufbar ohne Argumente; meldet Registry-Änderungen als Delta.
+        @param interval Dauer einer Probe-Runde in Sekunden.
+        @param fanout Anzahl der Mitglieder, die um eine indirekte Probe gebeten werden.
+        """
+        self.sock = sock
+        self.port = port
+        self.registry = registry
+        self.notify = notify
+        self.interval = interval
+        self.fanout = fanout
+        # Handle → [ip, port, inkarnation, zustand, seit]
+        self.members: Dict[str, list] = {}
+        self._local: Dict[str, list] = {}       # lokale Handles → [ip, port, inkarnation]
+        self._updates: Dict[str, list] = {}     # Handle → [Zeile, bisherige Weitergaben]
+        self._waiting: Dict[int, threading.Event] = {}
+        self._relays: Dict[int, tuple] = {}     # eigene seq → (Anfragender, seq, Handle, Frist)
+        self._seq = random.getrandbits(24)
+        self._lock = threading.Lock()
+
+    # --- Zustand ---------------------------------------------------------------------------
+
+    def _suspect_timeout(self) -> float:
+        n = max(2, len(self.members))
+        return self.interval * 3 * math.log2(n + 1)
+
+    def _enqueue(self, state: str, h: str, ip: str, port: int, inc: int) -> None:
+        self._updates[h] = [f"M {state} {h} {ip} {port} {inc}", 0]
+
+    def _set(self, h: str, ip: str, port: int, inc: int, state: str) -> None:
+        """
+        @brief Übernimmt einen neuen Zustand und spiegelt ihn in die Registry.
+        """
+        self.members[h] = [ip, port, inc, state, time.monotonic()]
+        if state == 'dead':
+            self.registry.pop(h, None)
+        else:
+            self.registry[h] = (ip, port)
+
+    def _apply(self, state: str, h: str, ip: str, port: int, inc: int) -> None:
+        """
+        @brief Wendet eine empfangene Zustandsmeldung nach den SWIM-Vorrangregeln an.
+        @details Höhere Inkarnation gewinnt; bei gleicher Inkarnation schlägt SUSPECT ALIVE
+                 und DEAD alles. Verdacht gegen einen lokalen Handle wird mit erhöhter
+                 Inkarnation widerlegt.
+        """
+        if h in self._local:
+            me = self._local[h]
+            if state != 'alive' and inc >= me[2]:
+                me[2] = inc + 1
+                self._enqueue('alive', h, *me)
+            return
+        m = self.members.get(h)
+        if state == 'alive':
+            apply = m is None or inc > m[2]
+        elif state == 'suspect':
+            apply = (m is None or inc > m[2]
+                     or (inc == m[2] and m[3] == 'alive'))
+        else:
+            apply = m is None or inc > m[2] or (inc == m[2] and m[3] != 'dead')
+        if apply:
+            self._set(h, ip, port, inc, state)
+            self._enqueue(state, h, ip, port, inc)
+
+    def learn(self, h: str, ip: str, port: int, first_hand: bool) -> None:
+        """
+        @brief Nimmt einen per JOIN/KNOWNUSERS bekannt gewordenen Teilnehmer auf.
+        @param first_hand True bei JOIN: belebt auch einen als DEAD geführten Handle wieder
+               (Neustart des Clients mit Inkarnation 0).
+        """
+        with self._lock:
+            if h in self._local:
+                return
+            m = self.members.get(h)
+            if m is None:
+                inc = 0
+            elif first_hand and (m[3] == 'dead' or (m[0], m[1]) != (ip, port)):
+                inc = m[2] + 1
+            else:
+                return
+            self._set(h, ip, port, inc, 'alive')
+            if first_hand:
+                self._enqueue('alive', h, ip, port, inc)
+
+    def forget(self, h: str) -> None:
+        """
+        @brief Teilnehmer hat sich per LEAVE abgemeldet; als DEAD weitergeben.
+        """
+        with self._lock:
+            m = self.members.get(h)
+            if m is not None and m[3] != 'dead':
+                self._set(h, m[0], m[1], m[2], 'dead')
+                self._enqueue('dead', h, m[0], m[1], m[2])
+
+    def join_local(self, h: str, ip: str, port: int) -> None:
+        with self._lock:
+            inc = self._local.get(h, [None, None, 0])[2]
+            self._local[h] = [ip, port, inc]
+            self.members.pop(h, None)
+            self._enqueue('alive', h, ip, port, inc)
+
+    def leave_local(self, h: str) -> None:
+        with self._lock:
+            me = self._local.pop(h, None)
+            if me is not None:
+                self._enqueue('dead', h, *me)
+
+    # --- Nachrichten -----------------------------------------------------------------------
+
+    def _piggyback(self) -> str:
+        """
+        @brief Hängt die am seltensten weitergegebenen Zustandsmeldungen an (bis SEGMENT_SIZE).
+        """
+        limit = 3 * max(1, math.ceil(math.log2(len(self.members) + 2)))
+        lines, size = [], 0
+        for h, upd in sorted(self._updates.items(), key=lambda kv: kv[1][1]):
+            if size + len(upd[0]) + 1 > SEGMENT_SIZE:
+                break
+            lines.append(upd[0])
+            size += len(upd[0]) + 1
+            upd[1] += 1
+            if upd[1] >= limit:
+                del self._updates[h]
+        return ''.join('\n' + line for line in lines)
+
+    def _send(self, head: str, ip: str) -> None:
+        with self._lock:
+            data = (head + self._piggyback() + '\n').encode()
+        try:
+            self.sock.sendto(data, (ip, self.port))
+        except OSError:
+            pass
+
+    def _next_seq(self) -> int:
+        with self._lock:
+            self._seq = (self._seq + 1) & 0xffffffff
+            return self._seq
+
+    def on_packet(self, msg: str, addr) -> bool:
+        """
+        @brief Verarbeitet PING/ACK/PINGREQ samt angehängter Zustandsmeldungen.
+        @return False, wenn msg keine Gossip-Nachricht ist.
+        """
+        head, *lines = msg.split('\n')
+        parts = head.split()
+        if not parts or parts[0] not in ('PING', 'ACK', 'PINGREQ'):
+            return False
+        if len(parts) < (4 if parts[0] == 'PINGREQ' else 3):
+            return True
+        before = self.registry.digest()
+        with self._lock:
+            for line in lines:
+                f = line.split()
+                if len(f) == 6 and f[0] == 'M' and f[1] in ('alive', 'suspect', 'dead'):
+                    self._apply(f[1], f[2], f[3], int(f[4]), int(f[5]))
+        if self.registry.digest() != before:
+            self.notify()
+
+        kind, seq, h = parts[0], int(parts[1]), parts[2]
+        if kind == 'PING':
+            if h in self._local:
+                self._send(f"ACK {seq} {h}", addr[0])
+        elif kind == 'PINGREQ':
+            # Indirekte Probe im Auftrag von addr
+            own = self._next_seq()
+            with self._lock:
+                self._relays[own] = (addr[0], seq, h, time.monotonic() + self.interval)
+            self._send(f"PING {own} {h}", parts[3])
+        else:
+            with self._lock:
+                ev = self._waiting.get(seq)
+                relay = self._relays.pop(seq, None)
+            if ev is not None:
+                ev.set()
+            elif relay is not None:
+                self._send(f"ACK {relay[1]} {relay[2]}", relay[0])
+        return True
+
+    # --- Probe-Runden ----------------------------------------------------------------------
+
+    def _probe(self, h: str) -> None:
+        """
+        @brief Prüft ein Mitglied direkt und bei Bedarf indirekt; markiert es sonst als SUSPECT.
+        """
+        with self._lock:
+            m = self.members.get(h)
+            if m is None or m[3] == 'dead':
+                return
+            ip = m[0]
+            helpers = [v[0] for k, v in self.members.items() if k != h and v[3] == 'alive']
+        seq = self._next_seq()
+        ev = self._waiting[seq] = threading.Event()
+        try:
+            self._send(f"PING {seq} {h}", ip)
+            if ev.wait(self.interval / 3):
+                return
+            for helper in random.sample(helpers, min(self.fanout, len(helpers))):
+                self._send(f"PINGREQ {seq} {h} {ip}", helper)
+            if ev.wait(self.interval / 2):
+                return
+        finally:
+            self._waiting.pop(seq, None)
+        with self._lock:
+            m = self.members.get(h)
+            if m is not None and m[3] == 'alive':
+                m[3], m[4] = 'suspect', time.monotonic()
+                self._enqueue('suspect', h, m[0], m[1], m[2])
+
+    def _expire(self) -> None:
+        """
+        @brief Erklärt Verdächtige nach der Verdachtsfrist für DEAD und räumt alte Einträge auf.
+        """
+        now = time.monotonic()
+        changed = False
+        with self._lock:
+            timeout = self._suspect_timeout()
+            for h, m in list(self.members.items()):
+                if m[3] == 'suspect' and now - m[4] > timeout:
+                    self._set(h, m[0], m[1], m[2], 'dead')
+                    self._enqueue('dead', h, m[0], m[1], m[2])
+                    changed = True
+                elif m[3] == 'dead' and now - m[4] > 10 * timeout:
+                    # Grabstein lange genug gehalten, veraltete ALIVE-Meldungen sind verbreitet
+                    del self.members[h]
+            for seq in [s for s, r in self._relays.items() if r[3] < now]:
+                del self._relays[seq]
+        if changed:
+            self.notify()
+
+    def run(self) -> None:
+        """
+        @brief Hintergrund-Thread: eine Probe pro Runde, Ziele in gemischter Round-Robin-Folge.
+        """
+        order: List[str] = []
+        while True:
+            start = time.monotonic()
+            self._expire()
+            if not order:
+                with self._lock:
+                    order = [h for h, m in self.members.items() if m[3] != 'dead']
+                random.shuffle(order)
+            if order:
+                self._probe(order.pop())
+            time.sleep(max(0.0, self.interval - (time.monotonic() - start)))
+
+def _get_local_ip(family: int = socket.AF_INET) -> str:
     """
     @brief Ermittelt die lokale IP-Adresse des Hosts.
     @details Öffnet kurz ein UDP-Socket zu einem öffentlichen Server (hier Google DNS),
-             um die tatsächliche Interface-IP abzurufen. Fallback auf 127.0.0.1 bei Fehler.
+             um die tatsächliche Interface-IP abzurufen. Fallback auf Loopback bei Fehler.
+    @param family socket.AF_INET oder socket.AF_INET6.
     @return Lokale IP-Adresse als String.
     """
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    v6 = family == socket.AF_INET6
+    s = socket.socket(family, socket.SOCK_DGRAM)
     try:
         # Verbindung zu externem Host, um lokale IP zu bestimmen
-        s.connect(('8.8.8.8', 80))
+        s.connect(('2001:4860:4860::8888', 80) if v6 else ('8.8.8.8', 80))
         return s.getsockname()[0]
     except Exception:
         # Falls Ermittlung fehlschlägt, verwende Loopback
-        return '127.0.0.1'
+        return '::1' if v6 else '127.0.0.1'
     finally:
         s.close()
 
-def run_discovery_service(pipe_cmd, pipe_evt, config) -> None:
+def _open_discovery_socket(config):
+    """
+    @brief Erzeugt den gebundenen Discovery-Socket und die Zieladresse für Rundsendungen.
+    @details
+    - "broadcast": IPv4, Ziel 255.255.255.255 (bisheriges Verhalten).
+    - "multicast": Beitritt zu multicast_group; die Adressfamilie ergibt sich aus der
+      Gruppe (z. B. 239.255.42.99 oder ff15::4299). multicast_ttl begrenzt die Zahl der
+      Router-Hops, multicast_interface wählt die Schnittstelle (IPv4: Adresse der
+      Schnittstelle, IPv6: Name oder Index; leer = Systemstandard). Nur Hosts, die der
+      Gruppe beigetreten sind, erhalten die Pakete.
+    @param config Konfigurationsobjekt (whoisport, discovery_transport, multicast_*).
+    @return (socket, (ziel, port[, ...])).
+    """
+    port = config.whoisport
+    if config.discovery_transport == 'multicast':
+        group = config.multicast_group
+        family = socket.AF_INET6 if ':' in group else socket.AF_INET
+    else:
+        family = socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        # Ermöglicht mehrfache Bindung unter Linux
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    except Exception:
+        # Nicht auf allen Plattformen verfügbar → ignorieren
+        pass
+    sock.bind(('', port))
+
+    if config.discovery_transport != 'multicast':
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        return sock, (BROADCAST_ADDR, port)
+
+    iface = str(config.multicast_interface or '')
+    if family == socket.AF_INET:
+        local = socket.inet_aton(iface or '0.0.0.0')
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                        socket.inet_aton(group) + local)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, config.multicast_ttl)
+        # Andere Clients auf demselben Host sollen mithören
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        if iface:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, local)
+        return sock, (group, port)
+
+    index = int(iface) if iface.isdigit() else (socket.if_nametoindex(iface) if iface else 0)
+    sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_JOIN_GROUP,
+                    socket.inet_pton(socket.AF_INET6, group) + struct.pack('@I', index))
+    sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_HOPS, config.multicast_ttl)
+    sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_LOOP, 1)
+    if index:
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_IF, index)
+    return sock, (group, port, 0, index)
+
+def _peer_ip(addr) -> str:
+    """
+    @brief Absender-IP aus einer recvfrom()-Adresse.
+    @details Link-lokale IPv6-Adressen sind nur mit Scope (Schnittstelle) erreichbar; er
+             wird als `%<index>` angehängt.
+    """
+    if len(addr) == 4 and addr[3] and '%' not in addr[0]:
+        return f"{addr[0]}%{addr[3]}"
+    return addr[0]
+
+def run_discovery_service(pipe_cmd, pipe_evt, config, feed: RegistryFeed = None) -> None:
     """
     @brief Startet den Discovery-Service für Peer-to-Peer-Erkennung über UDP-Broadcast.
-    @param pipe_cmd Pipe für Steuerbefehle von der UI (join, leave, who).
-    @param pipe_evt Pipe zur Rückmeldung von Nutzerlisten an die UI.
-    @param config Konfigurationsobjekt mit Informationen über whois-Port, Handle, usw.
+    @param pipe_cmd Pipe für Steuerbefehle von der UI (join, leave, who, whois, sync) oder
+           None, wenn alle Clients (auch UIs) über den RegistryFeed angebunden sind.
+    @param pipe_evt Pipe (oder None) zur Rückmeldung von Registry-Änderungen an die UI
+           (("delta", gen, added, removed, changed), auf ("sync",) ein Snapshot ("users", registry, gen)).
+    @param config Konfigurationsobjekt mit Informationen über whois-Port, Handle,
+           heartbeat_interval, peer_ttl, whois_ttl, whois_negative_ttl, Transport (discovery_transport, multicast_*) und
+           Mitgliedschaftsmodus (discovery_mode, gossip_interval, gossip_fanout).
+    @param feed Optionaler RegistryFeed (oder ein einzelnes Pipe-Ende), über den der
+           Netzwerkdienst die Registry direkt erhält.
     @details
     - Verwaltet eine interne Registry aller bekannten Peers im lokalen Netzwerk.
-    - Reagiert auf JOIN-/LEAVE-/WHO-Anfragen.
+    - Reagiert auf JOIN-/LEAVE-/WHO-Anfragen. Antworten an andere Discovery-Instanzen gehen
+      nach einer zufälligen Verzögerung (REPLY_DELAY) per Broadcast raus und entfallen, wenn
+      in der Zwischenzeit eine gleichwertige Liste eines anderen Knotens gesehen wurde. Pro
+      JOIN antwortet so typischerweise ein einziger Knoten statt aller.
+    - Sendet für die lokal angemeldeten Handles alle heartbeat_interval Sekunden ein
+      'ALIVE <handle> <port>'. Fremde Einträge, die peer_ttl Sekunden lang weder JOIN noch
+      ALIVE geschickt haben, werden entfernt und wie ein LEAVE als Delta gemeldet
+      (peer_ttl = 0 schaltet das Verfallen ab, heartbeat_interval = 0 nur das Senden).
+      Config verlangt peer_ttl ≥ 3 × heartbeat_interval, damit Jitter und ein verlorenes
+      ALIVE einen lebenden Peer nicht entfernen.
+    - Löst einzelne Handles gezielt per 'WHOIS <handle>' auf; nur der Besitzer antwortet mit
+      'IAM <handle> <ip> <port>'. Ergebnisse (auch negative) werden zwischengespeichert
+      (whois_ttl, whois_negative_ttl). Anfragen kommen als ("whois", handle) über den
+      RegistryFeed oder die Befehls-Pipe und werden mit ("whois", handle, (ip, port) | None)
+      beantwortet.
+    - Mit discovery_mode = "gossip" übernimmt stattdessen _Gossip (SWIM) Ausfallerkennung und
+      Verbreitung von Beitritten/Austritten; JOIN/LEAVE/KNOWNUSERS dienen dann nur noch dem
+      Einstieg. Änderungen laufen wie gewohnt als Delta an UI und RegistryFeed.
+    - Meldet nur tatsächliche Änderungen als Delta; ein Snapshot wird nur auf ("sync",) gesendet.
+    - Über den RegistryFeed können beliebig viele Clients dieselben Befehle wie über pipe_cmd
+      schicken; Antworten gehen an den jeweiligen Client, Deltas an alle. Trennt sich ein
+      Client, werden die von ihm angemeldeten Handles abgemeldet (LEAVE).
     - Antwortet mit KNOWNUSERS-Nachrichten an andere Discovery-Instanzen.
     - Nutzt einen Listener-Thread, um UDP-Messages asynchron zu empfangen.
     """
 
     whois_port = config.whoisport
-    registry: Dict[str, Tuple[str,int]] = {}       # aktuell erfasste Teilnehmer
-    last_registry: Dict[str, Tuple[str,int]] = {}  # zuletzt gesendete Snapshot
+    if feed is not None and not isinstance(feed, RegistryFeed):
+        # Einzelnes Pipe-Ende, z. B. aus main.py (Prozess-Argumente müssen picklebar sein)
+        conn, feed = feed, RegistryFeed()
+        feed.add(conn)
+    registry = Registry()                          # aktuell erfasste Teilnehmer
+    local: Dict[str, int] = {}                     # lokal angemeldete Handles → Port
+    expiry = _ExpiryHeap()
+    wake = threading.Event()                       # weckt den Heartbeat-Thread vorzeitig
+    gossip_mode = config.discovery_mode == 'gossip'
+    # Im Gossip-Modus ersetzt die SWIM-Probe Heartbeats und TTL
+    heartbeat_interval = 0 if gossip_mode else config.heartbeat_interval
+    peer_ttl = 0 if gossip_mode else config.peer_ttl
+    # Listener-Thread und Befehlsschleife melden beide; Deltas müssen in Generationsfolge raus
+    notify_lock = threading.RLock()
+    whois_cache = _WhoisCache(config.whois_ttl, config.whois_negative_ttl)
+    lookups: Dict[str, list] = {}                  # Handle → [Anfrage-Objekt, Antwort-Callbacks]
+    lookup_lock = threading.Lock()
 
-    # Ermittele lokale IP für JOIN-Meldungen
-    local_ip = _get_local_ip()
+    # Erstelle UDP-Socket für Discovery (Broadcast oder Multicast-Gruppe)
+    sock, group_addr = _open_discovery_socket(config)
 
-    # Erstelle UDP-Broadcast-Socket für Discovery
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        # Ermöglicht mehrfache Bindung unter Linux
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-    except Exception:
-        # Nicht auf allen Plattformen verfügbar → ignorieren
-        pass
-    sock.bind(('', whois_port))
+    # Ermittele lokale IP für JOIN-Meldungen (in der Adressfamilie des Transports)
+    local_ip = _get_local_ip(sock.family)
+    gossip = (_Gossip(sock, whois_port, registry, lambda: notify(),
+                      config.gossip_interval, config.gossip_fanout)
+              if gossip_mode else None)
 
-    def send_update_if_changed():
+    def notify():
         """
-    @brief Sendet eine aktualisierte Nutzerliste an die UI, falls sich die Registry geändert hat.
-    @details Wird automatisch aufgerufen, wenn neue Teilnehmer erkannt oder entfernt wurden.
-    Vermeidet redundante Übertragungen, indem die letzte bekannte Registry mit der aktuellen verglichen wird.
+    @brief Meldet die seit dem letzten Aufruf angefallenen Änderungen an UI und RegistryFeed.
+    @details Ein KNOWNUSERS mit lauter bekannten Einträgen erzeugt so keinerlei IPC-Verkehr.
     """
 
-        nonlocal last_registry
-        if registry != last_registry:
-            pipe_evt.send(("users", dict(registry)))
-            last_registry = dict(registry)
+        with notify_lock:
+            delta = registry.flush()
+            if delta is None:
+                return
+            if pipe_evt is not None:
+                pipe_evt.send(("delta", *delta))
+            if feed is not None:
+                feed.publish(delta)
+
+    def send_known(dest) -> None:
+        """
+    @brief Sendet die eigene Registry als KNOWNUSERS (bzw. KNOWNSEG-Segmente) an dest.
+    """
+
+        entries = [f"{h2} {ip} {pr}" for h2, (ip, pr) in registry.items()]
+        for datagram in _encode_known(entries):
+            sock.sendto(datagram, dest)
+
+    reply = {'timer': None}                         # geplante KNOWNUSERS-Antwort
+    reply_lock = threading.Lock()
+
+    def fire_reply() -> None:
+        with reply_lock:
+            if reply['timer'] is None:
+                return
+            reply['timer'] = None
+        send_known(group_addr)
+
+    def schedule_reply() -> None:
+        """
+    @brief Plant eine KNOWNUSERS-Antwort per Broadcast nach zufälliger Verzögerung.
+    @details Ist bereits eine Antwort geplant, bleibt es bei dieser; sie enthält beim
+             Senden ohnehin den dann aktuellen Stand.
+    """
+
+        with reply_lock:
+            if reply['timer'] is not None:
+                return
+            reply['timer'] = threading.Timer(random.uniform(*REPLY_DELAY), fire_reply)
+            reply['timer'].daemon = True
+            reply['timer'].start()
+
+    def refresh(h: str, addr: Tuple[str, int], first_hand: bool = True) -> None:
+        """
+    @brief Trägt einen fremden Teilnehmer ein und setzt seine Lebensdauer.
+    @param first_hand True bei JOIN/ALIVE des Teilnehmers selbst. Einträge aus fremden
+           Listen verlängern eine bestehende Lebensdauer nicht, sonst hielten sich
+           abgestürzte Peers gegenseitig am Leben.
+    """
+
+        if first_hand or registry.get(h) is None:
+            registry[h] = addr
+        if h in local or not peer_ttl or (not first_hand and h in expiry):
+            return
+        if expiry.touch(h, time.monotonic() + peer_ttl):
+            wake.set()
+
+    def seen_list(entries: List[Tuple[str, str, int]]) -> None:
+        """
+    @brief Übernimmt eine empfangene Liste; deckt sie die eigene Registry vollständig ab,
+           wird die eigene geplante Antwort gestrichen (sie brächte niemandem Neues).
+    """
+
+        for h2, ip, pr in entries:
+            if h2 in local:
+                continue
+            if gossip is not None:
+                gossip.learn(h2, ip, pr, first_hand=False)
+            else:
+                refresh(h2, (ip, pr), first_hand=False)
+        if _digest_of(entries) == registry.digest():
+            with reply_lock:
+                if reply['timer'] is not None:
+                    reply['timer'].cancel()
+                    reply['timer'] = None
+        notify()
+
+    def whois(h: str, answer) -> None:
+        """
+    @brief Löst einen Handle auf und ruft answer((ip, port) oder None) auf.
+    @details Registry und Cache zuerst; sonst genau eine WHOIS-Anfrage ins Netz, auch wenn
+             mehrere Aufrufer gleichzeitig auf denselben Handle warten.
+    """
+
+        addr = registry.get(h)
+        if addr is None:
+            hit, addr = whois_cache.get(h)
+            if not hit:
+                with lookup_lock:
+                    entry = lookups.get(h)
+                    first = entry is None
+                    if first:
+                        entry = lookups[h] = [object(), []]
+                    entry[1].append(answer)
+                if first:
+                    sock.sendto(f"WHOIS {h}\n".encode(), group_addr)
+                    for delay, fn, args in ((WHOIS_TIMEOUT / 2, retry_whois, (h, entry[0])),
+                                            (WHOIS_TIMEOUT, resolve, (h, None, entry[0]))):
+                        timer = threading.Timer(delay, fn, args)
+                        timer.daemon = True
+                        timer.start()
+                return
+        answer(addr)
+
+    def retry_whois(h: str, token) -> None:
+        # Eine Wiederholung, falls Anfrage oder Antwort verloren ging
+        with lookup_lock:
+            pending = h in lookups and lookups[h][0] is token
+        if pending:
+            sock.sendto(f"WHOIS {h}\n".encode(), group_addr)
+
+    def resolve(h: str, addr, token=None) -> None:
+        """
+    @brief Beantwortet alle wartenden Anfragen zu h und speichert das Ergebnis im Cache.
+    @param token Nur beim Timeout gesetzt: die Anfrage, die er beenden soll. Wurde sie
+           schon beantwortet, bleibt alles unverändert (kein negativer Eintrag).
+    """
+
+        with lookup_lock:
+            entry = lookups.get(h)
+            if token is not None and (entry is None or entry[0] is not token):
+                return
+            lookups.pop(h, None)
+        whois_cache.put(h, addr)
+        for answer in entry[1] if entry else ():
+            answer(addr)
 
     def listener():
         """
@@ -106,76 +1029,214 @@ def run_discovery_service(pipe_cmd, pipe_evt, config) -> None:
     Erkennt und verarbeitet folgende Nachrichtenformate:
     - 'JOIN <handle> <port>' – Registrierung eines neuen Teilnehmers
     - 'LEAVE <handle>' – Abmeldung eines Teilnehmers
-    - 'WHO' – Anfrage zur aktuellen Registry
+    - 'ALIVE <handle> <port>' – Heartbeat; verlängert die Lebensdauer des Eintrags
+    - 'WHOIS <handle>' – gezielte Anfrage; beantwortet nur für lokal angemeldete Handles
+    - 'IAM <handle> <ip> <port>' – Antwort darauf; wird in Registry und Cache übernommen
+    - 'WHO [<digest>]' – Anfrage zur aktuellen Registry; mit Digest wird nur geantwortet,
+      wenn sich die eigene Registry davon unterscheidet
     - 'KNOWNUSERS <handle ip port,...>' – Antwort auf WHO mit vollständiger Teilnehmerliste
-    Nach jedem relevanten Update wird die Registry aktualisiert und ggf. an die UI gesendet.
+    - 'KNOWNSEG <transfer> <seq> <total> <handle ip port,...>' – ein Segment einer Liste,
+      die nicht in ein Datagramm passt
+    Nach jedem Paket werden nur die tatsächlichen Änderungen an die UI gemeldet.
     """
 
-        nonlocal last_registry
+        segments = _SegmentBuffer()
         while True:
             data, addr = sock.recvfrom(BUFFER_SIZE)
-            msg = data.decode('utf-8').strip()
-
-            if msg.startswith('JOIN'):
-                # Neuer Teilnehmer tritt bei
-                _, h, p = msg.split()
-                registry[h] = (addr[0], int(p))
-                # Verteile aktualisierte Liste per Broadcast an alle Discovery-Server
-                entries = [f"{h2} {ip} {pr}" for h2,(ip,pr) in registry.items()]
-                full_msg = ('KNOWNUSERS ' + ','.join(entries) + '\n').encode()
-                sock.sendto(full_msg, (BROADCAST_ADDR, whois_port))
-                send_update_if_changed()
-
-            elif msg.startswith('LEAVE'):
-                # Teilnehmer verlässt Chat
-                _, h = msg.split()
-                registry.pop(h, None)
-                send_update_if_changed()
-
-            elif msg == 'WHO':
-                # Manuelle Anfrage zur Nutzerliste
-                entries = [f"{h2} {ip} {pr}" for h2,(ip,pr) in registry.items()]
-                sock.sendto(('KNOWNUSERS ' + ','.join(entries) + '\n').encode(), addr)
-                pipe_evt.send(("users", dict(registry)))
-                last_registry = dict(registry)
-
-            elif msg.startswith('KNOWNUSERS'):
-                # Antwort eines anderen Discovery-Servers sammeln
-                rest = msg[len('KNOWNUSERS '):]
-                for entry in rest.split(','):
-                    h2, ip, pr = entry.split()
-                    registry[h2] = (ip, int(pr))
-                pipe_evt.send(("users", dict(registry)))
-                last_registry = dict(registry)
+            msg = data.decode('utf-8', errors='replace').strip()
+            parts = msg.split(' ', 4)
+
+            try:
+                if gossip is not None and gossip.on_packet(msg, addr):
+                    # PING/ACK/PINGREQ samt angehängten Zustandsmeldungen
+                    continue
+
+                if msg.startswith('JOIN'):
+                    # Neuer Teilnehmer tritt bei
+                    _, h, p = msg.split()
+                    if gossip is not None:
+                        gossip.learn(h, _peer_ip(addr), int(p), first_hand=True)
+                    else:
+                        refresh(h, (_peer_ip(addr), int(p)))
+                    # Aktualisierte Liste verteilen – verzögert, damit nicht alle zugleich antworten
+                    schedule_reply()
+                    notify()
+
+                elif msg.startswith('LEAVE'):
+                    # Teilnehmer verlässt Chat
+                    _, h = msg.split()
+                    if h not in local:
+                        registry.pop(h, None)
+                        expiry.discard(h)
+                        whois_cache.invalidate(h)
+                        if gossip is not None:
+                            gossip.forget(h)
+                    notify()
+
+                elif parts[0] == 'WHOIS' and len(parts) == 2:
+                    # Gezielte Anfrage: nur der Besitzer des Handles antwortet. Wie bei mDNS geht
+                    # die Antwort an alle; so erreicht sie den Fragenden auch, wenn sich mehrere
+                    # Clients eines Hosts den whoisport teilen, und füllt nebenbei fremde Caches.
+                    h = parts[1]
+                    if h in local:
+                        sock.sendto(f"IAM {h} {local_ip} {local[h]}\n".encode(), group_addr)
+
+                elif parts[0] == 'IAM' and len(parts) == 4:
+                    _, h, _, p = parts
+                    if h not in local:
+                        # Wie beim JOIN gilt die Absenderadresse
+                        peer = (_peer_ip(addr), int(p))
+                        if gossip is not None:
+                            gossip.learn(h, *peer, first_hand=True)
+                        else:
+                            refresh(h, peer)
+                        notify()
+                        resolve(h, peer)
+
+                elif parts[0] == 'ALIVE':
+                    # Heartbeat eines Teilnehmers; trägt ihn auch ein, falls sein JOIN verpasst wurde
+                    _, h, p = msg.split()
+                    if h not in local:
+                        if gossip is not None:
+                            # Lebenszeichen entscheidet im Gossip-Modus die SWIM-Probe
+                            gossip.learn(h, _peer_ip(addr), int(p), first_hand=False)
+                        else:
+                            refresh(h, (_peer_ip(addr), int(p)))
+                        notify()
+
+                elif parts[0] == 'WHO':
+                    # Anfrage zur Nutzerliste; ist der Digest gleich, ist der Fragende synchron
+                    if len(parts) == 1 or parts[1] != registry.digest():
+                        if addr[1] == whois_port:
+                            # Discovery-Instanz: Antwort per Broadcast, unterdrückbar
+                            schedule_reply()
+                        else:
+                            # Anderer Absender (z. B. Werkzeug) hört den Broadcast nicht
+                            send_known(addr)
+
+                elif parts[0] == 'KNOWNSEG' and len(parts) == 5:
+                    # Segment einer großen Liste: erst vollständig übernehmen
+                    _, xfer, seq, total, rest = parts
+                    entries = segments.feed(addr, xfer, int(seq), int(total), rest)
+                    if entries is not None:
+                        seen_list(entries)
+
+                elif msg.startswith('KNOWNUSERS'):
+                    # Antwort eines anderen Discovery-Servers sammeln
+                    seen_list(_parse_entries(msg[len('KNOWNUSERS '):]))
+            except ValueError:
+                # Defektes Paket verwerfen, der Listener läuft weiter
+                continue
+
+    def heartbeat():
+        """
+        @brief Hintergrund-Thread: sendet ALIVE für lokale Handles und entfernt abgelaufene Einträge
+               (samt ihrem WHOIS-Cache-Eintrag).
+        @details Schläft bis zum nächsten Heartbeat oder zum frühesten Ablaufzeitpunkt im Heap;
+                 ein früherer Ablaufzeitpunkt weckt ihn über wake. Mit heartbeat_interval = 0
+                 werden nur abgelaufene Einträge entfernt, ALIVE wird nicht gesendet.
+        """
+        next_beat = time.monotonic() if heartbeat_interval > 0 else None
+        while True:
+            # Vor dem Bestimmen der Frist zurücksetzen, sonst ginge ein set() dazwischen verloren
+            wake.clear()
+            now = time.monotonic()
+            if next_beat is not None and now >= next_beat:
+                for h, p in list(local.items()):
+                    sock.sendto(f"ALIVE {h} {p}\n".encode(), group_addr)
+                # Leichter Jitter, damit sich die Heartbeats der Knoten nicht synchronisieren
+                next_beat = now + heartbeat_interval * random.uniform(0.9, 1.1)
+            expired = expiry.pop_expired(now)
+            if expired:
+                for h in expired:
+                    registry.pop(h, None)
+                    # Wie bei LEAVE: keine tote Adresse mehr aus dem WHOIS-Cache liefern
+                    whois_cache.invalidate(h)
+                notify()
+            deadlines = [t for t in (next_beat, expiry.next_deadline()) if t is not None]
+            wake.wait(max(0.0, min(deadlines) - time.monotonic()) if deadlines else None)
 
     # Listener-Thread für eingehende Broadcasts und Unicasts starten
     threading.Thread(target=listener, daemon=True).start()
+    if heartbeat_interval > 0 or peer_ttl > 0:
+        threading.Thread(target=heartbeat, daemon=True).start()
+    if gossip is not None:
+        threading.Thread(target=gossip.run, daemon=True).start()
+
+    cmd_lock = threading.RLock()
+    owners: Dict[object, set] = {}                 # Feed-Client → von ihm angemeldete Handles
+
+    def handle_command(cmd, send) -> None:
+        """
+    @brief Führt einen Steuerbefehl aus (join, leave, who, whois, sync).
+    @param send Aufrufbar; schickt eine Antwort an den anfragenden Client.
+    """
 
-    # Verarbeite Steuerbefehle von der UI
-    while True:
-        cmd = pipe_cmd.recv()
-        if not isinstance(cmd, tuple):
-            continue
         action = cmd[0]
 
         if action == 'join':
             # UI fordert JOIN: lokalen Nutzer zur Registry hinzufügen und broadcasten
             _, h, p = cmd
+            local[h] = int(p)
+            expiry.discard(h)
+            if gossip is not None:
+                gossip.join_local(h, local_ip, int(p))
             registry[h] = (local_ip, int(p))
-            send_update_if_changed()
-            sock.sendto(f"JOIN {h} {p}\n".encode(),
-                        (BROADCAST_ADDR, whois_port))
+            notify()
+            sock.sendto(f"JOIN {h} {p}\n".encode(), group_addr)
+
+        elif action == 'whois':
+            # UI fragt gezielt nach einem Handle; Antwort ("whois", handle, (ip, port) | None)
+            _, h = cmd
+            whois(h, lambda addr, h=h: send(("whois", h, addr)))
 
         elif action == 'who':
-            # UI fordert WHO: Liste aller registrierten Nutzer erfragen
-            sock.sendto(b"WHO\n", (BROADCAST_ADDR, whois_port))
-            pipe_evt.send(("users", dict(registry)))
-            last_registry = dict(registry)
+            # UI fordert WHO: nur Peers mit abweichender Registry antworten mit ihrer Liste
+            sock.sendto(f"WHO {registry.digest()}\n".encode(), group_addr)
+
+        elif action == 'sync':
+            # UI hat eine Lücke in den Generationen erkannt: vollständigen Stand senden
+            with notify_lock:
+                notify()
+                send(("users", *registry.snapshot()))
 
         elif action == 'leave':
             # UI fordert LEAVE: Nutzer aus Registry entfernen und Abmelde-Broadcast senden
             _, h = cmd
+            local.pop(h, None)
+            if gossip is not None:
+                gossip.leave_local(h)
             registry.pop(h, None)
-            send_update_if_changed()
-            sock.sendto(f"LEAVE {h}\n".encode(),
-                        (BROADCAST_ADDR, whois_port))
\ No newline at end of file
+            notify()
+            sock.sendto(f"LEAVE {h}\n".encode(), group_addr)
+
+    if feed is not None:
+        def on_request(conn, req):
+            # Befehle eines Feed-Clients (UI oder Netzwerkdienst); Antworten nur an ihn
+            with cmd_lock:
+                if req[0] == 'join' and len(req) == 3:
+                    owners.setdefault(conn, set()).add(req[1])
+                elif req[0] == 'leave' and len(req) == 2:
+                    owners.get(conn, set()).discard(req[1])
+                handle_command(req, lambda obj: feed.reply(conn, obj))
+
+        def on_close(conn):
+            # Client ohne LEAVE beendet (z. B. abgestürzt): seine Handles abmelden
+            with cmd_lock:
+                for h in owners.pop(conn, ()):
+                    handle_command(('leave', h), lambda obj: None)
+
+        feed.on_request = on_request
+        feed.on_close = on_close
+
+    if pipe_cmd is None:
+        # Nur Feed-Clients: die Arbeit erledigen Listener- und Feed-Threads
+        threading.Event().wait()
+        return
+
+    # Verarbeite Steuerbefehle von der UI
+    while True:
+        cmd = pipe_cmd.recv()
+        if isinstance(cmd, tuple) and cmd:
+            with cmd_lock:
+                handle_command(cmd, pipe_evt.send)
@@ -7,9 +7,11 @@
 # Es stellt sicher, dass auf jedem Host pro Port nur eine Instanz des Discovery-Moduls läuft.
 # Dies wird durch ein Lockfile im temporären Verzeichnis realisiert.
 #
-# Nach dem Start öffnet der Dienst einen IPC-Listener zur Kommunikation mit der Benutzeroberfläche.
-# Sobald die Verbindung zur UI steht, wird der Discovery-Service gestartet, der sich um die
-# Broadcast-basierte Teilnehmererkennung im lokalen Netzwerk kümmert.
+# Nach dem Start öffnet der Dienst einen IPC-Listener und startet sofort den Discovery-Service,
+# der sich um die Teilnehmererkennung im lokalen Netzwerk kümmert. Beliebig viele Clients
+# (UIs mehrerer Nutzer, Network-Services) können sich verbinden: Alle teilen sich Registry und
+# UDP-Socket, jeder erhält Registry-Änderungen über einen RegistryFeed und kann Befehle
+# (join, leave, who, whois, sync) schicken. Trennt sich eine UI, werden ihre Handles abgemeldet.
 #
 # @usage
 #   python3 discovery_main.py <config.toml> [ipc_port]
@@ -17,17 +19,20 @@
 # @section Komponenten
 # - *Config*: Lädt Benutzer- und Netzwerkparameter aus einer TOML-Datei.
 # - *run_discovery_service*: Discovery-Funktion aus dem discovery-Modul.
-# - *Listener*: Stellt IPC-Verbindung zur Benutzeroberfläche (UI) her.
+# - *Listener*: Nimmt IPC-Verbindungen von UIs und Network-Services an.
 #
-# @note Der Dienst sollte pro Gerät und Port nur einmal gestartet werden.
+# @note Der Dienst sollte pro Gerät und Port nur einmal gestartet werden; weitere Clients auf
+# demselben Host verbinden sich mit der laufenden Instanz.
 #
 # @author Ismet Algül, Aysenur Algül, Enes Kurutay, Ugur Can, Nasratullah Ahmadzai
 # @date Juni 2025
 
 import sys
+import threading
 from config import Config
-from discovery import run_discovery_service
-from multiprocessing.connection import Listener
+from discovery import RegistryFeed, run_discovery_service
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
 import os
 
 if __name__ == "__main__":
@@ -50,23 +55,50 @@ if __name__ == "__main__":
     # Lockfile-Pfad für Singleton-Prüfung
     lockfile = f"/tmp/chat_discovery_{ipc_port}.lock"
 
+    address = ('localhost', ipc_port)
+
     # Singleton-Mechanismus: Lockfile anlegen, Fehler bei existierendem File
     try:
         fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_RDWR)
     except FileExistsError:
-        # Wenn Lockfile bereits existiert, läuft ein Discovery bereits
-        print(f"Discovery auf Port {ipc_port} läuft bereits.")
-        sys.exit(1)
+        try:
+            Client(address, authkey=b'ipc_secret').close()
+        except OSError:
+            # Niemand lauscht: Lockfile eines abgestürzten Dienstes, übernehmen
+            os.unlink(lockfile)
+            fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_RDWR)
+        else:
+            # Wenn Lockfile bereits existiert, läuft ein Discovery bereits
+            print(f"Discovery auf Port {ipc_port} läuft bereits, Clients verbinden sich dorthin.")
+            sys.exit(1)
 
-    # IPC-Server für UI: Listener auf der angegebenen Adresse
-    address = ('localhost', ipc_port)
+    # IPC-Server für UIs und Network-Services
     with Listener(address, authkey=b'ipc_secret') as listener:
         print(f"[Discovery] IPC-Listener auf {address}")
-        # Warte auf UI-Verbindung via IPC
-        conn = listener.accept()
-        print("[Discovery] UI verbunden, starte Service …")
-        # Starte Discovery-Dienst, verwendet dieselbe Pipe für Commands und Events
-        run_discovery_service(conn, conn, config)
+        feed = RegistryFeed()
+        stopped = threading.Event()
+
+        def accept_clients():
+            # Jede Verbindung (UI oder Network-Service) wird Abonnent mit Befehlskanal
+            while True:
+                try:
+                    conn = listener.accept()
+                except (EOFError, AuthenticationError, OSError) as e:
+                    if stopped.is_set():
+                        # Listener wurde geschlossen
+                        return
+                    # Abgebrochener Handshake oder falscher Schlüssel: nur diesen Client verwerfen
+                    print(f"[Discovery] Verbindungsaufbau fehlgeschlagen: {e!r}")
+                    continue
+                feed.add(conn)
+                print("[Discovery] Client verbunden")
+
+        threading.Thread(target=accept_clients, daemon=True).start()
+        # Starte Discovery-Dienst; alle Clients laufen über den Feed
+        try:
+            run_discovery_service(None, None, config, feed)
+        finally:
+            stopped.set()
 
     # Beim Beenden Lockfile schließen und entfernen
     os.close(fd)
@@ -21,7 +21,7 @@ import time
 import sys
 import os
 from config import Config
-from discovery import run_discovery_service
+from discovery import apply_delta, run_discovery_service
 from network import run_network_service
 from PIL import Image, ImageTk
 
@@ -57,10 +57,13 @@ class ChatClientGUI:
         net_send, self.net_evt = multiprocessing.Pipe()
         self.disc_cmd, disc_recv = multiprocessing.Pipe()
         disc_send, self.disc_evt = multiprocessing.Pipe()
+        # Discovery ↔ Network: Registry direkt und WHOIS-Anfragen, die GUI adressiert Empfänger
+        # nur per Handle
+        reg_recv, reg_send = multiprocessing.Pipe()
 
         self.disc_proc = multiprocessing.Process(
             target=run_discovery_service,
-            args=(disc_recv, disc_send, self.config),
+            args=(disc_recv, disc_send, self.config, reg_send),
             daemon=True
         )
         self.disc_proc.start()
@@ -68,7 +71,7 @@ class ChatClientGUI:
 
         self.net_proc = multiprocessing.Process(
             target=run_network_service,
-            args=(net_recv, net_send, self.config),
+            args=(net_recv, net_send, self.config, reg_recv),
             daemon=True
         )
         self.net_proc.start()
@@ -156,10 +159,9 @@ class ChatClientGUI:
             try:
                 self.disc_cmd.send(("leave", self.handle))
                 self.display_message("System", "Du hast den Chat verlassen.")
-                for h, (ip, port) in self.peers.items():
-                    if h != self.handle:
-                        self.net_cmd.send(("send_msg", "System", h,
-                                           f"{self.handle} hat den Chat verlassen.", ip, port))
+                self.net_cmd.send(("send_many", "System",
+                                   f"{self.handle} hat den Chat verlassen.", self._other_peers()))
+                self.net_cmd.send(("leave",))
             except Exception:
                 pass
             self.entry_text.config(state=tk.DISABLED)
@@ -171,10 +173,8 @@ class ChatClientGUI:
             try:
                 self.disc_cmd.send(("join", self.handle, self.config.port_range[0]))
                 self.display_message("System", "Du bist dem Chat beigetreten.")
-                for h, (ip, port) in self.peers.items():
-                    if h != self.handle:
-                        self.net_cmd.send(("send_msg", "System", h,
-                                           f"{self.handle} ist dem Chat beigetreten.", ip, port))
+                self.net_cmd.send(("send_many", "System",
+                                   f"{self.handle} ist dem Chat beigetreten.", self._other_peers()))
             except Exception:
                 pass
             self.entry_text.config(state=tk.NORMAL)
@@ -183,6 +183,12 @@ class ChatClientGUI:
             self.chat_toggle_btn.config(text="Leave")
             self.in_chat = True
 
+    def _other_peers(self) -> list:
+        """
+        @brief Liefert die Handles aller bekannten Peers außer uns selbst für send_many.
+        """
+        return [h for h in self.peers if h != self.handle]
+
     def toggle_afk(self) -> None:
         """
         @brief Aktiviert oder deaktiviert den Abwesenheitsmodus (AFK).
@@ -245,16 +251,29 @@ class ChatClientGUI:
     def disc_listener(self) -> None:
         """
         @brief Reagiert auf Änderungen der Discovery-Teilnehmerliste.
+        @details Deltas werden direkt auf die Peer-Anzeige angewendet; nur bei einer Lücke in
+                 den Generationen wird ein Snapshot angefordert und die Liste neu aufgebaut.
         """
-        last = {}
+        gen = 0
+        resyncing = False
         while not self.stop_event.is_set():
             evt = self.disc_evt.recv()
             if evt[0] == "users":
-                users = evt[1]
-                if users != last:
-                    last = users.copy()
-                    self.peers = users
-                    self.update_peer_list()
+                self.peers = dict(evt[1])
+                gen = evt[2] if len(evt) > 2 else gen
+                resyncing = False
+                self.update_peer_list()
+            elif evt[0] == "delta":
+                _, g, added, removed, changed = evt
+                if resyncing:
+                    continue
+                if g != gen + 1:
+                    resyncing = True
+                    self.disc_cmd.send(("sync",))
+                    continue
+                gen = g
+                apply_delta(self.peers, added, removed, changed)
+                self._update_peer_rows(added, removed, changed)
 
     def net_listener(self) -> None:
         """
@@ -266,12 +285,30 @@ class ChatClientGUI:
             if evt[0] == "msg":
                 _, sender, text = evt
                 if sender != self.handle:
-                    if self.afk_mode:
-                        ip, port = self.peers.get(sender, (None, None))
-                        if ip and port:
-                            self.net_cmd.send(("send_msg", self.handle, sender, self.autoreply_text, ip, port))
+                    if self.afk_mode and sender in self.peers:
+                        self.net_cmd.send(("send_msg", self.handle, sender, self.autoreply_text))
                     # Nachricht immer anzeigen – egal ob AFK oder nicht
                     self.display_message(sender, text)
+            elif evt[0] == "outbox":
+                _, to, left = evt
+                if left:
+                    self.display_message("System", f"{to} nicht erreichbar – {left} Nachricht(en) zwischengespeichert.")
+                else:
+                    self.display_message("System", f"Zwischengespeicherte Nachrichten an {to} zugestellt.")
+            elif evt[0] == "delivered":
+                _, to, _, rtt = evt
+                self.display_message("System", f"✓ zugestellt an {to} ({rtt:.0f} ms)")
+            elif evt[0] == "undelivered":
+                _, to, text, reason = evt
+                self.display_message("System", f"✗ nicht bestätigt von {to} ({reason}): {text}")
+            elif evt[0] == "queue_full":
+                _, to, _ = evt
+                self.display_message("System", f"Warteschlange für {to} voll – nicht gesendet.")
+            elif evt[0] == "send_many":
+                _, text, results = evt
+                failed = [h for h, err in results.items() if err]
+                if failed:
+                    self.display_message("System", f"Nicht zugestellt an: {', '.join(failed)}")
             elif evt[0] == "img":
                 _, sender, path = evt
                 if sender != self.handle:
@@ -290,6 +327,26 @@ class ChatClientGUI:
             tags = (tag,) if tag else ()
             self.peer_list.insert("", tk.END, iid=h, values=(ip, pr, h), tags=tags)
 
+    def _update_peer_rows(self, added: dict, removed: list, changed: dict) -> None:
+        """
+        @brief Übernimmt ein Registry-Delta in die Peer-Anzeige, ohne die Liste neu aufzubauen.
+        """
+        for h in removed:
+            if self.peer_list.exists(h):
+                self.peer_list.delete(h)
+        for h, (ip, pr) in changed.items():
+            if self.peer_list.exists(h):
+                self.peer_list.item(h, values=(ip, pr, h))
+            else:
+                added = {**added, h: (ip, pr)}
+        for h, (ip, pr) in added.items():
+            tag = h.lower() if h.lower() in self.handle_colors else None
+            tags = (tag,) if tag else ()
+            if self.peer_list.exists(h):
+                self.peer_list.item(h, values=(ip, pr, h))
+            else:
+                self.peer_list.insert("", tk.END, iid=h, values=(ip, pr, h), tags=tags)
+
     def display_message(self, sender: str, text: str) -> None:
         """
         @brief Zeigt eine Textnachricht im Chatfenster an.
@@ -345,8 +402,7 @@ class ChatClientGUI:
         text = self.entry_text.get().strip()
         if not text:
             return
-        ip, port = self.peers[target]
-        self.net_cmd.send(("send_msg", self.handle, target, text, ip, port))
+        self.net_cmd.send(("send_msg", self.handle, target, text))
         self.display_message(self.handle, text)
         self.entry_text.delete(0, tk.END)
 
@@ -357,9 +413,7 @@ class ChatClientGUI:
         text = self.entry_text.get().strip()
         if not text:
             return
-        for target, (ip, port) in self.peers.items():
-            if target != self.handle:
-                self.net_cmd.send(("send_msg", self.handle, target, text, ip, port))
+        self.net_cmd.send(("send_many", self.handle, text, self._other_peers()))
         self.display_message(self.handle, f"[an alle] {text}")
         self.entry_text.delete(0, tk.END)
 
@@ -378,8 +432,7 @@ class ChatClientGUI:
         )
         if not path:
             return
-        ip, port = self.peers[target]
-        self.net_cmd.send(("send_img", self.handle, target, path, ip, port))
+        self.net_cmd.send(("send_img", self.handle, target, path))
         self.display_image(self.handle, path)
 
     def on_close(self) -> None:
@@ -390,12 +443,9 @@ class ChatClientGUI:
         """
         try:
             self.disc_cmd.send(("leave", self.handle))
-            for h, (ip, port) in self.peers.items():
-                if h != self.handle:
-                    self.net_cmd.send(
-                        ("send_msg", "System", h,
-                         f"{self.handle} hat den Chat verlassen (Programm beendet).", ip, port)
-                    )
+            self.net_cmd.send(("send_many", "System",
+                               f"{self.handle} hat den Chat verlassen (Programm beendet).",
+                               self._other_peers()))
             time.sleep(0.2)
         except Exception:
             pass
@@ -29,12 +29,13 @@ def main():
     net_send, net_evt   = multiprocessing.Pipe()  # Network → UI: liefert Events zurück
     disc_cmd, disc_recv = multiprocessing.Pipe()  # UI → Discovery: JOIN/WHO/LEAVE
     disc_send, disc_evt = multiprocessing.Pipe()  # Discovery → UI: liefert Nutzerlisten-Updates
+    reg_recv, reg_send  = multiprocessing.Pipe()  # Discovery ↔ Network: Registry direkt, WHOIS-Anfragen
 
     # 1) Discovery-Dienst starten:
     #    Verantwortlich für Broadcast-basierte Teilnehmererkennung und Registry-Pflege.
     disc_proc = multiprocessing.Process(
         target=run_discovery_service,
-        args=(disc_recv, disc_send, config),
+        args=(disc_recv, disc_send, config, reg_send),
         daemon=True  # läuft im Hintergrund und wird beim Hauptprozess-Ende automatisch beendet
     )
     disc_proc.start()
@@ -46,7 +47,7 @@ def main():
     #    Verantwortlich für TCP-Verbindungen (MSG) und UDP-Bildübertragungen (IMG).
     net_proc = multiprocessing.Process(
         target=run_network_service,
-        args=(net_recv, net_send, config),
+        args=(net_recv, net_send, config, reg_recv),
         daemon=True  # Hintergrundprozess für Nachrichtenversand und -empfang
     )
     net_proc.start()
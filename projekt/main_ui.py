@@ -17,6 +17,7 @@
 # @see Config
 
 import sys
+from pathlib import Path
 from config import Config
 from ui import run_ui
 from multiprocessing.connection import Client
@@ -48,6 +49,8 @@ if __name__ == "__main__":
     net_addr  = ('localhost', net_port)
     net_conn  = Client(net_addr, authkey=b'ipc_secret')
     print(f"[UI] Mit Network verbunden an {net_addr}")
+    # Beim (ggf. von mehreren Handles geteilten) Network-Service mit eigener Config anmelden
+    net_conn.send(("hello", str(Path(config.path).resolve())))
 
     # Starte die Kommandozeilen-Oberfläche und übergebe beide Verbindungen
     run_ui(net_conn, net_conn, disc_conn, disc_conn, config)
\ No newline at end of file
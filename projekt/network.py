@@ -2,55 +2,952 @@
 ## @brief Netzwerkdienst: SLCP-Nachrichten (MSG, IMG) über TCP/UDP senden und empfangen.
 ##
 ## Dieses Modul implementiert einen TCP-Server (für Textnachrichten)
-## und einen UDP-Server (für Bilddaten), die in getrennten Threads laufen.
+## und einen UDP-Server (für Bilddaten). Je nach Konfiguration (`engine`) laufen diese
+## in getrennten Threads oder gemeinsam in einer selectors-basierten Event-Loop.
+## Die Event-Loop (SessionHub) kann mehrere Handles gleichzeitig bedienen; jede Sitzung
+## hat eigene Empfangsports, Verbindungspool und Sende-Warteschlangen sind gemeinsam.
 ## Es stellt Funktionen zum Empfangen und Senden von SLCP-Nachrichten bereit.
 
 from pathlib import Path
+import ipaddress
+import mmap
+import os
+import random
+import selectors
 import socket
+import struct
 import threading
+import tempfile
 import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from discovery import apply_delta
+from outbox import Outbox
 
 # Maximale UDP-Chunksize für Bilddaten
 _CHUNK_SIZE = 60000
+# Kopf jedes Bild-Chunks: Magic, Transfer-ID, Sequenznummer, Gesamtgröße
+_IMG_MAGIC = b"IMGC"
+_IMG_CHUNK = struct.Struct("!4sIII")
+# Sekunden ohne Datagramm, nach denen eine Bildübertragung verworfen wird
+_IMG_SESSION_TIMEOUT = 30
+# Schutz gegen Speicherüberlauf durch fremde oder defekte Sender
+_MAX_IMAGE_SIZE = 64 * 1024 * 1024
+_MAX_IMG_SESSIONS = 32
+# Gleichzeitig offene Bildübertragungen pro Absender-IP
+_MAX_IMG_SESSIONS_PER_PEER = 4
+# Empfänger: erste NACK-Verzögerung nach dem letzten Datagramm (verdoppelt sich je Runde)
+_IMG_NACK_DELAY = 0.2
+# Maximale Größe eines NACK-Datagramms; weitere Lücken folgen in der nächsten Runde
+_IMG_NACK_MAX = 1400
+# Sender: Wartezeit auf ACK/NACK, bevor Header und letzter Chunk erneut gesendet werden
+_IMG_ACK_WAIT = 1.0
+# Sender: Anzahl unbeantworteter Nachfragen, bis die Übertragung als gescheitert gilt
+_IMG_MAX_PROBES = 8
+# Empfänger: so viele abgeschlossene Transfers merken, um verspätete Duplikate zu bestätigen
+_IMG_DONE_MEMORY = 64
+# Pacing: Token-Bucket-Tiefe in Bytes (so viel darf ohne Pause am Stück raus)
+_PACE_BURST = 4 * _CHUNK_SIZE
+# Pacing: untere Grenze der adaptiven Senderate in Bytes/s
+_PACE_MIN_RATE = 256 * 1024
+# Maximale Länge einer SLCP-Zeile in Bytes (512 Zeichen UTF-8 + Kopf)
+_MAX_LINE = 4096
+# Größe des wiederverwendeten Empfangspuffers für TCP
+_RECV_BUFSIZE = 65536
+# Timeout für den Verbindungsaufbau zu einem Peer (Sekunden)
+_CONNECT_TIMEOUT = 5
+# Nach so vielen Sekunden ohne Nutzung werden Pool-Verbindungen geschlossen
+_IDLE_TIMEOUT = 60
+# Empfangsseitig: ungenutzte eingehende Verbindungen etwas später schließen als der Sender
+_RECV_IDLE_TIMEOUT = _IDLE_TIMEOUT + 30
+# Standard-Obergrenze gleichzeitiger eingehender TCP-Verbindungen
+_MAX_CONNECTIONS = 256
+# Maximale Anzahl gleichzeitig bedienter Ziele (Worker der Peer-Warteschlangen)
+_PEER_WORKERS = 32
+# Sekunden, nach denen eine unbestätigte Nachricht als nicht zugestellt gemeldet wird
+_ACK_TIMEOUT = 10
+# Gültigkeit zwischengespeicherter Adressauflösungen in Sekunden
+_RESOLVE_TTL = 300
+# Sekunden, nach denen auf eine WHOIS-Antwort wartende Befehle als unzustellbar gelten
+_LOOKUP_TIMEOUT = 5
+# Maximale Anzahl noch nicht an die UI geschriebener Events pro Sitzung
+_EVENT_BACKLOG = 1024
 
-def _handle_tcp(conn, pipe_evt):
+class _FrameReader:
     """
-    @brief Bearbeitet eine eingehende TCP-Verbindung für SLCP-MSG-Nachrichten.
-    @param conn Socket-Objekt für die eingehende TCP-Verbindung.
-    @param pipe_evt Pipe-Objekt zum Senden von Events an den UI-Prozess.
+    @brief Gepufferter Leser für zeilenbasierte SLCP-Frames über einen Stream-Socket.
+    @details Liest mit recv_into in einen wiederverwendeten Puffer und zerlegt den Datenstrom
+             an '\n'. Mehrere Frames pro recv werden nacheinander geliefert, ohne für jedes
+             Byte einen Systemaufruf oder eine Kopie des bisherigen Kopfes zu erzeugen.
+    """
+
+    def __init__(self, sock, max_line: int = _MAX_LINE, bufsize: int = _RECV_BUFSIZE):
+        """
+        @param sock Verbundener Stream-Socket.
+        @param max_line Maximale Länge einer Zeile (ohne '\n') in Bytes.
+        @param bufsize Größe eines einzelnen recv_into-Aufrufs.
+        """
+        self._sock = sock
+        self._max_line = max_line
+        self._chunk = memoryview(bytearray(bufsize))
+        self._buf = bytearray()
+        self._pos = 0      # Leseposition im Puffer
+        self._scan = 0     # ab hier wurde noch nicht nach '\n' gesucht
+        self.eof = False
+
+    def fill(self) -> int:
+        """
+        @brief Liest einmal vom Socket in den Puffer.
+        @return Anzahl gelesener Bytes (0 bei Verbindungsende).
+        """
+        n = self._sock.recv_into(self._chunk)
+        if n == 0:
+            self.eof = True
+            return 0
+        # Verbrauchten Anfang erst entfernen, wenn er den Großteil des Puffers ausmacht
+        if self._pos and self._pos >= len(self._buf) // 2:
+            del self._buf[:self._pos]
+            self._scan -= self._pos
+            self._pos = 0
+        self._buf += self._chunk[:n]
+        return n
+
+    def next_line(self):
+        """
+        @brief Liefert die nächste vollständige Zeile aus dem Puffer, ohne zu lesen.
+        @return Zeile ohne '\n' als bytes oder None, falls noch keine vollständig ist.
+        @raises ValueError wenn eine Zeile _MAX_LINE überschreitet.
+        """
+        idx = self._buf.find(b'\n', self._scan)
+        if idx < 0:
+            self._scan = len(self._buf)
+            if self._scan - self._pos > self._max_line:
+                raise ValueError(f"SLCP-Frame zu lang (> {self._max_line} Bytes)")
+            return None
+        if idx - self._pos > self._max_line:
+            raise ValueError(f"SLCP-Frame zu lang (> {self._max_line} Bytes)")
+        line = bytes(self._buf[self._pos:idx])
+        self._pos = self._scan = idx + 1
+        return line
+
+    def read_line(self):
+        """
+        @brief Blockierend die nächste Zeile lesen.
+        @return Zeile ohne '\n' oder None, wenn die Verbindung geschlossen wurde.
+        """
+        while True:
+            line = self.next_line()
+            if line is not None:
+                return line
+            if not self.fill():
+                return None
+
+    def take(self, n: int) -> bytes:
+        """
+        @brief Entnimmt bis zu n bereits gepufferte Bytes (Rohdaten hinter einem Kopf).
+        """
+        end = min(self._pos + n, len(self._buf))
+        data = bytes(self._buf[self._pos:end])
+        self._pos = end
+        self._scan = max(self._scan, end)
+        return data
+
+    def read_into(self, n: int, sink) -> None:
+        """
+        @brief Blockierend genau n Rohbytes lesen und stückweise an sink übergeben.
+        @details Nach dem Puffer-Rest wird direkt in den Empfangspuffer gelesen, ohne die
+                 Daten an den Zeilenpuffer anzuhängen.
+        @param sink Aufrufbar mit einem bytes-ähnlichen Objekt.
+        @raises ConnectionError wenn die Verbindung vorher endet.
+        """
+        if n and (data := self.take(n)):
+            sink(data)
+            n -= len(data)
+        while n:
+            k = self._sock.recv_into(self._chunk, min(n, len(self._chunk)))
+            if not k:
+                raise ConnectionError("Verbindung während Bildübertragung geschlossen")
+            sink(self._chunk[:k])
+            n -= k
+
+def _sock_alive(sock) -> bool:
+    """
+    @brief Prüft ohne zu blockieren, ob eine TCP-Verbindung noch offen ist.
+    @details Auf MSG-Verbindungen sendet der Empfänger höchstens ACK-Frames; Lesbarkeit
+             bedeutet daher entweder ausstehende ACKs (Verbindung offen), EOF (Gegenseite
+             hat geschlossen) oder einen Fehler.
+    @param sock Verbundener Socket.
+    @return True, wenn die Verbindung weiterverwendet werden kann.
     """
     try:
-        header = b''
-        while not header.endswith(b'\n'):
-            c = conn.recv(1)
-            if not c:
+        sock.setblocking(False)
+        try:
+            return sock.recv(1, socket.MSG_PEEK) != b''
+        finally:
+            sock.settimeout(_CONNECT_TIMEOUT)
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+
+class _Resolver:
+    """
+    @brief Cache für Adressauflösungen (getaddrinfo) mit TTL.
+    @details Die Discovery liefert in der Regel literale IPs, dieselben Peers werden aber
+             immer wieder kontaktiert. Literale Adressen werden ohne Resolver-Aufruf in eine
+             sockaddr umgesetzt, Hostnamen einmal aufgelöst und für ttl Sekunden gemerkt.
+             Über seed() wird der Cache aus der Discovery-Registry befüllt; ändert sich die
+             Adresse eines Handles oder verschwindet er, wird der alte Eintrag verworfen.
+    """
+
+    def __init__(self, ttl: float = _RESOLVE_TTL):
+        """
+        @param ttl Sekunden, die ein Eintrag gültig bleibt.
+        """
+        self.ttl = ttl
+        self._cache: dict[tuple[str, int], tuple[float, list]] = {}
+        self._handles: dict[str, tuple[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _literal(ip: str, port: int):
+        """
+        @brief Setzt eine literale IPv4-/IPv6-Adresse direkt in Adressinformationen um.
+        @return Liste von (family, type, proto, sockaddr) oder None bei einem Hostnamen.
+        """
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if addr.version == 6:
+            return [(socket.AF_INET6, socket.SOCK_STREAM, 0, (ip, port, 0, 0))]
+        return [(socket.AF_INET, socket.SOCK_STREAM, 0, (ip, port))]
+
+    def resolve(self, ip: str, port: int) -> list:
+        """
+        @brief Liefert die Adressen für (ip, port), bei Bedarf per getaddrinfo aufgelöst.
+        @return Liste von (family, type, proto, sockaddr).
+        @raises OSError (socket.gaierror) wenn der Name nicht aufgelöst werden kann.
+        """
+        key = (ip, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        infos = self._literal(ip, port)
+        if infos is None:
+            infos = [(af, socktype, proto, sockaddr) for af, socktype, proto, _, sockaddr in
+                     socket.getaddrinfo(ip, port, family=socket.AF_UNSPEC, type=socket.SOCK_STREAM)]
+        with self._lock:
+            self._cache[key] = (now + self.ttl, infos)
+        return infos
+
+    def invalidate(self, ip: str, port: int) -> None:
+        """
+        @brief Verwirft den Eintrag für (ip, port), z. B. nachdem keine Adresse erreichbar war.
+        """
+        with self._lock:
+            self._cache.pop((ip, port), None)
+
+    def seed(self, users: dict) -> None:
+        """
+        @brief Gleicht den Cache mit der Discovery-Registry ab.
+        @details Literale Adressen werden sofort eingetragen; Einträge von Handles, deren
+                 Adresse sich geändert hat oder die verschwunden sind, werden verworfen.
+        @param users Dict Handle → (ip, port).
+        """
+        handles = {h: (ip, int(port)) for h, (ip, port) in users.items()}
+        now = time.monotonic()
+        with self._lock:
+            current = set(handles.values())
+            for h, key in self._handles.items():
+                if handles.get(h) != key and key not in current:
+                    self._cache.pop(key, None)
+            for key in current:
+                infos = self._literal(*key)
+                if infos is not None and key not in self._cache:
+                    self._cache[key] = (now + self.ttl, infos)
+            self._handles = handles
+
+    def update(self, updated: dict, removed) -> None:
+        """
+        @brief Wendet ein Registry-Delta auf den Cache an; Aufwand proportional zum Delta.
+        @param updated Neue oder umgezogene Handles, Handle → (ip, port).
+        @param removed Entfernte Handles.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for h in [*removed, *updated]:
+                old = self._handles.pop(h, None)
+                if old is not None and old != updated.get(h):
+                    self._cache.pop(old, None)
+            for h, key in updated.items():
+                self._handles[h] = key
+                infos = self._literal(*key)
+                if infos is not None and key not in self._cache:
+                    self._cache[key] = (now + self.ttl, infos)
+
+class _ConnectionPool:
+    """
+    @brief Pool persistenter TCP-Verbindungen zu Peers, Schlüssel ist (ip, port).
+    @details Verbindungen werden für send() ausgeliehen und danach zurückgelegt, sodass
+             der Reaper-Thread nur unbenutzte Sockets schließt. Defekte Verbindungen werden
+             verworfen und einmalig neu aufgebaut.
+    """
+
+    def __init__(self, idle_timeout: float = _IDLE_TIMEOUT, resolver: _Resolver = None):
+        """
+        @param idle_timeout Sekunden, nach denen eine unbenutzte Verbindung geschlossen wird.
+        @param resolver Cache für Adressauflösungen (Standard: eigener _Resolver).
+        """
+        self.idle_timeout = idle_timeout
+        self.resolver = resolver or _Resolver()
+        self._idle: dict[tuple[str, int], tuple[socket.socket, float]] = {}
+        self._lock = threading.Lock()
+        # Übernimmt das Schließen aufgegebener Verbindungen (z. B. _AckTracker.release)
+        self.on_close = None
+
+    def _discard(self, sock) -> None:
+        """
+        @brief Gibt eine Verbindung des Pools auf.
+        @details Ist on_close gesetzt, wird die Verbindung dorthin übergeben und von dort
+                 geschlossen; sonst wird sie sofort geschlossen.
+        """
+        if self.on_close is not None:
+            self.on_close(sock)
+        else:
+            sock.close()
+
+    def _connect(self, ip: str, port: int) -> socket.socket:
+        """
+        @brief Baut eine neue Verbindung auf und probiert dabei alle aufgelösten Adressen aus.
+        @raises OSError wenn keine Adresse erreichbar ist.
+        """
+        last_err = None
+        for af, socktype, proto, sockaddr in self.resolver.resolve(ip, port):
+            s = socket.socket(af, socktype, proto)
+            try:
+                s.settimeout(_CONNECT_TIMEOUT)
+                s.connect(sockaddr)
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                return s
+            except OSError as e:
+                s.close()
+                last_err = e
+        # Beim nächsten Versuch neu auflösen, falls sich die Adresse geändert hat
+        self.resolver.invalidate(ip, port)
+        raise last_err or OSError(f"keine Adresse für {ip}:{port}")
+
+    def _checkout(self, key):
+        """
+        @brief Entnimmt eine noch offene Leerlauf-Verbindung oder liefert None.
+        """
+        with self._lock:
+            entry = self._idle.pop(key, None)
+        if entry is None:
+            return None
+        sock = entry[0]
+        if _sock_alive(sock):
+            return sock
+        self._discard(sock)
+        return None
+
+    def _checkin(self, key, sock) -> None:
+        """
+        @brief Legt eine Verbindung zurück; eine parallel entstandene wird geschlossen.
+        """
+        with self._lock:
+            old = self._idle.get(key)
+            self._idle[key] = (sock, time.monotonic())
+        if old is not None and old[0] is not sock:
+            self._discard(old[0])
+
+    def run(self, ip: str, port: int, fn) -> None:
+        """
+        @brief Führt fn(sock) mit einer gepoolten Verbindung zu (ip, port) aus.
+        @details Schlägt fn auf einer wiederverwendeten Verbindung fehl, wird genau einmal
+                 neu verbunden und fn wiederholt; fn muss daher vollständig neu beginnen können.
+        @raises OSError wenn der Peer nicht erreichbar ist.
+        """
+        key = (ip, int(port))
+        sock = self._checkout(key)
+        if sock is not None:
+            try:
+                fn(sock)
+                self._checkin(key, sock)
                 return
-            header += c
+            except OSError:
+                self._discard(sock)
+        sock = self._connect(ip, int(port))
+        try:
+            fn(sock)
+        except OSError:
+            self._discard(sock)
+            raise
+        self._checkin(key, sock)
+
+    def send(self, ip: str, port: int, data: bytes) -> None:
+        """
+        @brief Sendet Daten über eine gepoolte Verbindung zu (ip, port).
+        @raises OSError wenn der Peer nicht erreichbar ist.
+        """
+        self.run(ip, port, lambda sock: sock.sendall(data))
+
+    def close(self, key) -> None:
+        """
+        @brief Schließt die Leerlauf-Verbindung zu einem Peer, falls vorhanden.
+        """
+        with self._lock:
+            entry = self._idle.pop(key, None)
+        if entry is not None:
+            self._discard(entry[0])
+
+    def close_all(self) -> None:
+        """
+        @brief Schließt alle Leerlauf-Verbindungen (z. B. bei LEAVE).
+        """
+        with self._lock:
+            entries, self._idle = list(self._idle.values()), {}
+        for sock, _ in entries:
+            self._discard(sock)
+
+    def retain(self, keys) -> None:
+        """
+        @brief Schließt alle Verbindungen zu Peers, die nicht mehr in keys enthalten sind.
+        @param keys Menge aktueller (ip, port)-Paare aus der Discovery-Registry.
+        """
+        keys = {(ip, int(port)) for ip, port in keys}
+        for key in [k for k in list(self._idle) if k not in keys]:
+            self.close(key)
+
+    def reap(self) -> None:
+        """
+        @brief Schließt Verbindungen, die länger als idle_timeout unbenutzt sind.
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            stale = [k for k, (_, t) in self._idle.items() if t < deadline]
+            entries = [self._idle.pop(k) for k in stale]
+        for sock, _ in entries:
+            self._discard(sock)
+
+    def reap_loop(self) -> None:
+        """
+        @brief Hintergrund-Thread: ruft periodisch reap() auf.
+        """
+        while True:
+            time.sleep(max(1.0, self.idle_timeout / 4))
+            self.reap()
+
+def _dispatch_line(line: bytes, pipe_evt, ctx: dict):
+    """
+    @brief Wertet eine einzelne SLCP-Zeile aus und leitet sie als Event an die UI weiter.
+    @details `ID <n>` kündigt an, dass die unmittelbar folgende MSG bestätigt werden soll;
+             nach der Übergabe an die UI wird `ACK <n>` als Antwort geliefert. Alte
+             Empfänger verstehen die ID-Zeile nicht und schließen die Verbindung, die
+             MSG geht dann verloren; msg_ack ist deshalb standardmäßig aus.
+             `MSGS <handle> <n>` ist ein Sammel-Frame: die folgenden n Zeilen sind je ein
+             Nachrichtentext und werden einzeln als ("msg", ...) gemeldet, auch wenn sie wie
+             ein Steuer-Frame (z. B. `IMG ...`) aussehen; ein vorangestelltes ID gilt für den
+             ganzen Frame. Aufrufer dürfen solche Zeilen daher nicht selbst auswerten,
+             solange ctx einen offenen Sammel-Frame enthält.
+    @param line Zeile ohne abschließendes '\n'.
+    @param pipe_evt Pipe zum Senden von Events an den UI-Prozess.
+    @param ctx Zustand der Verbindung (angekündigte Nachrichten-ID, offener Sammel-Frame).
+    @return Zu sendende Antwort (ACK-Frame) oder None.
+    """
+    batch = ctx.get('batch')
+    if batch is not None:
+        sender, left = batch
+        pipe_evt.send(("msg", sender, line.decode().strip()))
+        if left > 1:
+            ctx['batch'] = (sender, left - 1)
+            return None
+        del ctx['batch']
+        msg_id = ctx.pop('id', None)
+        return f"ACK {msg_id}\n".encode() if msg_id is not None else None
+
+    parts = line.decode().strip().split(" ", 2)
+    cmd, sender = parts[0], parts[1] if len(parts) > 1 else ''
+    msg_id = ctx.pop('id', None)
+    if cmd == 'ID':
+        ctx['id'] = sender
+    elif cmd == 'MSG':
+        text = parts[2] if len(parts) > 2 else ''
+        pipe_evt.send(("msg", sender, text))
+        if msg_id is not None:
+            return f"ACK {msg_id}\n".encode()
+    elif cmd == 'MSGS' and len(parts) > 2 and parts[2].isdigit() and int(parts[2]):
+        ctx['batch'] = (sender, int(parts[2]))
+        if msg_id is not None:
+            ctx['id'] = msg_id
+    return None
 
-        parts = header.decode().strip().split(" ", 2)
-        cmd, sender = parts[0], parts[1] if len(parts) > 1 else ''
-        if cmd == 'MSG':
-            text = parts[2] if len(parts) > 2 else ''
-            pipe_evt.send(("msg", sender, text))
+def _handle_tcp(conn, pipe_evt, image_dir):
+    """
+    @brief Bearbeitet eine eingehende TCP-Verbindung für SLCP-MSG- und SLCP-IMG-Frames.
+    @details Liest über einen gepufferten _FrameReader beliebig viele aufeinanderfolgende
+             Frames, bis die Gegenseite die Verbindung schließt. Auf `IMG <handle> <size>`
+             folgen size Rohbytes, die direkt ins Bildverzeichnis gestreamt werden.
+             ACKs werden gesammelt und erst gesendet, wenn der Puffer abgearbeitet ist, sodass
+             ein Burst gepipelineter Nachrichten mit einem einzigen send bestätigt wird.
+    @param conn Socket-Objekt für die eingehende TCP-Verbindung.
+    @param pipe_evt Pipe-Objekt zum Senden von Events an den UI-Prozess.
+    @param image_dir Verzeichnis zur Speicherung empfangener Bilder.
+    """
+    stream = None
+    try:
+        # Langlebige Verbindungen aus dem Sender-Pool: erst nach längerer Ruhe schließen
+        conn.settimeout(_RECV_IDLE_TIMEOUT)
+        reader = _FrameReader(conn)
+        ctx = {}
+        acks = []
+        while True:
+            line = reader.next_line()
+            if line is None:
+                if acks:
+                    conn.sendall(b"".join(acks))
+                    acks.clear()
+                if not reader.fill():
+                    return
+            elif line.startswith(b"IMG ") and 'batch' not in ctx:
+                # Zeilen eines offenen MSGS-Frames sind Nachrichtentext, nie ein IMG-Header
+                stream = _StreamImage.from_header(line, image_dir)
+                reader.read_into(stream.remaining, stream.feed)
+                pipe_evt.send(("img", stream.sender, stream.finish()))
+                stream = None
+            elif (reply := _dispatch_line(line, pipe_evt, ctx)) is not None:
+                acks.append(reply)
+    except (socket.timeout, ConnectionResetError):
+        pass
     except Exception as e:
         pipe_evt.send(("error", f"net handle_tcp: {e}"))
     finally:
+        if stream is not None:
+            stream.discard()
         conn.close()
 
-def _tcp_listener(server_socket, pipe_evt):
+def _drain_frames(reader: _FrameReader, state: list, pipe_evt, image_dir) -> bytes:
+    """
+    @brief Verarbeitet alle vollständig gepufferten Frames einer nicht-blockierenden Verbindung.
+    @param reader FrameReader der Verbindung.
+    @param state Verbindungszustand der Event-Loop; state[2] ist ein laufender _StreamImage,
+           state[3] der Kontext für _dispatch_line.
+    @param pipe_evt Pipe zum Senden von Events an den UI-Prozess.
+    @param image_dir Verzeichnis zur Speicherung empfangener Bilder.
+    @return Gesammelte ACK-Frames, die an die Gegenseite zurückgehen.
+    """
+    acks = bytearray()
+    while True:
+        stream = state[2]
+        if stream is not None:
+            if stream.remaining:
+                data = reader.take(stream.remaining)
+                if not data:
+                    return bytes(acks)
+                stream.feed(data)
+            if not stream.remaining:
+                state[2] = None
+                pipe_evt.send(("img", stream.sender, stream.finish()))
+            continue
+        line = reader.next_line()
+        if line is None:
+            return bytes(acks)
+        if line.startswith(b"IMG ") and 'batch' not in state[3]:
+            # Zeilen eines offenen MSGS-Frames sind Nachrichtentext, nie ein IMG-Header
+            state[2] = _StreamImage.from_header(line, image_dir)
+        elif (reply := _dispatch_line(line, pipe_evt, state[3])) is not None:
+            acks += reply
+
+def _tcp_listener(server_socket, pipe_evt, image_dir, max_conns: int = _MAX_CONNECTIONS):
     """
     @brief Wartet auf TCP-Verbindungen und startet jeweils einen neuen Thread zur Verarbeitung.
+    @details Die Anzahl gleichzeitig bedienter Verbindungen ist durch max_conns begrenzt;
+             ist das Limit erreicht, wird erst wieder akzeptiert, wenn eine Verbindung endet.
     @param server_socket Vorab gebundener TCP-Server-Socket.
     @param pipe_evt Pipe zum Senden von Events an den UI-Prozess.
+    @param image_dir Verzeichnis zur Speicherung empfangener Bilder.
+    @param max_conns Maximale Anzahl gleichzeitiger eingehender Verbindungen.
     """
+    slots = threading.BoundedSemaphore(max_conns)
+
+    def serve(conn):
+        try:
+            _handle_tcp(conn, pipe_evt, image_dir)
+        finally:
+            slots.release()
+
     while True:
+        slots.acquire()
         conn, _ = server_socket.accept()
         threading.Thread(
-            target=_handle_tcp,
-            args=(conn, pipe_evt),
+            target=serve,
+            args=(conn,),
             daemon=True
         ).start()
 
+class _ImageSession:
+    """
+    @brief Zustand einer einzelnen eingehenden Bildübertragung.
+    @details Die Nutzdaten landen nicht im Speicher, sondern direkt in einer Teildatei im
+             Bildverzeichnis. Sie wird nur dünn (sparse) auf die angekündigte Größe gesetzt,
+             Plattenplatz belegen erst die tatsächlich empfangenen Chunks; ein gefälschter
+             Header reserviert so keinen Speicher. Jeder Chunk wird per pwrite an seinen
+             Offset geschrieben; der Speicherbedarf ist damit unabhängig von der Bildgröße. Erst das vollständige Bild wird per os.replace atomar umbenannt.
+    """
+
+    def __init__(self, size: int, image_dir: Path):
+        """
+        @param size Angekündigte Gesamtgröße des Bildes in Bytes.
+        @param image_dir Verzeichnis, in dem Teildatei und fertiges Bild liegen.
+        """
+        self.size = size
+        self.sender = None                     # bekannt, sobald der IMG-Header ankam
+        fd, tmp = tempfile.mkstemp(prefix=".img_", suffix=".part", dir=image_dir)
+        self.fd = fd
+        self.tmp_path = tmp
+        try:
+            if size:
+                os.ftruncate(fd, size)
+        except BaseException:
+            # Keine halb angelegte Sitzung zurücklassen (offener Deskriptor, Teildatei)
+            self.discard()
+            raise
+        self.nchunks = max(1, -(-size // _CHUNK_SIZE))
+        self.received: set[int] = set()
+        self.crc = None                        # CRC32 über das ganze Bild, falls angekündigt
+        self.legacy_len = 0                    # Füllstand bei Übertragungen ohne Chunk-Header
+        self.last_seen = time.monotonic()
+        self.nack_delay = _IMG_NACK_DELAY
+        self.last_nack = 0.0
+
+    def missing_ranges(self) -> list[str]:
+        """
+        @brief Fasst fehlende Sequenznummern zu Bereichen "a-b" bzw. "a" zusammen.
+        """
+        ranges = []
+        start = None
+        for seq in range(self.nchunks + 1):
+            missing = seq < self.nchunks and seq not in self.received
+            if missing and start is None:
+                start = seq
+            elif not missing and start is not None:
+                ranges.append(str(start) if start == seq - 1 else f"{start}-{seq - 1}")
+                start = None
+        return ranges
+
+    def complete(self) -> bool:
+        """
+        @brief Prüft, ob Header und alle Chunks angekommen sind.
+        """
+        return self.sender is not None and len(self.received) == self.nchunks
+
+    def write(self, offset: int, data) -> None:
+        """
+        @brief Schreibt Nutzdaten an ihren Offset in der Teildatei.
+        """
+        if hasattr(os, "pwrite"):
+            os.pwrite(self.fd, data, offset)
+        else:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            os.write(self.fd, data)
+
+    def checksum(self) -> int:
+        """
+        @brief Berechnet die CRC32 der Teildatei blockweise.
+        """
+        crc = 0
+        with open(self.fd, "rb", closefd=False) as f:
+            f.seek(0)
+            while block := f.read(1 << 20):
+                crc = zlib.crc32(block, crc)
+        return crc
+
+    def finish(self, dest: Path) -> None:
+        """
+        @brief Schließt die Teildatei und benennt sie atomar in dest um.
+        """
+        os.close(self.fd)
+        self.fd = None
+        os.replace(self.tmp_path, dest)
+
+    def discard(self) -> None:
+        """
+        @brief Verwirft die Übertragung und löscht die Teildatei.
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        try:
+            os.unlink(self.tmp_path)
+        except OSError:
+            pass
+
+def _image_filename(image_dir: Path, sender: str) -> Path:
+    """
+    @brief Liefert einen freien Dateinamen `<sender>_<zeit>.jpg` im Bildverzeichnis.
+    @details Kommen mehrere Bilder desselben Absenders in derselben Sekunde an,
+             wird ein Zähler angehängt.
+    """
+    stamp = int(time.time())
+    filename = image_dir / f"{sender}_{stamp}.jpg"
+    n = 1
+    while filename.exists():
+        filename = image_dir / f"{sender}_{stamp}_{n}.jpg"
+        n += 1
+    return filename
+
+class _StreamImage:
+    """
+    @brief Ein per TCP (`IMG <handle> <size>` + Rohbytes) eingehendes Bild.
+    @details Schreibt die Bytes fortlaufend in eine _ImageSession-Teildatei.
+    """
+
+    def __init__(self, sender: str, size: int, image_dir: Path):
+        """
+        @param sender Handle des Absenders.
+        @param size Angekündigte Größe in Bytes.
+        @param image_dir Verzeichnis zur Speicherung empfangener Bilder.
+        """
+        self.sender = sender
+        self.remaining = size
+        self._image_dir = image_dir
+        self._offset = 0
+        self._sess = _ImageSession(size, image_dir)
+
+    @classmethod
+    def from_header(cls, line: bytes, image_dir: Path) -> "_StreamImage":
+        """
+        @brief Erzeugt ein _StreamImage aus einer Kopfzeile `IMG <handle> <size>`.
+        @raises ValueError bei ungültigem Kopf oder zu großem Bild.
+        """
+        parts = line.decode().split()
+        if len(parts) != 3:
+            raise ValueError(f"ungültiger IMG-Kopf: {line[:80]!r}")
+        size = int(parts[2])
+        if not 0 <= size <= _MAX_IMAGE_SIZE:
+            raise ValueError(f"Bildgröße unzulässig: {size}")
+        return cls(parts[1], size, image_dir)
+
+    def feed(self, data) -> None:
+        """
+        @brief Schreibt empfangene Rohbytes an die aktuelle Position.
+        """
+        data = data[:self.remaining]
+        self._sess.write(self._offset, data)
+        self._offset += len(data)
+        self.remaining -= len(data)
+
+    def finish(self) -> str:
+        """
+        @brief Verschiebt das vollständige Bild an seinen endgültigen Namen.
+        @return Pfad der fertigen Datei.
+        """
+        filename = _image_filename(self._image_dir, self.sender)
+        self._sess.finish(filename)
+        return str(filename)
+
+    def discard(self) -> None:
+        """
+        @brief Verwirft ein unvollständiges Bild.
+        """
+        self._sess.discard()
+
+class _ImageReceiver:
+    """
+    @brief Setzt per UDP empfangene SLCP-IMG-Übertragungen zusammen.
+    @details Jede Übertragung hat eine eigene Sitzung, Schlüssel ist (Absenderadresse,
+             Transfer-ID). Dadurch laufen Bilder mehrerer Peers parallel, ohne sich zu
+             vermischen. Chunks tragen eine Sequenznummer und werden direkt an ihren
+             Offset geschrieben, Reihenfolge und Header-Zeitpunkt sind also egal.
+             Alte Sender ohne Transfer-ID (`IMG <sender> <size>` + rohe Chunks) werden
+             weiterhin pro Absenderadresse angenommen.
+
+             Zuverlässigkeit: Bleiben bei einer Übertragung mit Transfer-ID Chunks aus,
+             fordert der Empfänger nur die fehlenden Bereiche per `NACK <tid> <a-b,c,...>`
+             an (mit wachsendem Abstand). Ein vollständiges Bild mit passender CRC32 wird
+             mit `ACK <tid>` bestätigt; bei falscher Prüfsumme wird alles neu angefordert.
+    """
+
+    def __init__(self, image_dir: Path, sock=None, timeout: float = _IMG_SESSION_TIMEOUT):
+        """
+        @param image_dir Verzeichnis zur Speicherung empfangener Bilder.
+        @param sock UDP-Socket für ACK/NACK-Antworten (None: keine Antworten).
+        @param timeout Sekunden ohne Datagramm, nach denen eine Sitzung verworfen wird.
+        """
+        self.image_dir = image_dir
+        self.sock = sock
+        self.timeout = timeout
+        self._sessions: dict[tuple, _ImageSession] = {}
+        self._done = deque(maxlen=_IMG_DONE_MEMORY)   # zuletzt abgeschlossene (addr, tid)
+
+    def _reply(self, addr, text: str) -> None:
+        """
+        @brief Sendet eine Steuernachricht (ACK/NACK) an den Sender, Fehler werden ignoriert.
+        """
+        if self.sock is None:
+            return
+        try:
+            self.sock.sendto(text.encode(), addr)
+        except OSError:
+            pass
+
+    def _session(self, key, size: int):
+        """
+        @brief Liefert die Sitzung zu key oder legt sie an, sofern Limits es erlauben.
+        @details Limits: Bildgröße, Sitzungen insgesamt und Sitzungen pro Absender-IP.
+        """
+        sess = self._sessions.get(key)
+        if sess is None:
+            if not 0 <= size <= _MAX_IMAGE_SIZE or len(self._sessions) >= _MAX_IMG_SESSIONS:
+                return None
+            ip = key[0][0]
+            if sum(k[0][0] == ip for k in self._sessions) >= _MAX_IMG_SESSIONS_PER_PEER:
+                # Ein einzelner Absender darf nicht alle Sitzungsplätze belegen
+                return None
+            sess = self._sessions[key] = _ImageSession(size, self.image_dir)
+        sess.last_seen = time.monotonic()
+        return sess
+
+    def feed(self, data: bytes, addr):
+        """
+        @brief Verarbeitet ein empfangenes Datagramm.
+        @param data Inhalt des Datagramms.
+        @param addr Absenderadresse.
+        @return (sender, dateiname) sobald ein Bild vollständig ist, sonst None.
+        """
+        if data.startswith(_IMG_MAGIC):
+            if len(data) < _IMG_CHUNK.size:
+                return None
+            _, tid, seq, size = _IMG_CHUNK.unpack_from(data)
+            key = (addr, tid)
+            if key in self._done:
+                self._reply(addr, f"ACK {tid}")
+                return None
+            sess = self._session(key, size)
+            if sess is None or seq >= sess.nchunks or sess.size != size:
+                return None
+            payload = memoryview(data)[_IMG_CHUNK.size:]
+            off = seq * _CHUNK_SIZE
+            sess.write(off, payload[:sess.size - off])
+            sess.received.add(seq)
+            sess.nack_delay = _IMG_NACK_DELAY
+
+        elif data.startswith(b"IMG "):
+            header, _, rest = data.partition(b'\n')
+            parts = header.decode().split()
+            if len(parts) in (4, 5):
+                _, sender, size_s, tid_s = parts[:4]
+                key = (addr, int(tid_s))
+                if key in self._done:
+                    self._reply(addr, f"ACK {tid_s}")
+                    return None
+                sess = self._session(key, int(size_s))
+                if sess is None:
+                    return None
+                sess.sender = sender
+                if len(parts) == 5:
+                    sess.crc = int(parts[4], 16)
+            elif len(parts) == 3:
+                # Altes Format: Nutzdaten folgen ohne Chunk-Header
+                _, sender, size_s = parts
+                key = (addr, None)
+                old = self._sessions.pop(key, None)
+                if old is not None:
+                    old.discard()
+                sess = self._session(key, int(size_s))
+                if sess is None:
+                    return None
+                sess.sender = sender
+                self._append_legacy(sess, rest)
+            else:
+                return None
+
+        else:
+            key = (addr, None)
+            sess = self._sessions.get(key)
+            if sess is None:
+                return None
+            sess.last_seen = time.monotonic()
+            self._append_legacy(sess, data)
+
+        if not sess.complete():
+            return None
+        tid = key[1]
+        if sess.crc is not None and sess.checksum() != sess.crc:
+            # Prüfsumme falsch: komplette Neuübertragung anfordern
+            sess.received.clear()
+            self._reply(addr, f"NACK {tid} 0-{sess.nchunks - 1}")
+            return None
+        del self._sessions[key]
+        if tid is not None:
+            self._done.append(key)
+            self._reply(addr, f"ACK {tid}")
+        filename = _image_filename(self.image_dir, sess.sender)
+        sess.finish(filename)
+        return sess.sender, str(filename)
+
+    @staticmethod
+    def _append_legacy(sess: _ImageSession, data: bytes) -> None:
+        """
+        @brief Hängt rohe Nutzdaten an eine Übertragung im alten Format an.
+        """
+        n = min(len(data), sess.size - sess.legacy_len)
+        sess.write(sess.legacy_len, memoryview(data)[:n])
+        sess.legacy_len += n
+        if sess.legacy_len >= sess.size:
+            sess.received = set(range(sess.nchunks))
+
+    def active(self) -> bool:
+        """
+        @brief True, solange mindestens eine Übertragung läuft.
+        """
+        return bool(self._sessions)
+
+    def send_nacks(self) -> None:
+        """
+        @brief Fordert bei stockenden Übertragungen die fehlenden Chunk-Bereiche an.
+        @details Eine leere Bereichsliste bedeutet, dass nur der IMG-Header fehlt.
+                 Der Abstand zwischen NACKs derselben Sitzung verdoppelt sich, bis
+                 wieder Daten eintreffen.
+        """
+        now = time.monotonic()
+        for (addr, tid), sess in self._sessions.items():
+            if tid is None or now - max(sess.last_seen, sess.last_nack) < sess.nack_delay:
+                continue
+            text = f"NACK {tid} "
+            for r in sess.missing_ranges():
+                if len(text) + len(r) + 1 > _IMG_NACK_MAX:
+                    break
+                text += r + ","
+            self._reply(addr, text.rstrip(","))
+            sess.last_nack = now
+            sess.nack_delay *= 2
+
+    def expire(self) -> list:
+        """
+        @brief Verwirft Sitzungen, die länger als timeout keine Daten erhalten haben.
+        @return Liste der Absender (Handle oder Adresse) verworfener Übertragungen.
+        """
+        deadline = time.monotonic() - self.timeout
+        dropped = []
+        for key in [k for k, s in self._sessions.items() if s.last_seen < deadline]:
+            sess = self._sessions.pop(key)
+            sess.discard()
+            dropped.append(sess.sender or key[0][0])
+        return dropped
+
+def _service_receiver(receiver: _ImageReceiver, pipe_evt) -> None:
+    """
+    @brief Versendet fällige NACKs, verwirft abgelaufene Bildsitzungen und meldet sie an die UI.
+    """
+    receiver.send_nacks()
+    for sender in receiver.expire():
+        pipe_evt.send(("error", f"[SLCP] Bildübertragung von {sender} abgebrochen (Timeout)"))
+
 def _udp_listener(udp_sock, pipe_evt, image_dir):
     """
     @brief Wartet auf UDP-Daten (SLCP-IMG), speichert empfangene Bilder und sendet Ereignisse.
@@ -58,43 +955,1086 @@ def _udp_listener(udp_sock, pipe_evt, image_dir):
     @param pipe_evt Pipe zum Senden von Events an den UI-Prozess.
     @param image_dir Verzeichnis zur Speicherung empfangener Bilder.
     """
+    receiver = _ImageReceiver(image_dir, udp_sock)
+    # Regelmäßig aufwachen, um NACKs zu senden und abgebrochene Übertragungen aufzuräumen
+    udp_sock.settimeout(_IMG_NACK_DELAY / 2)
+    last_sweep = time.monotonic()
     while True:
-        data, _ = udp_sock.recvfrom(65535)
-        if data.startswith(b"IMG"):
-            header, _, rest = data.partition(b'\n')
-            parts = header.decode().split()
-            if len(parts) == 3:
-                _, sender, size_s = parts
-                size = int(size_s)
-                img_data = rest
-                while len(img_data) < size:
-                    chunk, _ = udp_sock.recvfrom(65535)
-                    img_data += chunk
-                filename = image_dir / f"{sender}_{int(time.time())}.jpg"
-                with open(filename, "wb") as f:
-                    f.write(img_data)
-                pipe_evt.send(("img", sender, str(filename)))
-
-def run_network_service(pipe_cmd, pipe_evt, config):
+        try:
+            data, addr = udp_sock.recvfrom(65535)
+            done = receiver.feed(data, addr)
+            if done:
+                pipe_evt.send(("img", *done))
+        except socket.timeout:
+            pass
+        except Exception as e:
+            pipe_evt.send(("error", f"net udp: {e}"))
+        if time.monotonic() - last_sweep >= _IMG_NACK_DELAY / 2:
+            _service_receiver(receiver, pipe_evt)
+            last_sweep = time.monotonic()
+
+class _Pacer:
     """
-    @brief Startet den Netzwerkdienst (TCP/UDP) und verarbeitet eingehende sowie ausgehende SLCP-Nachrichten.
-    @param pipe_cmd Pipe zum Empfangen von Befehlen vom UI-Prozess.
+    @brief Token-Bucket zur Drosselung des UDP-Bildversands mit adaptiver Rate (AIMD).
+    @details Die Rate startet bei max_rate. Meldet der Empfänger per NACK verlorene Chunks,
+             wird sie proportional zum Verlustanteil gesenkt (höchstens halbiert); nach
+             verlustfreien Übertragungen steigt sie wieder bis max_rate. Pro Ziel wird ein
+             Pacer wiederverwendet, damit die gelernte Rate für das nächste Bild erhalten bleibt.
+    """
+
+    def __init__(self, max_rate: float):
+        """
+        @param max_rate Maximale Senderate in Bytes/s (0 = unbegrenzt, kein Pacing).
+        """
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self._tokens = float(_PACE_BURST)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, nbytes: int) -> None:
+        """
+        @brief Blockiert, bis nbytes gemäß aktueller Rate gesendet werden dürfen.
+        """
+        if not self.max_rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(_PACE_BURST, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= nbytes
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+
+    def on_loss(self, lost: int, sent: int) -> None:
+        """
+        @brief Senkt die Rate nach einem NACK mit lost fehlenden von sent Chunks.
+        """
+        if not self.max_rate or not lost:
+            return
+        factor = 1.0 - min(0.5, lost / max(sent, 1))
+        self.rate = max(_PACE_MIN_RATE, self.rate * factor)
+
+    def on_success(self) -> None:
+        """
+        @brief Erhöht die Rate nach einer verlustfreien Übertragung.
+        """
+        if self.max_rate:
+            self.rate = min(self.max_rate, self.rate * 1.25 + _PACE_MIN_RATE)
+
+_pacers: dict[tuple[str, int], _Pacer] = {}
+_pacers_lock = threading.Lock()
+
+def _pacer_for(ip: str, port: int, max_rate: float) -> _Pacer:
+    """
+    @brief Liefert den Pacer für ein Ziel und legt ihn bei Bedarf an.
+    @param max_rate Maximale Senderate in Bytes/s aus der Konfiguration.
+    """
+    key = (ip, int(port))
+    with _pacers_lock:
+        pacer = _pacers.get(key)
+        if pacer is None or pacer.max_rate != max_rate:
+            pacer = _pacers[key] = _Pacer(max_rate)
+        return pacer
+
+def _parse_ranges(spec: str):
+    """
+    @brief Liefert alle Sequenznummern aus einer NACK-Bereichsliste wie "0-3,7".
+    """
+    for part in filter(None, spec.split(",")):
+        a, _, b = part.partition("-")
+        yield from range(int(a), int(b or a) + 1)
+
+def _send_image(path: str, frm: str, ip: str, port: int, reliable: bool = True,
+                pacer: _Pacer = None) -> None:
+    """
+    @brief Sendet ein Bild per UDP als SLCP-IMG mit Transfer-ID und Chunk-Sequenznummern.
+    @details Die Datei wird per mmap eingeblendet; Chunks sind memoryview-Ausschnitte davon
+             und werden zusammen mit ihrem Kopf per sendmsg (Scatter/Gather) verschickt.
+             So wird das Bild weder komplett in den Python-Speicher gelesen noch pro Chunk
+             kopiert. Die CRC32 wird direkt über die Abbildung berechnet.
+    @param path Pfad zur Bilddatei.
+    @param frm Absenderkennung.
+    @param ip Ziel-IP-Adresse.
+    @param port Ziel-UDP-Port.
+    @param reliable Auf ACK warten und NACKs bedienen.
+    @param pacer Ratenbegrenzer für dieses Ziel (None: ungedrosselt).
+    @raises OSError wenn der Empfänger nicht erreichbar ist oder nicht bestätigt.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            _send_image_view(memoryview(b""), frm, ip, port, reliable, pacer)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                _send_image_view(view, frm, ip, port, reliable, pacer)
+            finally:
+                view.release()
+
+def _send_image_view(img: memoryview, frm: str, ip: str, port: int, reliable: bool,
+                     pacer: _Pacer) -> None:
+    """
+    @brief Protokollteil von _send_image für bereits eingeblendete Bilddaten.
+    @details Jede Übertragung nutzt einen eigenen, mit dem Empfänger verbundenen UDP-Socket,
+             damit dessen ACK/NACK-Antworten genau hier ankommen. Im zuverlässigen Modus
+             werden nur die per NACK gemeldeten Bereiche wiederholt; bleibt jede Antwort aus,
+             werden Header und letzter Chunk erneut gesendet, um den Empfänger anzustoßen.
+             Alle Datagramme laufen durch den Pacer, der NACKs als Verlustsignal nutzt.
+    @param img Bilddaten (memoryview, wird nicht kopiert).
+    """
+    size = len(img)
+    nchunks = max(1, -(-size // _CHUNK_SIZE))
+    tid = random.getrandbits(32)
+    header = f"IMG {frm} {size} {tid} {zlib.crc32(img):08x}\n".encode()
+    pacer = pacer or _Pacer(0)
+    lossless = True
+
+    family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+    with socket.socket(family, socket.SOCK_DGRAM) as s:
+        s.connect((ip, port))
+        scatter = hasattr(s, "sendmsg")
+
+        def send_chunk(seq):
+            offset = seq * _CHUNK_SIZE
+            head = _IMG_CHUNK.pack(_IMG_MAGIC, tid, seq, size)
+            with img[offset:offset + _CHUNK_SIZE] as payload:
+                pacer.wait(len(head) + len(payload))
+                if scatter:
+                    s.sendmsg([head, payload])
+                else:
+                    s.send(head + payload.tobytes())
+
+        s.send(header)
+        for seq in range(nchunks):
+            send_chunk(seq)
+        if not reliable:
+            return
+
+        s.settimeout(_IMG_ACK_WAIT)
+        probes = 0
+        while True:
+            try:
+                reply = s.recv(_IMG_NACK_MAX + 64).decode().split()
+            except socket.timeout:
+                probes += 1
+                if probes > _IMG_MAX_PROBES:
+                    raise TimeoutError(f"keine Bestätigung von {ip}:{port}")
+                s.send(header)
+                send_chunk(nchunks - 1)
+                continue
+            if len(reply) < 2 or reply[1] != str(tid):
+                continue
+            probes = 0
+            if reply[0] == "ACK":
+                if lossless:
+                    pacer.on_success()
+                return
+            if reply[0] == "NACK":
+                missing = [seq for seq in _parse_ranges(reply[2] if len(reply) > 2 else "")
+                           if seq < nchunks]
+                if missing:
+                    lossless = False
+                    pacer.on_loss(len(missing), nchunks)
+                s.send(header)
+                for seq in missing:
+                    send_chunk(seq)
+
+def _send_image_tcp(sock, path: str, frm: str) -> None:
+    """
+    @brief Sendet ein Bild über eine TCP-Verbindung: Kopf `IMG <handle> <size>`, dann die
+           Datei per socket.sendfile (Zero-Copy im Kernel, TCP-Staukontrolle).
+    @param sock Verbundener TCP-Socket.
+    @param path Pfad zur Bilddatei.
+    @param frm Absenderkennung.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        sock.sendall(f"IMG {frm} {size}\n".encode())
+        sock.sendfile(f)
+
+class _EventQueue:
+    """
+    @brief Thread-sichere Ausgangswarteschlange für das Event-Ende der Pipe zur UI.
+    @details Events kommen aus mehreren Threads (Event-Loop, Sende-Worker, ACK-Verfolgung);
+             send() reiht nur ein und blockiert nie, geschrieben wird von einem eigenen
+             Thread. Eine UI, die nicht mehr liest, hält so nur ihren eigenen Schreib-Thread
+             auf statt der gemeinsamen Event-Loop. Stehen mehr als _EVENT_BACKLOG Events aus,
+             werden weitere verworfen und on_overflow() wird einmalig aufgerufen (der Hub
+             beendet dann die Sitzung). Nach close() werden verspätete Events still verworfen.
+    """
+
+    def __init__(self, conn, backlog: int = _EVENT_BACKLOG):
+        """
+        @param conn Pipe-Ende zur UI.
+        @param backlog Maximale Anzahl ausstehender Events.
+        """
+        self._conn = conn
+        self._backlog = backlog
+        self._items: list = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._writing = False
+        self.overflowed = False
+        # Aufrufbar ohne Argumente, wenn die Schlange überläuft
+        self.on_overflow = None
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def send(self, obj) -> None:
+        """
+        @brief Reiht ein Event ein, ohne zu blockieren.
+        """
+        with self._cond:
+            if self._closed or self.overflowed:
+                return
+            if len(self._items) >= self._backlog:
+                self.overflowed = True
+                self._items.clear()
+                notify = self.on_overflow
+            else:
+                self._items.append(obj)
+                self._cond.notify_all()
+                return
+        if notify is not None:
+            notify()
+
+    def flush(self, timeout: float = 1.0) -> None:
+        """
+        @brief Wartet höchstens timeout Sekunden, bis alle eingereihten Events geschrieben sind.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not (self._items or self._writing), timeout)
+
+    def close(self) -> None:
+        """
+        @brief Verwirft ausstehende Events und beendet den Schreib-Thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._items.clear()
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+                while not self._items and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                items, self._items = self._items, []
+                self._writing = True
+            try:
+                for obj in items:
+                    self._conn.send(obj)
+            except (OSError, EOFError):
+                # UI ist weg; die Sitzung endet über die Befehls-Pipe
+                self.close()
+                return
+
+class _AckTracker:
+    """
+    @brief Verfolgt gesendete Nachrichten mit ID bis zu ihrem ACK (Zustellbestätigung).
+    @details Der Sender wartet nicht auf ACKs, sondern registriert die ID und schickt sofort
+             weiter; beliebig viele Nachrichten können so auf einer Verbindung unterwegs sein.
+             Ein eigener Thread liest über einen Selector die ACK-Frames aller gepoolten
+             Verbindungen und meldet ("delivered", to, text, rtt_ms). Ohne ACK innerhalb von
+             timeout oder bei Abbruch der Verbindung wird ("undelivered", to, text, grund) gemeldet.
+             Die Events gehen an die Pipe der Sitzung, die die Nachricht gesendet hat.
+             Ein Peer, der einmal ein ACK geschickt hat, versteht auch Sammel-Frames (MSGS).
+    """
+
+    def __init__(self, pipe_evt=None, timeout: float = _ACK_TIMEOUT):
+        """
+        @param pipe_evt Standard-Pipe für Events, falls expect() keine eigene erhält.
+        @param timeout Sekunden bis eine Nachricht als nicht zugestellt gilt.
+        """
+        self.pipe_evt = pipe_evt
+        self.timeout = timeout
+        self._sel = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._readers: dict[socket.socket, _FrameReader] = {}
+        self._pending: dict[int, tuple] = {}   # ID → (Socket, Empfänger, Texte, Sendezeit, Pipe)
+        self._next_id = 1
+        self._wake = threading.Event()
+        self._peer_of: dict[socket.socket, tuple] = {}   # Socket → (ip, port) des Ziels
+        self._batching: set[tuple] = set()               # Ziele, die MSGS verstehen
+        self._closing: set[socket.socket] = set()        # aufgegeben, warten noch auf ACKs
+
+    def expect(self, sock, to: str, texts: list[str], pipe_evt=None, peer=None) -> int:
+        """
+        @brief Vergibt eine neue Nachrichten-ID und merkt sie für sock vor.
+        @details Muss vor dem Senden aufgerufen werden, damit ein schnelles ACK nicht verloren geht.
+        @param texts Alle Nachrichten des Frames (mehrere bei MSGS); ein ACK bestätigt alle.
+        @param pipe_evt Pipe der sendenden Sitzung für das Ergebnis (None: Standard-Pipe).
+        @param peer Zieladresse (ip, port); ein ACK darauf markiert sie als MSGS-fähig.
+        @return Die Nachrichten-ID für den `ID <n>`-Frame.
+        """
+        with self._lock:
+            msg_id = self._next_id
+            self._next_id += 1
+            self._pending[msg_id] = (sock, to, texts, time.monotonic(), pipe_evt or self.pipe_evt)
+            if peer is not None:
+                self._peer_of[sock] = (peer[0], int(peer[1]))
+            if sock not in self._readers:
+                self._readers[sock] = _FrameReader(sock)
+                self._sel.register(sock, selectors.EVENT_READ)
+                self._wake.set()
+            return msg_id
+
+    def accepts_batches(self, ip: str, port: int) -> bool:
+        """
+        @brief True, wenn der Peer schon ein ACK gesendet hat und damit MSGS-Frames versteht.
+        """
+        with self._lock:
+            return (ip, int(port)) in self._batching
+
+    def cancel(self, msg_id: int) -> None:
+        """
+        @brief Vergisst eine ID, deren Frame nicht gesendet werden konnte.
+        """
+        with self._lock:
+            self._pending.pop(msg_id, None)
+
+    def release(self, sock) -> None:
+        """
+        @brief Übernimmt eine vom Pool aufgegebene Verbindung und schließt sie.
+        @details Die Nachrichten darauf sind bereits geschrieben; stehen noch IDs aus, bleibt
+                 der Socket offen und wird weiter auf ACKs gelesen. Geschlossen wird er, sobald
+                 alle IDs bestätigt oder abgelaufen sind oder die Gegenseite schließt.
+        """
+        with self._lock:
+            if any(p[0] is sock for p in self._pending.values()):
+                self._closing.add(sock)
+                return
+        self._close(sock)
+
+    def _close(self, sock) -> None:
+        """
+        @brief Meldet eine Verbindung ohne offene IDs ab und schließt sie.
+        """
+        with self._lock:
+            self._closing.discard(sock)
+            self._peer_of.pop(sock, None)
+            if self._readers.pop(sock, None) is not None:
+                self._sel.unregister(sock)
+        sock.close()
+
+    def _settle(self) -> None:
+        """
+        @brief Schließt aufgegebene Verbindungen, auf denen keine ID mehr aussteht.
+        """
+        with self._lock:
+            busy = {p[0] for p in self._pending.values()}
+            done = [s for s in self._closing if s not in busy]
+        for sock in done:
+            self._close(sock)
+
+    def forget(self, sock) -> None:
+        """
+        @brief Meldet eine von der Gegenseite geschlossene Verbindung ab; offene IDs gelten
+               als nicht zugestellt.
+        """
+        with self._lock:
+            self._peer_of.pop(sock, None)
+            if self._readers.pop(sock, None) is None:
+                return
+            self._sel.unregister(sock)
+            lost = [i for i, p in self._pending.items() if p[0] is sock]
+            entries = [self._pending.pop(i) for i in lost]
+        for _, to, texts, _, evt in entries:
+            for text in texts:
+                evt.send(("undelivered", to, text, "Verbindung getrennt"))
+
+    def _on_ack(self, sock, line: bytes) -> None:
+        """
+        @brief Wertet einen `ACK <n>`-Frame aus.
+        """
+        parts = line.split()
+        if len(parts) != 2 or parts[0] != b"ACK" or not parts[1].isdigit():
+            return
+        with self._lock:
+            if sock in self._peer_of:
+                self._batching.add(self._peer_of[sock])
+            entry = self._pending.pop(int(parts[1]), None)
+        if entry is not None:
+            _, to, texts, t0, evt = entry
+            rtt = round((time.monotonic() - t0) * 1000, 1)
+            for text in texts:
+                evt.send(("delivered", to, text, rtt))
+
+    def _expire(self) -> None:
+        """
+        @brief Meldet Nachrichten, deren ACK länger als timeout aussteht.
+        """
+        deadline = time.monotonic() - self.timeout
+        with self._lock:
+            late = [i for i, p in self._pending.items() if p[3] < deadline]
+            entries = [self._pending.pop(i) for i in late]
+        for _, to, texts, _, evt in entries:
+            for text in texts:
+                evt.send(("undelivered", to, text, "keine Bestätigung"))
+
+    def run(self) -> None:
+        """
+        @brief Hintergrund-Thread: liest ACK-Frames und prüft Zeitüberschreitungen.
+        """
+        while True:
+            with self._lock:
+                idle = not self._readers
+                self._wake.clear()
+            if idle:
+                # Ein Selector ohne registrierte Sockets wartet nicht auf allen Plattformen
+                self._wake.wait(1.0)
+                events = []
+            else:
+                events = self._sel.select(timeout=1.0)
+            for key, _ in events:
+                sock = key.fileobj
+                with self._lock:
+                    reader = self._readers.get(sock)
+                if reader is None:
+                    continue
+                try:
+                    # Die Sende-Worker schreiben parallel; der Blocking-Modus bleibt unverändert
+                    n = reader.fill()
+                    while (line := reader.next_line()) is not None:
+                        self._on_ack(sock, line)
+                except (BlockingIOError, socket.timeout):
+                    continue
+                except (OSError, ValueError):
+                    n = 0
+                if not n:
+                    # Gegenseite hat geschlossen; der Pool verwirft den Socket beim nächsten Checkout
+                    self.forget(sock)
+            self._expire()
+            self._settle()
+
+class _PeerQueues:
+    """
+    @brief Ausgehende Warteschlangen pro Ziel (ip, port), abgearbeitet von einem Worker-Pool.
+    @details Für jedes Ziel mit ausstehenden Aufträgen läuft höchstens ein Worker, der die
+             Aufträge in Einreihungsreihenfolge ausführt; die Reihenfolge pro Peer bleibt damit
+             erhalten. Ein Peer, der gerade im Connect-Timeout hängt, blockiert nur seinen
+             eigenen Worker. Jede Warteschlange ist auf depth Einträge begrenzt; ist sie voll,
+             lehnt submit() ab und der Aufrufer meldet dies an die UI.
+    """
+
+    def __init__(self, depth: int, workers: int = _PEER_WORKERS):
+        """
+        @param depth Maximale Anzahl wartender Aufträge pro Ziel.
+        @param workers Maximale Anzahl gleichzeitig bedienter Ziele.
+        """
+        self.depth = depth
+        self._queues: dict[tuple[str, int], deque] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="peer")
+
+    def submit(self, ip: str, port: int, job, pipe_evt=None) -> bool:
+        """
+        @brief Reiht einen Auftrag für ein Ziel ein.
+        @param job Aufrufbar ohne Argumente; behandelt erwartete Fehler (OSError) selbst.
+        @param pipe_evt Pipe der auftraggebenden Sitzung; unerwartete Fehler des Auftrags
+               werden dorthin als ("error", ...) gemeldet.
+        @return False, wenn die Warteschlange des Ziels voll ist.
+        """
+        key = (ip, int(port))
+        with self._lock:
+            q = self._queues.get(key)
+            start = q is None
+            if start:
+                q = self._queues[key] = deque()
+            elif len(q) >= self.depth:
+                return False
+            q.append((job, pipe_evt))
+        if start:
+            self._executor.submit(self._drain, key)
+        return True
+
+    def _drain(self, key) -> None:
+        """
+        @brief Worker: führt die Aufträge eines Ziels nacheinander aus, bis die Schlange leer ist.
+        """
+        while True:
+            with self._lock:
+                q = self._queues[key]
+                if not q:
+                    del self._queues[key]
+                    return
+                job, pipe_evt = q.popleft()
+            try:
+                job()
+            except Exception as e:
+                # Programmfehler im Auftrag: melden, aber den Worker für dieses Ziel weiterlaufen lassen
+                if pipe_evt is not None:
+                    try:
+                        pipe_evt.send(("error", f"net send {key[0]}:{key[1]}: {e}"))
+                    except OSError:
+                        pass
+
+class _Batcher:
+    """
+    @brief Sammelt Nachrichten an dasselbe Ziel während des Coalescing-Fensters (msg_coalesce_ms).
+    @details Ähnlich dem Nagle-Algorithmus: die erste Nachricht eröffnet einen Stapel und
+             stellt einen Sendeauftrag ein, der nach Ablauf des Fensters alle bis dahin
+             gesammelten Nachrichten gemeinsam verschickt. Schlüssel ist
+             (ip, port, absender, empfänger). Wird für den Peer ein anderer Auftrag eingereiht
+             (Bild, Broadcast), schließt close() dessen offene Stapel, damit spätere
+             Nachrichten den Auftrag nicht überholen.
+    """
+
+    def __init__(self):
+        self._batches: dict[tuple, list[str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, text: str, limit: int):
+        """
+        @brief Hängt text an den offenen Stapel von key an.
+        @param limit Maximale Stapelgröße (peer_queue_depth); ein Stapel zählt wie so
+               viele einzelne Aufträge.
+        @return (stapel, neu): neu ist True, wenn der Stapel eröffnet wurde (Aufrufer plant
+                den Versand); stapel ist None, wenn der offene Stapel voll ist.
+        """
+        with self._lock:
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = [text]
+                return batch, True
+            if len(batch) >= limit:
+                return None, False
+            batch.append(text)
+            return batch, False
+
+    def take(self, key, batch: list[str]) -> list[str]:
+        """
+        @brief Entnimmt den Stapel; spätere Nachrichten eröffnen einen neuen.
+        @param batch Der von add() gelieferte Stapel (bleibt gültig, auch wenn er geschlossen wurde).
+        """
+        with self._lock:
+            if self._batches.get(key) is batch:
+                del self._batches[key]
+            return batch
+
+    def close(self, ip: str, port: int) -> None:
+        """
+        @brief Schließt alle offenen Stapel an (ip, port); ihre Sendeaufträge bleiben eingeplant.
+        """
+        with self._lock:
+            for key in [k for k in self._batches if k[:2] == (ip, int(port))]:
+                del self._batches[key]
+
+def _msg_frame(frm: str, texts: list[str]) -> bytes:
+    """
+    @brief Baut den Frame für eine oder mehrere Nachrichten desselben Absenders.
+    @details Eine einzelne Nachricht bleibt ein normales `MSG`, damit auch ältere Empfänger
+             sie verstehen; mehrere werden zu `MSGS <handle> <n>` plus n Textzeilen gepackt.
+    """
+    if len(texts) == 1:
+        return f"MSG {frm} {texts[0]}\n".encode()
+    return (f"MSGS {frm} {len(texts)}\n" + "".join(t + "\n" for t in texts)).encode()
+
+def _flush_outbox(to: str, outbox: Outbox, pool, queues, pipe_evt) -> None:
+    """
+    @brief Stellt einen Zustellversuch für alle offenen Outbox-Nachrichten an to in dessen
+           Peer-Warteschlange.
+    @details Alle offenen Nachrichten gehen gebündelt in einem sendall über dieselbe
+             Verbindung; bei Erfolg werden sie als zugestellt markiert, sonst wird der
+             nächste Versuch mit verdoppelter Wartezeit geplant.
+    """
+    addr = outbox.address(to)
+    if addr is None:
+        return
+    ip, port = addr
+
+    def job():
+        entries = outbox.pending(to)
+        if not entries:
+            return
+        data = b"".join(f"MSG {e['frm']} {e['text']}\n".encode() for e in entries)
+        try:
+            pool.send(ip, port, data)
+        except OSError:
+            outbox.failed(to)
+            return
+        left = outbox.mark_done([e['id'] for e in entries])
+        pipe_evt.send(("outbox", to, left))
+
+    queues.submit(ip, port, job, pipe_evt)
+
+def _outbox_loop(outbox: Outbox, pool, queues, pipe_evt) -> None:
+    """
+    @brief Hintergrund-Thread: stößt fällige Wiederholungsversuche der Outbox an.
+    """
+    while True:
+        time.sleep(1.0)
+        for to in outbox.due():
+            _flush_outbox(to, outbox, pool, queues, pipe_evt)
+
+class _RegistryChannel:
+    """
+    @brief Sende-Ende des Registry-Kanals zum Discovery-Dienst, neu belegbar nach einem Abbruch.
+    @details Ohne angeschlossene Verbindung scheitert send() sofort mit OSError; Befehle an
+             unbekannte Empfänger werden dann direkt als unzustellbar gemeldet.
+    """
+
+    def __init__(self, conn=None):
+        self._conn = conn
+        self._lock = threading.Lock()
+
+    def attach(self, conn) -> None:
+        with self._lock:
+            self._conn = conn
+
+    def detach(self, conn) -> None:
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+
+    def send(self, obj) -> None:
+        with self._lock:
+            if self._conn is None:
+                raise OSError("kein Registry-Kanal zum Discovery-Dienst")
+            self._conn.send(obj)
+
+class _Lookups:
+    """
+    @brief Befehle an noch unbekannte Empfänger, die auf eine WHOIS-Auflösung warten.
+    @details Statt sofort "Unbekannter Empfänger" zu melden, wird der Discovery-Dienst über
+             den Registry-Kanal gezielt nach dem Handle gefragt (("whois", handle)); pro
+             Handle läuft höchstens eine Anfrage. Die Antwort ("whois", handle, adresse | None)
+             gibt die gesammelten Befehle in ihrer ursprünglichen Reihenfolge wieder frei.
+             Solange für einen Handle Befehle warten, werden auch neue Befehle an ihn
+             zurückgestellt, damit sie die älteren nicht überholen. Bleibt die Antwort
+             länger als timeout aus (z. B. weil der Kanal abgerissen ist), werden die
+             Befehle als unbekannter Empfänger gemeldet.
+    """
+
+    def __init__(self, pipe_reg, pipe_evt=None, timeout: float = _LOOKUP_TIMEOUT):
+        """
+        @param pipe_reg Duplex-Kanal zum Discovery-Dienst oder None (dann keine Auflösung).
+        @param pipe_evt Pipe für Fehlermeldungen nach Ablauf von timeout.
+        @param timeout Sekunden bis zurückgestellte Befehle aufgegeben werden.
+        """
+        self._pipe = pipe_reg
+        self.pipe_evt = pipe_evt
+        self.timeout = timeout
+        self._waiting: dict[str, list] = {}
+        # Reentrant: beim Freigeben laufen die Befehle erneut durch _handle_command
+        self._lock = threading.RLock()
+
+    def defer(self, to: str, cmd, only_if_waiting: bool = False) -> bool:
+        """
+        @brief Stellt einen Befehl zurück, bis to aufgelöst ist.
+        @param only_if_waiting Nur zurückstellen, wenn bereits Befehle an to warten.
+        @return False, wenn kein Kanal zum Discovery-Dienst besteht (bzw. nichts wartet).
+        """
+        if self._pipe is None:
+            return False
+        with self._lock:
+            first = to not in self._waiting
+            if first and only_if_waiting:
+                return False
+            waiting = self._waiting.setdefault(to, [])
+            waiting.append(cmd)
+            if first:
+                try:
+                    self._pipe.send(("whois", to))
+                except (OSError, EOFError):
+                    del self._waiting[to]
+                    return False
+                timer = threading.Timer(self.timeout, self._expire, (to, waiting))
+                timer.daemon = True
+                timer.start()
+        return True
+
+    def _expire(self, to: str, waiting: list) -> None:
+        """
+        @brief Timer: gibt eine unbeantwortete Anfrage auf, sofern sie noch dieselbe ist.
+        """
+        with self._lock:
+            if self._waiting.get(to) is not waiting:
+                return
+            del self._waiting[to]
+            for _ in waiting:
+                self.pipe_evt.send(("error", f"[SLCP] Unbekannter Empfänger: {to}"))
+
+    def release(self, to: str, addr, dispatch, pipe_evt) -> None:
+        """
+        @brief Gibt alle auf to wartenden Befehle mit der gefundenen Adresse an dispatch.
+        @details Läuft unter der Sperre, damit parallel eintreffende Befehle an to erst
+                 danach an die Reihe kommen.
+        """
+        with self._lock:
+            for cmd in self._waiting.pop(to, []):
+                if addr is None:
+                    pipe_evt.send(("error", f"[SLCP] Unbekannter Empfänger: {to}"))
+                else:
+                    dispatch(cmd + tuple(addr))
+
+def _apply_registry(users: dict, peers: dict, pool, queues, outbox: Outbox = None,
+                    pipe_evt=None) -> None:
+    """
+    @brief Übernimmt eine neue Discovery-Registry in den Netzwerkdienst.
+    @details Aktualisiert die Adresstabelle peers an Ort und Stelle (Sende-Worker lesen
+             parallel), gleicht Verbindungspool und Adress-Cache ab und stellt die Outbox
+             wieder beigetretener Empfänger sofort gebündelt zu.
+    @param users Dict Handle → (ip, port).
+    @param peers Adresstabelle des Netzwerkdienstes, Handle → (ip, port).
+    @param outbox Outbox einer Sitzung oder None (nur gemeinsame Tabellen abgleichen).
+    """
+    for h in [h for h in peers if h not in users]:
+        peers.pop(h, None)
+    peers.update({h: (ip, int(port)) for h, (ip, port) in users.items()})
+    pool.retain(users.values())
+    pool.resolver.seed(users)
+    if outbox is not None:
+        _flush_rejoined(users, outbox, pool, queues, pipe_evt)
+
+def _apply_registry_delta(added: dict, removed: list, changed: dict, peers: dict,
+                          pool) -> dict:
+    """
+    @brief Übernimmt ein Registry-Delta in die gemeinsamen Tabellen des Netzwerkdienstes.
+    @details Aufwand proportional zur Größe des Deltas: nur Verbindungen und Cache-Einträge
+             entfernter oder umgezogener Handles werden verworfen.
+    @return Neue oder umgezogene Handles, Handle → (ip, port).
+    """
+    updated = {h: (ip, int(port)) for h, (ip, port) in {**added, **changed}.items()}
+    for h in [*removed, *updated]:
+        old = peers.get(h)
+        if old is not None and old != updated.get(h):
+            pool.close(old)
+    apply_delta(peers, {}, removed, updated)
+    pool.resolver.update(updated, removed)
+    return updated
+
+def _flush_rejoined(users: dict, outbox: Outbox, pool, queues, pipe_evt) -> None:
+    """
+    @brief Stellt die Outbox wieder beigetretener Empfänger sofort gebündelt zu.
+    """
+    for to in outbox.on_registry(users):
+        _flush_outbox(to, outbox, pool, queues, pipe_evt)
+
+def _registry_listener(pipe_reg, peers: dict, pool, queues, sessions) -> None:
+    """
+    @brief Hintergrund-Thread: empfängt Registry-Updates direkt vom Discovery-Dienst (RegistryFeed).
+    @details Der Feed beginnt mit einem Snapshot ("users", registry, gen) und liefert danach
+             nur Deltas ("delta", gen, added, removed, changed), die nur die betroffenen
+             Handles anfassen (Aufwand proportional zum Delta). Antworten auf WHOIS-Anfragen
+             ("whois", handle, (ip, port) | None) geben zurückgestellte Befehle frei; sie
+             werden mit der gefundenen Adresse erneut an den dispatch der Sitzung übergeben.
+             Endet, wenn der Kanal abreißt.
+    @param sessions Aufrufbar ohne Argumente, liefert die aktuell bedienten _Session-Objekte.
+           Die Adresstabelle ist gemeinsam, Outbox und Rückstellungen gehören je einer Sitzung.
+    """
+    while True:
+        try:
+            evt = pipe_reg.recv()
+        except (EOFError, OSError):
+            return
+        if not isinstance(evt, tuple):
+            continue
+        if evt[0] == "users":
+            users = evt[1]
+            _apply_registry(users, peers, pool, queues)
+            for sess in sessions():
+                _flush_rejoined(users, sess.outbox, pool, queues, sess.pipe_evt)
+        elif evt[0] == "delta":
+            # Nur die betroffenen Handles anfassen, nicht die ganze Registry
+            _, _, added, removed, changed = evt
+            updated = _apply_registry_delta(added, removed, changed, peers, pool)
+            for sess in sessions():
+                for to in sess.outbox.on_delta(updated, removed):
+                    _flush_outbox(to, sess.outbox, pool, queues, sess.pipe_evt)
+        elif evt[0] == "whois":
+            _, to, addr = evt
+            for sess in sessions():
+                sess.lookups.release(to, addr, sess.dispatch, sess.pipe_evt)
+
+def _lookup(to: str, addr: list, peers: dict, outbox: Outbox):
+    """
+    @brief Bestimmt die Zieladresse eines Befehls.
+    @param addr Optional im Befehl mitgegebene (ip, port) (älteres Befehlsformat).
+    @return (ip, port) aus Befehl, Registry oder zuletzt bekannter Outbox-Adresse, sonst None.
+    """
+    if addr:
+        ip, port = addr
+        return ip, int(port)
+    return peers.get(to) or outbox.address(to)
+
+def _handle_command(cmd, pipe_evt, pool, queues, outbox, acks, batcher, peers, lookups, config):
+    """
+    @brief Nimmt einen Befehl des UI-Prozesses an (send_msg, send_many, send_img, leave, peers).
+    @details Sendeaufträge werden nur geprüft und in die Warteschlange des Ziels gestellt;
+             der Aufruf blockiert daher nie auf Netzwerk-I/O.
+    @param cmd Befehlstupel, erstes Element ist die Aktion.
     @param pipe_evt Pipe zum Senden von Ereignissen an den UI-Prozess.
-    @param config Konfigurationsobjekt mit Attributen:
-           - port_range: Tupel (min_port, max_port) zur Portauswahl,
-           - handle: Benutzerkennung (Sender),
-           - imagepath: Zielverzeichnis für empfangene Bilder.
+    @param pool Verbindungspool für ausgehende TCP-Nachrichten.
+    @param queues Warteschlangen pro Ziel (_PeerQueues).
+    @param outbox Persistenter Postausgang für nicht zustellbare Nachrichten.
+    @param acks Verfolgung der Zustellbestätigungen (_AckTracker).
+    @param batcher Sammelstapel für das Coalescing von send_msg (_Batcher).
+    @param peers Adresstabelle Handle → (ip, port) aus der Discovery-Registry.
+    @param lookups Zurückgestellte Befehle an unbekannte Empfänger (_Lookups).
+    @param config Konfigurationsobjekt (u. a. msg_ack, msg_coalesce_ms, img_reliable,
+           img_bandwidth, img_tcp_threshold).
     """
-    handle = config.handle
-    image_dir = Path(config.imagepath)
-    image_dir.mkdir(parents=True, exist_ok=True)
+    if not isinstance(cmd, tuple):
+        return
+    action = cmd[0]
+    try:
+        if action == 'send_msg':
+            """
+            @brief Sendet eine SLCP-MSG-Nachricht über TCP.
+            @param frm Absenderkennung.
+            @param to Empfängerkennung.
+            @param text Nachrichtentext.
+            @param ip, port Optional: Zieladresse; ohne sie wird to über die Registry und,
+                   falls dort unbekannt, per WHOIS über den Discovery-Dienst aufgelöst.
+            @details Ist die Warteschlange des Ziels voll, wird ("queue_full", to, text) gemeldet.
+                     Scheitert die Zustellung, landet die Nachricht in der Outbox und wird
+                     später erneut versucht ("outbox", to, offene_anzahl). Solange für den
+                     Empfänger noch Nachrichten in der Outbox liegen, werden neue hinten
+                     angehängt, damit die Reihenfolge erhalten bleibt. Mit msg_ack wird vor
+                     der MSG ein `ID <n>`-Frame gesendet; das Ergebnis kommt später als
+                     ("delivered", to, text, rtt_ms) bzw. ("undelivered", to, text, grund).
+                     Ist msg_coalesce_ms > 0, werden Nachrichten an denselben Empfänger, die
+                     innerhalb des Fensters eintreffen, mit einem sendall gesendet: als
+                     MSGS-Frame, wenn der Peer schon ein ACK geschickt hat, sonst als einzelne
+                     MSG-Zeilen. Ein Stapel fasst höchstens peer_queue_depth Nachrichten.
+            """
+            _, frm, to, text, *addr = cmd
+            if len(text) > 512:
+                pipe_evt.send((
+                    "error",
+                    f"[SLCP] Nachricht zu lang ({len(text)} Zeichen, max. 512)"
+                ))
+                return
+            dest = _lookup(to, addr, peers, outbox)
+            if dest is None:
+                # Gezielt per WHOIS auflösen lassen; der Befehl kommt danach mit Adresse zurück
+                if not lookups.defer(to, cmd):
+                    pipe_evt.send(("error", f"[SLCP] Unbekannter Empfänger: {to}"))
+                return
+            if not addr and lookups.defer(to, cmd, only_if_waiting=True):
+                # Ältere Befehle an to warten noch auf ihre Auflösung
+                return
+            ip, port = dest
+            if outbox.has_pending(to):
+                pipe_evt.send(("outbox", to, outbox.add(frm, to, text, ip, port)))
+                _flush_outbox(to, outbox, pool, queues, pipe_evt)
+                return
+            window = config.msg_coalesce_ms / 1000
+            key = (ip, int(port), frm, to)
+            batch = None
+            if window:
+                batch, opened = batcher.add(key, text, queues.depth)
+                if batch is None:
+                    pipe_evt.send(("queue_full", to, text))
+                    return
+                if not opened:
+                    # Ein Sendeauftrag für diesen Stapel ist bereits eingeplant
+                    return
+
+            def send(sock, texts):
+                if len(texts) == 1 or acks.accepts_batches(ip, port):
+                    groups = [texts]
+                else:
+                    # MSGS nur an Peers, die ihn nachweislich kennen; sonst einzelne MSG-Zeilen
+                    groups = [[t] for t in texts]
+                data = bytearray()
+                ids = []
+                for group in groups:
+                    if config.msg_ack:
+                        msg_id = acks.expect(sock, to, group, pipe_evt, (ip, port))
+                        ids.append(msg_id)
+                        data += f"ID {msg_id}\n".encode()
+                    data += _msg_frame(frm, group)
+                try:
+                    sock.sendall(data)
+                except OSError:
+                    for msg_id in ids:
+                        acks.cancel(msg_id)
+                    raise
+
+            def to_outbox(texts):
+                for t in texts:
+                    pipe_evt.send(("outbox", to, outbox.add(frm, to, t, ip, port)))
+
+            def job():
+                if window:
+                    time.sleep(window)
+                    texts = batcher.take(key, batch)
+                else:
+                    texts = [text]
+                if outbox.has_pending(to):
+                    # Eine frühere Nachricht ist inzwischen in der Outbox gelandet
+                    to_outbox(texts)
+                    return
+                try:
+                    pool.run(ip, port, lambda sock: send(sock, texts))
+                except OSError:
+                    to_outbox(texts)
+
+            if not queues.submit(ip, port, job, pipe_evt):
+                for t in batcher.take(key, batch) if window else [text]:
+                    pipe_evt.send(("queue_full", to, t))
+
+        elif action == 'send_many':
+            """
+            @brief Sendet eine SLCP-MSG-Nachricht parallel an mehrere Empfänger (Broadcast).
+            @param frm Absenderkennung.
+            @param text Nachrichtentext (einmal für alle Empfänger).
+            @param targets Liste von Handles (oder (handle, ip, port) im älteren Format).
+            @details Jeder Empfänger wird über seine eigene Warteschlange bedient. Das Ergebnis
+                     pro Empfänger wird gesammelt als ("send_many", text, {handle: None | Fehlertext})
+                     gemeldet, sobald alle fertig sind. Nicht zustellbare Kopien landen wie bei
+                     send_msg in der Outbox ("outbox", to, offene_anzahl) und zählen nicht als
+                     Fehlschlag; liegen für einen Empfänger schon Nachrichten in der Outbox,
+                     wird die Kopie dort hinten angehängt.
+            """
+            _, frm, text, targets = cmd
+            if len(text) > 512:
+                pipe_evt.send((
+                    "error",
+                    f"[SLCP] Nachricht zu lang ({len(text)} Zeichen, max. 512)"
+                ))
+                return
+            data = f"MSG {frm} {text}\n".encode()
+            results = {}
+            pending = [len(targets)]
+            lock = threading.Lock()
+
+            def record(to, err):
+                with lock:
+                    results[to] = err
+                    pending[0] -= 1
+                    done = pending[0] == 0
+                if done:
+                    pipe_evt.send(("send_many", text, results))
+
+            def to_outbox(to, ip, port):
+                # Zwischengespeicherte Kopien gelten als angenommen; die Outbox meldet sich selbst
+                pipe_evt.send(("outbox", to, outbox.add(frm, to, text, ip, port)))
+                record(to, None)
+
+            def make_job(to, ip, port):
+                def job():
+                    if outbox.has_pending(to):
+                        # Eine frühere Nachricht an to ist inzwischen in der Outbox gelandet
+                        to_outbox(to, ip, port)
+                        return
+                    try:
+                        pool.send(ip, port, data)
+                        record(to, None)
+                    except OSError:
+                        to_outbox(to, ip, port)
+                return job
+
+            if not targets:
+                pipe_evt.send(("send_many", text, results))
+            for target in targets:
+                to, *addr = (target,) if isinstance(target, str) else target
+                dest = _lookup(to, addr, peers, outbox)
+                if dest is None:
+                    record(to, "unbekannt")
+                    continue
+                if outbox.has_pending(to):
+                    # Ältere Nachrichten an to warten noch: hinten anstellen statt überholen
+                    to_outbox(to, *dest)
+                    _flush_outbox(to, outbox, pool, queues, pipe_evt)
+                    continue
+                # Offene Stapel schließen, damit spätere Nachrichten den Broadcast nicht überholen
+                batcher.close(*dest)
+                if not queues.submit(*dest, make_job(to, *dest), pipe_evt):
+                    record(to, "Warteschlange voll")
+
+        elif action == 'leave':
+            """
+            @brief Schließt alle gepoolten Verbindungen (Nutzer hat den Chat verlassen).
+            """
+            pool.close_all()
+
+        elif action == 'peers':
+            """
+            @brief Übernimmt eine Discovery-Registry, die über die UI weitergereicht wurde.
+            @details Nur nötig ohne direkten Registry-Kanal (pipe_reg) zum Discovery-Dienst.
+            @param users Dict Handle → (ip, port).
+            """
+            _, users = cmd
+            _apply_registry(users, peers, pool, queues, outbox, pipe_evt)
+
+        elif action == 'send_img':
+            """
+            @brief Sendet eine SLCP-IMG-Nachricht über UDP oder, ab img_tcp_threshold Bytes,
+                   über eine gepoolte TCP-Verbindung.
+            @param frm Absenderkennung.
+            @param to Empfängerkennung.
+            @param path Pfad zur Bilddatei.
+            @param ip, port Optional: Zieladresse (TCP und UDP); ohne sie über die Registry.
+            """
+            _, frm, to, path, *addr = cmd
+            dest = _lookup(to, addr, peers, outbox)
+            if dest is None:
+                # Gezielt per WHOIS auflösen lassen; der Befehl kommt danach mit Adresse zurück
+                if not lookups.defer(to, cmd):
+                    pipe_evt.send(("error", f"[SLCP] Unbekannter Empfänger: {to}"))
+                return
+            if not addr and lookups.defer(to, cmd, only_if_waiting=True):
+                # Ältere Befehle an to warten noch auf ihre Auflösung
+                return
+            ip, port = dest
+
+            def job():
+                try:
+                    threshold = config.img_tcp_threshold
+                    if threshold and os.path.getsize(path) >= threshold:
+                        pool.run(ip, port, lambda sock: _send_image_tcp(sock, path, frm))
+                    else:
+                        pacer = _pacer_for(ip, port, config.img_bandwidth * 125_000)
+                        _send_image(path, frm, ip, port, config.img_reliable, pacer)
+                except OSError as e:
+                    pipe_evt.send((
+                        "error",
+                        f"[SLCP] Bild konnte nicht gesendet werden an {ip}:{port}: {e}"
+                    ))
+
+            # Offene Stapel schließen, damit spätere Nachrichten das Bild nicht überholen
+            batcher.close(ip, port)
+            if not queues.submit(ip, port, job, pipe_evt):
+                pipe_evt.send(("queue_full", to, path))
 
+    except Exception as e:
+        pipe_evt.send(("error", f"net send '{action}': {e}"))
+
+def _dual_stack_socket(socktype: int) -> socket.socket:
+    """
+    @brief Erzeugt einen IPv6-Socket, der auch IPv4 annimmt (v4-mapped Adressen).
+    @details So sind Peers erreichbar, egal ob die Discovery per IPv4 oder IPv6 läuft.
+             Ohne IPv6-Unterstützung im System wird ein reiner IPv4-Socket geliefert.
+    """
+    if socket.has_ipv6:
+        try:
+            s = socket.socket(socket.AF_INET6, socktype)
+            s.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+            return s
+        except OSError:
+            pass
+    return socket.socket(socket.AF_INET, socktype)
+
+def _bind_ports(config, pipe_evt):
+    """
+    @brief Bindet TCP-Server und UDP-Socket einer Sitzung auf den ersten freien Port aus port_range.
+    @return (tcp_srv, udp_sock, port) oder None, wenn kein Port frei ist (Fehler an die UI gemeldet).
+    """
     # TCP-Server starten
     tcp_srv = None
     bound_port = None
     for p in range(config.port_range[0], config.port_range[1] + 1):
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s = _dual_stack_socket(socket.SOCK_STREAM)
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             s.bind(('', p))
             s.listen()
@@ -106,96 +2046,462 @@ def run_network_service(pipe_cmd, pipe_evt, config):
 
     if tcp_srv is None:
         pipe_evt.send(("error", "Kein freier TCP-Port gefunden"))
-        return
+        return None
 
     # UDP-Socket auf gleichem Port binden
-    udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_sock = _dual_stack_socket(socket.SOCK_DGRAM)
     udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
         udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     except (AttributeError, OSError):
         pass
+    if config.udp_rcvbuf:
+        # Größerer Empfangspuffer, damit Chunk-Bursts nicht verworfen werden
+        try:
+            udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, config.udp_rcvbuf)
+        except OSError:
+            pass
     udp_sock.bind(('', bound_port))
+    return tcp_srv, udp_sock, bound_port
+
+class _Session:
+    """
+    @brief Zustand einer UI-Sitzung (ein Handle) im Netzwerkdienst.
+    @details Eingehende SLCP-Frames nennen keinen Empfänger; jede Sitzung hat deshalb eigene
+             Empfangs-Sockets, und die Zuordnung erfolgt über den Port, auf dem ein Frame
+             ankommt. Outbox, Coalescing-Stapel und zurückgestellte Befehle gehören der
+             Sitzung; Verbindungspool, Peer-Warteschlangen, ACK-Verfolgung und Adresstabelle
+             teilen sich alle Sitzungen eines Prozesses.
+    """
+
+    def __init__(self, pipe_cmd, pipe_evt, config, tcp_srv, udp_sock, port: int, pipe_reg=None):
+        """
+        @param pipe_cmd Pipe mit Befehlen vom UI-Prozess.
+        @param pipe_evt Thread-sichere Event-Pipe zur UI (_EventQueue).
+        @param config Konfiguration der Sitzung (handle, imagepath, msg_ack, ...).
+        @param pipe_reg Kanal zum Discovery-Dienst für WHOIS-Anfragen oder None.
+        """
+        self.pipe_cmd = pipe_cmd
+        self.pipe_evt = pipe_evt
+        self.config = config
+        self.handle = config.handle
+        self.tcp_srv = tcp_srv
+        self.udp_sock = udp_sock
+        self.port = port
+        self.image_dir = Path(config.imagepath)
+        self.image_dir.mkdir(parents=True, exist_ok=True)
+        # Nicht zustellbare Nachrichten dauerhaft ablegen und mit Backoff erneut versuchen
+        self.outbox = Outbox(Path(config.path).parent / "outbox" / f"{self.handle}.jsonl")
+        self.batcher = _Batcher()
+        self.lookups = _Lookups(pipe_reg, pipe_evt)
+        self.receiver = None   # _ImageReceiver der Event-Loop
+        self.dispatch = None   # Befehl dieser Sitzung ausführen (für freigegebene Rückstellungen)
+        self.closed = False
+
+class SessionHub:
+    """
+    @brief Engine "selectors": eine Event-Loop für beliebig viele UI-Sitzungen (Handles).
+    @details TCP-Accept/-Empfang, UDP-Bildempfang und die Befehls-Pipes aller Sitzungen laufen
+             in einem einzigen nicht-blockierenden Selector. Eingehende Verbindungen werden
+             bis max_connections (über alle Sitzungen) angenommen; danach werden die
+             Server-Sockets abgemeldet, bis wieder eine Verbindung endet. Ein Verbindungs-Flood
+             bleibt so im Kernel-Backlog, statt neue Threads zu erzeugen. Ausgehende Befehle
+             werden direkt in die Peer-Warteschlangen gestellt und blockieren die Loop nicht.
+
+             Verbindungspool, Peer-Warteschlangen, ACK-Verfolgung, Adresstabelle und der
+             Registry-Kanal zum Discovery-Dienst werden von allen Sitzungen geteilt; Frames
+             tragen den Absender, sodass eine gepoolte Verbindung zu einem Peer für alle
+             lokalen Handles genutzt werden kann. Sitzungen können mit add() aus anderen
+             Threads hinzukommen und enden, sobald ihre UI die Pipe schließt.
+    """
+
+    def __init__(self, config, pipe_reg=None):
+        """
+        @param config Konfiguration für gemeinsame Grenzen (max_connections, peer_queue_depth).
+        @param pipe_reg Optionaler direkter Kanal vom Discovery-Dienst (RegistryFeed).
+        """
+        self.config = config
+        self.sessions: list[_Session] = []
+        # Persistente Verbindungen zu Peers für send_msg
+        self.pool = _ConnectionPool()
+        threading.Thread(target=self.pool.reap_loop, daemon=True).start()
+        # ACKs auf den gepoolten Verbindungen lesen, ohne die Sender warten zu lassen
+        self.acks = _AckTracker()
+        self.pool.on_close = self.acks.release
+        threading.Thread(target=self.acks.run, daemon=True).start()
+        # Ausgehende Aufträge pro Peer, damit ein langsamer Peer die anderen nicht aufhält
+        self.queues = _PeerQueues(config.peer_queue_depth)
+        # Adresstabelle Handle → (ip, port), direkt vom Discovery-Dienst oder per "peers"-Befehl
+        self.peers: dict[str, tuple[str, int]] = {}
+        # WHOIS-Anfragen aller Sitzungen teilen sich den Registry-Kanal
+        self._pipe_reg = _RegistryChannel()
+        if pipe_reg is not None:
+            threading.Thread(target=self.serve_registry, args=(pipe_reg,), daemon=True).start()
+
+        self._sel = selectors.DefaultSelector()
+        # Neue Sitzungen aus anderen Threads werden über ein Socketpaar an die Loop übergeben
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, ("wake", None))
+        self._lock = threading.Lock()
+        self._new: list[_Session] = []
+        self._dropped: list[_Session] = []
+        self._handles: set[str] = set()
+        # Socket → [FrameReader, letzte Aktivität, _StreamImage, Kontext für _dispatch_line,
+        #           Sitzung, noch nicht gesendete ACK-Bytes]
+        self._conns: dict[socket.socket, list] = {}
+        self._accepting = True
+        # Nach einem Accept-Fehler (z. B. EMFILE) bis zu diesem Zeitpunkt nicht annehmen
+        self._accept_pause = 0.0
+
+    def add(self, pipe_cmd, pipe_evt, config):
+        """
+        @brief Eröffnet eine Sitzung für config.handle: bindet deren Ports und meldet
+               ("tcp_port", port) an die UI.
+        @details Thread-sicher; die Sockets werden von der Loop beim nächsten Durchlauf
+                 übernommen. Ein Handle kann nur von einer Sitzung gleichzeitig bedient werden.
+        @param pipe_cmd Pipe mit Befehlen vom UI-Prozess (muss fileno() unterstützen).
+        @param pipe_evt Pipe zum Senden von Ereignissen an den UI-Prozess.
+        @param config Konfiguration der Sitzung.
+        @return Die neue _Session oder None, wenn das Handle schon bedient wird oder kein
+                Port frei ist.
+        """
+        if not isinstance(pipe_evt, _EventQueue):
+            # Events kommen aus mehreren Threads und dürfen die Loop nie blockieren
+            pipe_evt = _EventQueue(pipe_evt)
+        with self._lock:
+            if config.handle in self._handles:
+                pipe_evt.send(("error", f"Handle {config.handle} wird bereits bedient"))
+                return None
+            self._handles.add(config.handle)
+        bound = _bind_ports(config, pipe_evt)
+        if bound is None:
+            with self._lock:
+                self._handles.discard(config.handle)
+            return None
+        sess = _Session(pipe_cmd, pipe_evt, config, *bound, self._pipe_reg)
+        sess.receiver = _ImageReceiver(sess.image_dir, sess.udp_sock)
+        sess.dispatch = lambda cmd: self.dispatch(sess, cmd)
+        pipe_evt.on_overflow = lambda: self._drop(sess)
+        # Port dem UI-Prozess mitteilen
+        pipe_evt.send(("tcp_port", sess.port))
+        with self._lock:
+            self._new.append(sess)
+        self._wake_w.send(b"\0")
+        return sess
+
+    def serve_registry(self, pipe_reg) -> None:
+        """
+        @brief Bedient einen Registry-Kanal vom Discovery-Dienst, bis dieser endet (blockiert).
+        @details Kann nach einem Abbruch mit einer neuen Verbindung erneut aufgerufen werden;
+                 der Feed beginnt dann wieder mit einem vollständigen Snapshot.
+        """
+        self._pipe_reg.attach(pipe_reg)
+        try:
+            _registry_listener(pipe_reg, self.peers, self.pool, self.queues,
+                               lambda: list(self.sessions))
+        finally:
+            self._pipe_reg.detach(pipe_reg)
+
+    def dispatch(self, sess: _Session, cmd) -> None:
+        """
+        @brief Führt einen Befehl im Namen einer Sitzung aus.
+        """
+        if (isinstance(cmd, tuple) and cmd[:1] == ('leave',)
+                and any(s is not sess for s in self.sessions)):
+            # Der Pool gehört allen Sitzungen; nur die letzte schließt ihn
+            return
+        _handle_command(cmd, sess.pipe_evt, self.pool, self.queues, sess.outbox, self.acks,
+                        sess.batcher, self.peers, sess.lookups, sess.config)
+
+    def _drop(self, sess: _Session) -> None:
+        """
+        @brief Merkt eine Sitzung, deren UI keine Events mehr abnimmt, zum Beenden vor.
+        @details Thread-sicher; beendet wird die Sitzung von der Loop.
+        """
+        with self._lock:
+            self._dropped.append(sess)
+        self._wake_w.send(b"\0")
+
+    def _attach(self) -> None:
+        """
+        @brief Übernimmt mit add() eröffnete Sitzungen in den Selector.
+        """
+        with self._lock:
+            new, self._new = self._new, []
+        for sess in new:
+            sess.tcp_srv.setblocking(False)
+            sess.udp_sock.setblocking(False)
+            if self._accepting:
+                self._sel.register(sess.tcp_srv, selectors.EVENT_READ, ("accept", sess))
+            self._sel.register(sess.udp_sock, selectors.EVENT_READ, ("udp", sess))
+            self._sel.register(sess.pipe_cmd, selectors.EVENT_READ, ("cmd", sess))
+            self.sessions.append(sess)
+
+    def _remove(self, sess: _Session) -> None:
+        """
+        @brief Beendet eine Sitzung, deren UI die Verbindung geschlossen hat oder keine
+               Events mehr abnimmt, und gibt ihre Sockets, Pipes und die Outbox-Datei frei.
+        """
+        sess.closed = True
+        self.sessions.remove(sess)
+        for sock in (sess.pipe_cmd, sess.udp_sock) + ((sess.tcp_srv,) if self._accepting else ()):
+            self._sel.unregister(sock)
+        for conn in [c for c, e in self._conns.items() if e[4] is sess]:
+            self._close_conn(conn)
+        sess.tcp_srv.close()
+        sess.udp_sock.close()
+        sess.pipe_evt.close()
+        try:
+            sess.pipe_cmd.close()
+        except OSError:
+            pass
+        sess.outbox.close()
+        with self._lock:
+            self._handles.discard(sess.handle)
+
+    def _close_conn(self, conn) -> None:
+        self._sel.unregister(conn)
+        stream = self._conns.pop(conn)[2]
+        if stream is not None:
+            stream.discard()
+        conn.close()
+
+    def _send_acks(self, conn, entry: list, data: bytes = b"") -> None:
+        """
+        @brief Sendet ACK-Frames, ohne die Loop zu blockieren.
+        @details Was der Sendepuffer nicht sofort aufnimmt, bleibt in entry[5]; der Socket
+                 wird dann zusätzlich auf EVENT_WRITE angemeldet, bis der Rest draußen ist.
+        """
+        out = entry[5]
+        out += data
+        try:
+            del out[:conn.send(out)]
+        except BlockingIOError:
+            pass
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if out else 0)
+        if self._sel.get_key(conn).events != events:
+            self._sel.modify(conn, events, ("conn", entry[4]))
+
+    def _set_accepting(self, on: bool) -> None:
+        """
+        @brief Meldet die Server-Sockets aller Sitzungen beim Selector an bzw. ab.
+        """
+        for sess in self.sessions:
+            if on:
+                self._sel.register(sess.tcp_srv, selectors.EVENT_READ, ("accept", sess))
+            else:
+                self._sel.unregister(sess.tcp_srv)
+        self._accepting = on
+
+    def run(self, until_empty: bool = False) -> None:
+        """
+        @brief Event-Loop; läuft für immer bzw. mit until_empty, bis die letzte Sitzung endet.
+        """
+        max_conns = self.config.max_connections
+        conns = self._conns
+        last_retry = time.monotonic()
+        self._attach()
+
+        while True:
+            busy = any(s.receiver.active() for s in self.sessions)
+            for key, mask in self._sel.select(timeout=_IMG_NACK_DELAY / 2 if busy else 1.0):
+                tag, sess = key.data
+                if sess is not None and sess.closed:
+                    # In diesem Durchlauf bereits beendet
+                    continue
+                if tag == "wake":
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    self._attach()
+                    with self._lock:
+                        dropped, self._dropped = self._dropped, []
+                    for s in dropped:
+                        if not s.closed and s in self.sessions:
+                            print(f"[Network] {s.handle}: UI liest keine Events mehr, Sitzung beendet")
+                            self._remove(s)
+                    if until_empty and not self.sessions:
+                        return
+
+                elif tag == "accept":
+                    while len(conns) < max_conns:
+                        try:
+                            conn, _ = sess.tcp_srv.accept()
+                        except BlockingIOError:
+                            break
+                        except OSError as e:
+                            # z. B. ECONNABORTED oder EMFILE: melden, kurz pausieren, weiterlaufen
+                            sess.pipe_evt.send(("error", f"net accept: {e}"))
+                            self._accept_pause = time.monotonic() + 1.0
+                            break
+                        conn.setblocking(False)
+                        conns[conn] = [_FrameReader(conn), time.monotonic(), None, {}, sess,
+                                       bytearray()]
+                        self._sel.register(conn, selectors.EVENT_READ, ("conn", sess))
+                    if ((len(conns) >= max_conns or time.monotonic() < self._accept_pause)
+                            and self._accepting):
+                        self._set_accepting(False)
+
+                elif tag == "udp":
+                    while True:
+                        try:
+                            data, addr = sess.udp_sock.recvfrom(65535)
+                        except BlockingIOError:
+                            break
+                        try:
+                            done = sess.receiver.feed(data, addr)
+                            if done:
+                                sess.pipe_evt.send(("img", *done))
+                        except Exception as e:
+                            sess.pipe_evt.send(("error", f"net udp: {e}"))
+
+                elif tag == "cmd":
+                    try:
+                        while sess.pipe_cmd.poll():
+                            self.dispatch(sess, sess.pipe_cmd.recv())
+                    except (EOFError, OSError):
+                        # UI hat die Verbindung geschlossen → Sitzung beenden
+                        self._remove(sess)
+                        if until_empty and not self.sessions:
+                            return
+
+                else:
+                    conn = key.fileobj
+                    entry = conns.get(conn)
+                    if entry is None:
+                        continue
+                    reader = entry[0]
+                    try:
+                        if mask & selectors.EVENT_WRITE:
+                            self._send_acks(conn, entry)
+                        if not mask & selectors.EVENT_READ:
+                            continue
+                        if not reader.fill():
+                            self._close_conn(conn)
+                            continue
+                        entry[1] = time.monotonic()
+                        acks = _drain_frames(reader, entry, sess.pipe_evt, sess.image_dir)
+                        if acks:
+                            self._send_acks(conn, entry, acks)
+                    except BlockingIOError:
+                        pass
+                    except ConnectionResetError:
+                        self._close_conn(conn)
+                    except Exception as e:
+                        sess.pipe_evt.send(("error", f"net handle_tcp: {e}"))
+                        self._close_conn(conn)
+
+            # NACKs senden, abgebrochene Bildübertragungen verwerfen
+            for sess in self.sessions:
+                _service_receiver(sess.receiver, sess.pipe_evt)
+
+            # Ungenutzte eingehende Verbindungen schließen
+            deadline = time.monotonic() - _RECV_IDLE_TIMEOUT
+            for conn in [c for c, e in conns.items() if e[1] < deadline]:
+                self._close_conn(conn)
+
+            # Fällige Wiederholungsversuche der Outboxen anstoßen
+            if time.monotonic() - last_retry >= 1.0:
+                last_retry = time.monotonic()
+                for sess in self.sessions:
+                    for to in sess.outbox.due():
+                        _flush_outbox(to, sess.outbox, self.pool, self.queues, sess.pipe_evt)
+
+            if (not self._accepting and len(conns) < max_conns
+                    and time.monotonic() >= self._accept_pause):
+                self._set_accepting(True)
+
+def run_network_service(pipe_cmd, pipe_evt, config, pipe_reg=None):
+    """
+    @brief Startet den Netzwerkdienst (TCP/UDP) und verarbeitet eingehende sowie ausgehende SLCP-Nachrichten.
+    @param pipe_cmd Pipe zum Empfangen von Befehlen vom UI-Prozess.
+    @param pipe_evt Pipe zum Senden von Ereignissen an den UI-Prozess.
+    @param pipe_reg Optionaler direkter Kanal vom Discovery-Dienst (RegistryFeed); damit
+           adressiert die UI Empfänger nur noch per Handle. Unbekannte Empfänger werden
+           darüber per WHOIS nachgeschlagen.
+    @details Mit der Engine "selectors" läuft der Dienst als SessionHub mit genau einer
+             Sitzung; network_main.py nutzt denselben Hub für mehrere Handles.
+    @param config Konfigurationsobjekt mit Attributen:
+           - port_range: Tupel (min_port, max_port) zur Portauswahl,
+           - handle: Benutzerkennung (Sender),
+           - imagepath: Zielverzeichnis für empfangene Bilder,
+           - engine: "threads" (Thread pro Verbindung) oder "selectors" (Event-Loop),
+           - max_connections: Obergrenze gleichzeitiger eingehender Verbindungen,
+           - img_reliable: Bilder mit ACK/NACK und selektiver Wiederholung senden,
+           - img_bandwidth: maximale Senderate für Bilder in Mbit/s (0 = unbegrenzt),
+           - udp_rcvbuf: SO_RCVBUF des UDP-Empfangssockets in Bytes (0 = Systemstandard),
+           - img_tcp_threshold: ab dieser Größe in Bytes Bilder per TCP senden (0 = nie),
+           - peer_queue_depth: maximale Anzahl wartender Sendeaufträge pro Peer,
+           - msg_ack: Zustellbestätigungen für send_msg anfordern (nur mit Empfängern,
+             die `ID <n>` kennen; Standard aus),
+           - msg_coalesce_ms: Sammelfenster für Nachrichten-Bursts in ms (0 = aus).
+    """
+    # Events kommen ab jetzt aus mehreren Threads (Listener, Sende-Worker)
+    pipe_evt = _EventQueue(pipe_evt)
+
+    if config.engine == "selectors":
+        hub = SessionHub(config, pipe_reg)
+        if hub.add(pipe_cmd, pipe_evt, config) is not None:
+            hub.run(until_empty=True)
+        # Letzte Meldungen (z. B. Bind-Fehler) noch zustellen
+        pipe_evt.flush()
+        return
+
+    bound = _bind_ports(config, pipe_evt)
+    if bound is None:
+        pipe_evt.flush()
+        return
+    pipe_reg_send = _RegistryChannel(pipe_reg) if pipe_reg is not None else None
+    sess = _Session(pipe_cmd, pipe_evt, config, *bound, pipe_reg_send)
 
     # Port dem UI-Prozess mitteilen
-    pipe_evt.send(("tcp_port", bound_port))
+    pipe_evt.send(("tcp_port", sess.port))
+
+    # Persistente Verbindungen zu Peers für send_msg
+    pool = _ConnectionPool()
+    threading.Thread(target=pool.reap_loop, daemon=True).start()
+    # ACKs auf den gepoolten Verbindungen lesen, ohne die Sender warten zu lassen
+    acks = _AckTracker(pipe_evt)
+    pool.on_close = acks.release
+    threading.Thread(target=acks.run, daemon=True).start()
+    # Ausgehende Aufträge pro Peer, damit ein langsamer Peer die anderen nicht aufhält
+    queues = _PeerQueues(config.peer_queue_depth)
+    threading.Thread(
+        target=_outbox_loop,
+        args=(sess.outbox, pool, queues, pipe_evt),
+        daemon=True
+    ).start()
+
+    # Adresstabelle Handle → (ip, port), direkt vom Discovery-Dienst oder per "peers"-Befehl
+    peers: dict[str, tuple[str, int]] = {}
+
+    def dispatch(cmd):
+        _handle_command(cmd, pipe_evt, pool, queues, sess.outbox, acks, sess.batcher, peers,
+                        sess.lookups, config)
+
+    sess.dispatch = dispatch
+    if pipe_reg is not None:
+        threading.Thread(
+            target=_registry_listener,
+            args=(pipe_reg, peers, pool, queues, lambda: [sess]),
+            daemon=True
+        ).start()
 
     # Listener-Threads starten
     threading.Thread(
         target=_tcp_listener,
-        args=(tcp_srv, pipe_evt),
+        args=(sess.tcp_srv, pipe_evt, sess.image_dir, config.max_connections),
         daemon=True
     ).start()
     threading.Thread(
         target=_udp_listener,
-        args=(udp_sock, pipe_evt, image_dir),
+        args=(sess.udp_sock, pipe_evt, sess.image_dir),
         daemon=True
     ).start()
 
     # Verarbeitung ausgehender Nachrichten
     while True:
-        cmd = pipe_cmd.recv()
-        if not isinstance(cmd, tuple):
-            continue
-        action = cmd[0]
-        try:
-            if action == 'send_msg':
-                """
-                @brief Sendet eine SLCP-MSG-Nachricht über TCP.
-                @param frm Absenderkennung.
-                @param to Empfängerkennung (nicht verwendet).
-                @param text Nachrichtentext.
-                @param ip Ziel-IP-Adresse.
-                @param port Ziel-TCP-Port.
-                """
-                _, frm, to, text, ip, port = cmd
-                if len(text) > 512:
-                    pipe_evt.send((
-                        "error",
-                        f"[SLCP] Nachricht zu lang ({len(text)} Zeichen, max. 512)"
-                    ))
-                    continue
-
-                addr_info = socket.getaddrinfo(
-                    ip, port,
-                    family=socket.AF_UNSPEC,
-                    type=socket.SOCK_STREAM
-                )
-                sent = False
-                for af, socktype, proto, _, sockaddr in addr_info:
-                    try:
-                        with socket.socket(af, socktype, proto) as s:
-                            s.settimeout(5)
-                            s.connect(sockaddr)
-                            s.sendall(f"MSG {frm} {text}\n".encode())
-                        sent = True
-                        break
-                    except Exception:
-                        continue
-
-                if not sent:
-                    pipe_evt.send((
-                        "error",
-                        f"[SLCP] Nachricht konnte nicht gesendet werden an {ip}:{port}"
-                    ))
-
-            elif action == 'send_img':
-                """
-                @brief Sendet eine SLCP-IMG-Nachricht über UDP.
-                @param frm Absenderkennung.
-                @param to Empfängerkennung (nicht verwendet).
-                @param path Pfad zur Bilddatei.
-                @param ip Ziel-IP-Adresse.
-                @param port Ziel-UDP-Port.
-                """
-                _, frm, to, path, ip, port = cmd
-                img_data = Path(path).read_bytes()
-                hdr = f"IMG {frm} {len(img_data)}\n".encode()
-                udp_sock.sendto(hdr + img_data[:_CHUNK_SIZE], (ip, port))
-                offset = _CHUNK_SIZE
-                while offset < len(img_data):
-                    udp_sock.sendto(img_data[offset:offset+_CHUNK_SIZE], (ip, port))
-                    offset += _CHUNK_SIZE
-
-        except Exception as e:
-            pipe_evt.send(("error", f"net send '{action}': {e}"))
\ No newline at end of file
+        dispatch(pipe_cmd.recv())
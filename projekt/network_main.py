@@ -2,45 +2,142 @@
 # @file network_main.py
 # @brief Startskript für den Network-Service-Prozess.
 # @details Dieses Modul wird als separates Skript aufgerufen, um den Netzwerkdienst des
-# Chatprogramms zu starten. Es stellt eine IPC-Verbindung zur Benutzeroberfläche her
-# und übergibt dann die Kontrolle an den eigentlichen Netzwerkdienst.
+# Chatprogramms zu starten. Es nimmt IPC-Verbindungen von Benutzeroberflächen an
+# und übergibt sie an den eigentlichen Netzwerkdienst.
+#
+# Ein Prozess bedient beliebig viele UIs (Handles) gleichzeitig: jede UI meldet sich mit
+# ("hello", <config.toml>) an und erhält eine eigene Sitzung mit eigenem Empfangsport.
+# Event-Loop, Verbindungspool und Sende-Warteschlangen teilen sich alle Sitzungen.
+# UIs ohne Anmeldung erhalten die beim Start angegebene Konfiguration.
+#
+# Der Dienst meldet sich zusätzlich beim Discovery-Service an und erhält von dort die
+# Registry direkt, sodass die UI Empfänger nur per Handle adressiert. Ist der
+# Discovery-Service nicht erreichbar oder bricht die Verbindung ab, wird neu verbunden.
 #
 # Wird typischerweise aufgerufen durch:
 # @code
-# python3 network_main.py <config.toml> [ipc_port]
+# python3 network_main.py <config.toml> [ipc_port] [disc_port]
 # @endcode
 #
 # @author Gruppe A11
 # @date 2025
 
 import sys
+import threading
+import time
 from config import Config
-from network import run_network_service
-from multiprocessing.connection import Listener
+from network import SessionHub
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+# Sekunden, die auf die Anmeldung ("hello", config) einer neuen UI gewartet wird
+HELLO_TIMEOUT = 2.0
+# Sekunden zwischen zwei Verbindungsversuchen zum Discovery-Service
+REGISTRY_RETRY = 2.0
+
+
+def keep_registry(hub, disc_port):
+    """
+    @brief Hintergrund-Thread: hält den Registry-Kanal zum Discovery-Service aufrecht.
+    @details Ist der Discovery-Service (noch) nicht erreichbar oder bricht die Verbindung ab,
+             wird alle REGISTRY_RETRY Sekunden neu verbunden. Solange kein Kanal besteht,
+             scheitern Sendungen an unbekannte Empfänger sofort.
+    @param hub Gemeinsamer SessionHub.
+    @param disc_port IPC-Port des Discovery-Service.
+    """
+    reported = False
+    while True:
+        try:
+            reg_conn = Client(('localhost', disc_port), authkey=b'ipc_secret')
+        except (EOFError, AuthenticationError, OSError) as e:
+            if not reported:
+                print(f"[Network] Discovery auf Port {disc_port} nicht erreichbar ({e}), "
+                      f"neuer Versuch alle {REGISTRY_RETRY:g} s")
+                reported = True
+            time.sleep(REGISTRY_RETRY)
+            continue
+        print(f"[Network] Registry-Kanal zu Discovery auf Port {disc_port} verbunden")
+        reported = False
+        # Blockiert, bis der Discovery-Service die Verbindung schließt
+        hub.serve_registry(reg_conn)
+        reg_conn.close()
+        print("[Network] Registry-Kanal getrennt, verbinde neu …")
+        time.sleep(REGISTRY_RETRY)
+
+
+def attach(hub, conn, default_config):
+    """
+    @brief Eröffnet für eine neu verbundene UI eine Sitzung im Hub.
+    @details Die erste Nachricht ("hello", pfad) wählt die Konfiguration der Sitzung;
+             bleibt sie aus, gilt default_config. Ein anderer erster Befehl wird nach
+             dem Eröffnen der Sitzung ganz normal ausgeführt.
+    @param hub Gemeinsamer SessionHub.
+    @param conn IPC-Verbindung zur UI (Befehle und Events).
+    @param default_config Beim Start angegebene Konfiguration.
+    """
+    config, first = default_config, None
+    try:
+        if conn.poll(HELLO_TIMEOUT):
+            msg = conn.recv()
+            if isinstance(msg, tuple) and msg[:1] == ("hello",):
+                try:
+                    config = Config(msg[1])
+                except Exception as e:
+                    # Fehlende, defekte oder ungültige Config: UI informieren statt hängen lassen
+                    conn.send(("error", f"Config {msg[1]} unbrauchbar: {e}"))
+                    conn.close()
+                    return
+            else:
+                first = msg
+    except (EOFError, OSError) as e:
+        print(f"[Network] UI-Anmeldung fehlgeschlagen: {e}")
+        conn.close()
+        return
+    sess = hub.add(conn, conn, config)
+    if sess is None:
+        print(f"[Network] Sitzung für {config.handle} abgelehnt")
+        conn.close()
+        return
+    print(f"[Network] Sitzung für {config.handle} gestartet")
+    if first is not None:
+        hub.dispatch(sess, first)
+
 
 if __name__ == "__main__":
     """
     @brief Startskript für den Network-Service-Prozess.
-    @details Wartet auf UI-Verbindung per IPC und ruft anschließend run_network_service auf.
-    @usage python3 network_main.py <configfile.toml> [ipc_port]
+    @details Verbindet sich mit dem Discovery-Service für Registry-Updates, startet die
+             gemeinsame Event-Loop und nimmt anschließend beliebig viele UI-Verbindungen an.
+    @usage python3 network_main.py <configfile.toml> [ipc_port] [disc_port]
     """
     # Überprüfe Kommandozeilen-Parameter: mindestens Pfad zur Config
     if len(sys.argv) < 2:
-        print("Usage: python3 network_main.py <configfile.toml> [ipc_port]")
+        print("Usage: python3 network_main.py <configfile.toml> [ipc_port] [disc_port]")
         sys.exit(1)
 
     # Lade Konfiguration (TOML-Datei enthält Handle, Port-Range, whoisport, autoreply, imagepath)
     config = Config(sys.argv[1])
     # Lese optionalen IPC-Port aus Parameter oder verwende Default 6001
     ipc_port = int(sys.argv[2]) if len(sys.argv) > 2 else 6001
+    # IPC-Port des Discovery-Service (Standard wie in main_ui.py)
+    disc_port = int(sys.argv[3]) if len(sys.argv) > 3 else 6000
     address = ('localhost', ipc_port)
 
+    hub = SessionHub(config)
+    threading.Thread(target=hub.run, daemon=True).start()
+    # Registry direkt vom Discovery-Service beziehen (gemeinsam für alle Sitzungen)
+    threading.Thread(target=keep_registry, args=(hub, disc_port), daemon=True).start()
+
     # Richte IPC-Listener zum Empfang von UI-Kommandos ein
     with Listener(address, authkey=b'ipc_secret') as listener:
         # Informiere über Start des IPC-Servers
         print(f"[Network] IPC-Listener läuft auf {address}")
-        # Warte auf eintreffende UI-Verbindung
-        conn = listener.accept()
-        print("[Network] UI verbunden, starte Service …")
-        # Führe den Network-Service aus: kommuniziert mit UI über dieselbe Pipe (conn)
-        run_network_service(conn, conn, config)
\ No newline at end of file
+        while True:
+            # Jede UI-Verbindung wird zu einer eigenen Sitzung im gemeinsamen Hub
+            try:
+                conn = listener.accept()
+            except (EOFError, AuthenticationError, OSError) as e:
+                # Abgebrochener Handshake oder falscher Schlüssel: nur diesen Client verwerfen
+                print(f"[Network] Verbindungsaufbau fehlgeschlagen: {e!r}")
+                continue
+            threading.Thread(target=attach, args=(hub, conn, config), daemon=True).start()
@@ -0,0 +1,254 @@
+##
+# @file outbox.py
+# @brief Persistenter Postausgang (Store-and-Forward) für nicht zustellbare SLCP-Nachrichten.
+# @details Nachrichten, die der Netzwerkdienst nicht zustellen konnte, werden hier in einer
+# Append-only-Datei (JSON Lines) unter dem Konfigurationsverzeichnis abgelegt und überleben
+# so auch einen Neustart. Jede Zeile ist entweder ein neuer Eintrag (`add`) oder die
+# Bestätigung einer Zustellung (`done`). Beim Laden wird das Log nachgespielt; übersteigt der
+# Anteil erledigter Einträge einen Schwellwert, wird die Datei kompaktiert.
+#
+# Pro Empfänger-Handle gibt es einen Backoff-Zustand (nur im Speicher): nach jedem
+# Fehlversuch verdoppelt sich die Wartezeit bis zum nächsten Versuch, bis zu einer Obergrenze.
+# Taucht der Empfänger neu in der Discovery-Registry auf, wird der Backoff zurückgesetzt.
+#
+# @author Gruppe A11
+# @date 2025
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# Erste Wartezeit nach einem Fehlversuch (Sekunden), verdoppelt sich bis _MAX_DELAY
+_BASE_DELAY = 2.0
+_MAX_DELAY = 300.0
+# Nachrichten, die älter sind, werden verworfen
+_MAX_AGE = 7 * 24 * 3600
+# Kompaktieren, sobald so viele Zeilen erledigt sind und diese die Mehrheit bilden
+_COMPACT_MIN_DONE = 256
+
+
+class Outbox:
+    """
+    @brief Append-only-Postausgang mit Wiederholungsplanung pro Empfänger.
+    @details Alle Methoden sind thread-sicher; sie werden aus den Sende-Workern und dem
+             Retry-Thread des Netzwerkdienstes aufgerufen.
+    """
+
+    def __init__(self, path: Path):
+        """
+        @brief Öffnet bzw. erzeugt das Outbox-Log und lädt offene Einträge.
+        @param path Pfad zur Log-Datei (Verzeichnis wird bei Bedarf angelegt).
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries: dict[int, dict] = {}     # id → Eintrag, in Einfügereihenfolge
+        self._addr: dict[str, tuple[str, int]] = {}
+        self._delay: dict[str, float] = {}
+        self._next_try: dict[str, float] = {}
+        self._present: dict[str, tuple[str, int]] = {}
+        self._next_id = 1
+        self._done_lines = 0
+        self._load()
+        self._file = self.path.open('a', encoding='utf-8')
+        now = time.monotonic()
+        for to in self.recipients():
+            self._next_try[to] = now
+
+    def _load(self) -> None:
+        """
+        @brief Spielt das Log nach; defekte Zeilen (z. B. abgebrochener Schreibvorgang) werden übersprungen.
+        """
+        if not self.path.exists():
+            return
+        with self.path.open('r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if rec.get('op') == 'add':
+                    self._entries[rec['id']] = rec
+                    self._addr[rec['to']] = (rec['ip'], rec['port'])
+                    self._next_id = max(self._next_id, rec['id'] + 1)
+                elif rec.get('op') == 'done':
+                    self._entries.pop(rec['id'], None)
+                    self._done_lines += 1
+        cutoff = time.time() - _MAX_AGE
+        for eid in [i for i, e in self._entries.items() if e['ts'] < cutoff]:
+            del self._entries[eid]
+        self._compact()
+
+    def _append(self, rec: dict) -> None:
+        """
+        @brief Hängt einen Datensatz an das Log an und schreibt ihn dauerhaft auf die Platte.
+        @details Nach close() wird die Datei nur für diesen Datensatz kurz geöffnet, damit
+                 verspätete Ergebnisse laufender Sendeaufträge nicht verloren gehen.
+        """
+        if self._file is None:
+            with self.path.open('a', encoding='utf-8') as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            return
+        self._file.write(json.dumps(rec, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _compact(self) -> None:
+        """
+        @brief Schreibt das Log neu, sodass es nur noch offene Einträge enthält (atomar per os.replace).
+        """
+        tmp = self.path.with_suffix(self.path.suffix + '.tmp')
+        with tmp.open('w', encoding='utf-8') as f:
+            for rec in self._entries.values():
+                f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._done_lines = 0
+
+    def add(self, frm: str, to: str, text: str, ip: str, port: int) -> int:
+        """
+        @brief Legt eine nicht zugestellte Nachricht ab.
+        @return Anzahl offener Nachrichten für diesen Empfänger.
+        """
+        with self._lock:
+            rec = {'op': 'add', 'id': self._next_id, 'frm': frm, 'to': to, 'text': text,
+                   'ip': ip, 'port': int(port), 'ts': time.time()}
+            self._next_id += 1
+            self._append(rec)
+            self._entries[rec['id']] = rec
+            self._addr[to] = (ip, int(port))
+            self._next_try.setdefault(to, time.monotonic() + _BASE_DELAY)
+            return sum(1 for e in self._entries.values() if e['to'] == to)
+
+    def has_pending(self, to: str) -> bool:
+        """
+        @brief True, wenn für den Empfänger noch Nachrichten offen sind.
+        """
+        with self._lock:
+            return to in self._next_try
+
+    def pending(self, to: str) -> list[dict]:
+        """
+        @brief Liefert alle offenen Einträge eines Empfängers in Einfügereihenfolge.
+        """
+        with self._lock:
+            return [e for e in self._entries.values() if e['to'] == to]
+
+    def address(self, to: str):
+        """
+        @brief Zuletzt bekannte Adresse (ip, port) eines Empfängers oder None.
+        """
+        with self._lock:
+            return self._present.get(to) or self._addr.get(to)
+
+    def recipients(self) -> set[str]:
+        """
+        @brief Alle Empfänger mit offenen Nachrichten.
+        """
+        return {e['to'] for e in self._entries.values()}
+
+    def mark_done(self, ids) -> int:
+        """
+        @brief Markiert Einträge als zugestellt und kompaktiert bei Bedarf.
+        @return Anzahl der noch offenen Nachrichten für die betroffenen Empfänger.
+        """
+        with self._lock:
+            recipients = set()
+            for eid in ids:
+                rec = self._entries.pop(eid, None)
+                if rec is None:
+                    continue
+                recipients.add(rec['to'])
+                self._append({'op': 'done', 'id': eid})
+                self._done_lines += 1
+            left = 0
+            for to in recipients:
+                n = sum(1 for e in self._entries.values() if e['to'] == to)
+                left += n
+                if not n:
+                    self._next_try.pop(to, None)
+                    self._delay.pop(to, None)
+            if (self._done_lines >= _COMPACT_MIN_DONE
+                    and self._done_lines > len(self._entries)):
+                reopen = self._file is not None
+                if reopen:
+                    self._file.close()
+                self._compact()
+                if reopen:
+                    self._file = self.path.open('a', encoding='utf-8')
+            return left
+
+    def close(self) -> None:
+        """
+        @brief Schließt die Log-Datei (Sitzung beendet); der Inhalt bleibt für den nächsten Start.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def failed(self, to: str) -> None:
+        """
+        @brief Plant nach einem Fehlversuch den nächsten Versuch mit verdoppelter Wartezeit.
+        """
+        with self._lock:
+            delay = min(_MAX_DELAY, self._delay.get(to, _BASE_DELAY / 2) * 2)
+            self._delay[to] = delay
+            self._next_try[to] = time.monotonic() + delay
+
+    def due(self) -> list[str]:
+        """
+        @brief Empfänger, deren nächster Versuch fällig ist.
+        @details Der Termin wird dabei um die aktuelle Wartezeit verschoben, damit ein
+                 laufender Versuch nicht sofort erneut geplant wird.
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = [to for to, t in self._next_try.items() if t <= now]
+            for to in due:
+                self._next_try[to] = now + self._delay.get(to, _BASE_DELAY)
+            return due
+
+    def on_registry(self, users: dict) -> list[str]:
+        """
+        @brief Gleicht mit der Discovery-Registry ab.
+        @param users Dict Handle → (ip, port).
+        @return Empfänger mit offenen Nachrichten, die neu beigetreten sind oder eine neue
+                Adresse haben; für sie wird der Backoff zurückgesetzt.
+        """
+        with self._lock:
+            joined = []
+            for h, (ip, port) in users.items():
+                addr = (ip, int(port))
+                if self._present.get(h) != addr and h in self._next_try:
+                    joined.append(h)
+                    self._delay.pop(h, None)
+                    self._next_try[h] = time.monotonic()
+            self._present = {h: (ip, int(port)) for h, (ip, port) in users.items()}
+            return joined
+
+    def on_delta(self, updated: dict, removed) -> list[str]:
+        """
+        @brief Wie on_registry, aber für ein Registry-Delta (Aufwand proportional zum Delta).
+        @param updated Neue oder umgezogene Handles, Handle → (ip, port).
+        @param removed Entfernte Handles.
+        @return Empfänger mit offenen Nachrichten unter den neuen oder umgezogenen Handles;
+                für sie wird der Backoff zurückgesetzt.
+        """
+        with self._lock:
+            for h in removed:
+                self._present.pop(h, None)
+            joined = []
+            for h, (ip, port) in updated.items():
+                addr = (ip, int(port))
+                if self._present.get(h) != addr and h in self._next_try:
+                    joined.append(h)
+                    self._delay.pop(h, None)
+                    self._next_try[h] = time.monotonic()
+                self._present[h] = addr
+            return joined
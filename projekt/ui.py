@@ -20,6 +20,7 @@ from itertools import cycle
 from colorama import Fore, Style, init
 
 from config import Config
+from discovery import apply_delta
 
 # ANSI-Farbcode-Ausgabe initialisieren
 init(autoreset=True)
@@ -75,26 +76,46 @@ def run_ui(pipe_net_cmd, pipe_net_evt, pipe_disc_cmd, pipe_disc_evt, config):
     pipe_disc_cmd.send(("who",))
 
     known_peers = {}      # aktuell bekannte Teilnehmer
-    last_printed = {}     # zuletzt gezeigte Teilnehmerliste
+    registry_gen = 0      # Generation der Discovery-Registry, auf der known_peers beruht
+    resyncing = False     # Snapshot angefordert, Deltas bis dahin ignorieren
     stop_event = threading.Event()
 
     # --- Discovery-Listener ---
     def disc_listener():
         """
         @brief Hört auf Discovery-Ereignisse und aktualisiert die bekannte Teilnehmerliste.
-        @details Gibt neue oder veränderte Teilnehmer farblich auf der Konsole aus.
+        @details Wendet Registry-Deltas an und gibt nur neue, geänderte oder entfernte
+                 Teilnehmer farblich auf der Konsole aus. Passt die Generation eines Deltas
+                 nicht, wird ein vollständiger Snapshot angefordert.
         """
-        nonlocal known_peers, last_printed
+        nonlocal known_peers, registry_gen, resyncing
         while not stop_event.is_set():
             evt = pipe_disc_evt.recv()
             if evt[0] == "users":
-                known_peers = evt[1]
-                if known_peers != last_printed:
-                    last_printed = dict(known_peers)
-                    print("\n[Discovery] Teilnehmer:")
-                    for h, (ip, pr) in known_peers.items():
-                        col = get_color(h)
-                        print(f"  {col}{h}{Style.RESET_ALL}: {ip}:{pr}")
+                # Snapshot (Resynchronisation)
+                known_peers = dict(evt[1])
+                registry_gen = evt[2] if len(evt) > 2 else registry_gen
+                resyncing = False
+                print("\n[Discovery] Teilnehmer:")
+                for h, (ip, pr) in known_peers.items():
+                    col = get_color(h)
+                    print(f"  {col}{h}{Style.RESET_ALL}: {ip}:{pr}")
+            elif evt[0] == "delta":
+                _, gen, added, removed, changed = evt
+                if resyncing:
+                    continue
+                if gen != registry_gen + 1:
+                    resyncing = True
+                    pipe_disc_cmd.send(("sync",))
+                    continue
+                apply_delta(known_peers, added, removed, changed)
+                registry_gen = gen
+                for h, (ip, pr) in {**added, **changed}.items():
+                    col = get_color(h)
+                    print(f"\n[Discovery] {col}{h}{Style.RESET_ALL}: {ip}:{pr}")
+                for h in removed:
+                    col = get_color(h)
+                    print(f"\n[Discovery] {col}{h}{Style.RESET_ALL} hat den Chat verlassen.")
             elif evt[0] == "error":
                 print(f"\n[Discovery Fehler] {evt[1]}")
 
@@ -109,6 +130,36 @@ def run_ui(pipe_net_cmd, pipe_net_evt, pipe_disc_cmd, pipe_disc_evt, config):
             if evt[0] == "error":
                 print(f"\n[Network Fehler] {evt[1]}\n")
 
+            elif evt[0] == "outbox":
+                # Store-and-Forward: Anzahl noch nicht zugestellter Nachrichten an einen Peer
+                _, to, left = evt
+                if left:
+                    print(f"\n[Network] {to} nicht erreichbar – {left} Nachricht(en) zwischengespeichert, "
+                          f"Zustellung wird wiederholt.\n")
+                else:
+                    print(f"\n[Network] Zwischengespeicherte Nachrichten an {to} zugestellt.\n")
+
+            elif evt[0] == "delivered":
+                # Zustellbestätigung (ACK) des Empfängers mit Round-Trip-Zeit
+                _, to, _, rtt = evt
+                print(f"\n[Network] Nachricht an {to} zugestellt ({rtt:.0f} ms).\n")
+
+            elif evt[0] == "undelivered":
+                _, to, text, reason = evt
+                print(f"\n[Network Fehler] Zustellung an {to} nicht bestätigt ({reason}): {text}\n")
+
+            elif evt[0] == "queue_full":
+                # Backpressure: Warteschlange für diesen Peer ist voll
+                _, to, _ = evt
+                print(f"\n[Network] Warteschlange für {to} voll – Nachricht verworfen, bitte später erneut senden.\n")
+
+            elif evt[0] == "send_many":
+                # Ergebnis eines ALLMSG: nur Fehlschläge melden
+                _, text, results = evt
+                failed = [h for h, err in results.items() if err]
+                if failed:
+                    print(f"\n[Network Fehler] ALLMSG nicht zugestellt an: {', '.join(failed)}\n")
+
             elif evt[0] == "img":
                 _, sender, path = evt
                 col = get_color(sender)
@@ -134,13 +185,8 @@ def run_ui(pipe_net_cmd, pipe_net_evt, pipe_disc_cmd, pipe_disc_evt, config):
                         and text != config.autoreply
                         and sender != handle
                         and sender not in responded_peers):
-                    peer = known_peers.get(sender)
-                    if peer:
-                        ip, pr = peer
-                        pipe_net_cmd.send((
-                            "send_msg", handle, sender,
-                            config.autoreply, ip, pr
-                        ))
+                    if sender in known_peers:
+                        pipe_net_cmd.send(("send_msg", handle, sender, config.autoreply))
                         responded_peers.add(sender)
 
     threading.Thread(target=disc_listener, daemon=True).start()
@@ -162,9 +208,8 @@ def run_ui(pipe_net_cmd, pipe_net_evt, pipe_disc_cmd, pipe_disc_evt, config):
 
         try:
             if cmd == "ALLMSG":
-                for to, (ip, pr) in known_peers.items():
-                    if to != handle:
-                        pipe_net_cmd.send(("send_msg", handle, to, rest, ip, pr))
+                targets = [to for to in known_peers if to != handle]
+                pipe_net_cmd.send(("send_many", handle, rest, targets))
 
             elif cmd == "AUTOREPLY":
                 # Manuelles Ein-/Ausschalten der Autoreply-Funktion
@@ -192,14 +237,14 @@ def run_ui(pipe_net_cmd, pipe_net_evt, pipe_disc_cmd, pipe_disc_evt, config):
 
             elif cmd == "EXIT" or cmd == "QUIT":
                 pipe_disc_cmd.send(("leave", handle))
+                pipe_net_cmd.send(("leave",))
                 print("Chat beendet.")
                 stop_event.set()
                 sys.exit(0)
 
             elif cmd == "IMG":
                 to, path = rest.split(" ", 1)
-                ip, pr = known_peers[to]
-                pipe_net_cmd.send(("send_img", handle, to, path, ip, pr))
+                pipe_net_cmd.send(("send_img", handle, to, path))
 
             elif cmd == "JOIN":
                 pipe_disc_cmd.send(("join", handle, tcp_port))
@@ -208,12 +253,12 @@ def run_ui(pipe_net_cmd, pipe_net_evt, pipe_disc_cmd, pipe_disc_evt, config):
 
             elif cmd == "LEAVE":
                 pipe_disc_cmd.send(("leave", handle))
+                pipe_net_cmd.send(("leave",))
                 print("Chat verlassen.")
 
             elif cmd == "MSG":
                 to, text = rest.split(" ", 1)
-                ip, pr = known_peers[to]
-                pipe_net_cmd.send(("send_msg", handle, to, text, ip, pr))
+                pipe_net_cmd.send(("send_msg", handle, to, text))
 
             elif cmd == "WHO":
                 pipe_disc_cmd.send(("who",))